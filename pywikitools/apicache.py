@@ -0,0 +1,177 @@
+"""
+Persistent on-disk cache for mediawiki API responses (optional layer below ForTrainingLib._get())
+
+Responses are stored in a SQLite database, keyed by the normalized request parameters.
+- Every kind of request has its own time-to-live (TTL). Requests with a TTL of 0 are never cached.
+- The cache has a maximum size: if it grows larger, the least recently used entries are evicted
+- Responses for requests that refer to specific pages (parameters "titles" or "page") are only valid
+  as long as these pages didn't change: Together with the response we store the state (lastrevid and touched)
+  of these pages. Before using a cached response, ForTrainingLib checks the current state of the pages with
+  a cheap prop=info query. So unchanged pages never need to be transferred again.
+
+Configuration (optional) in config.ini:
+[apicache]
+file = /path/to/apicache.sqlite
+"""
+from configparser import ConfigParser
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Final, List, Optional, Tuple
+
+
+class ApiCache:
+    """
+    Cache for mediawiki API responses, stored in a SQLite file
+
+    Thread-safe: can be used by several threads in parallel
+    """
+    # Time-to-live (in seconds) for the different kinds of API requests (see get_kind())
+    # Responses that depend on pages are validated additionally, so they can be cached for a long time
+    DEFAULT_TTL: Final[Dict[str, int]] = {
+        "revisions": 30 * 24 * 3600,    # page sources (validated by page state)
+        "parse": 7 * 24 * 3600,         # HTML of pages (validated by page state) and language names
+        "templates": 7 * 24 * 3600,     # list of transcluded templates (validated by page state)
+        "imageinfo": 7 * 24 * 3600,     # file URLs (validated by page state)
+        "expandtemplates": 3600,        # e.g. translated CC0 notice
+        "languageinfo": 30 * 24 * 3600,  # names of all languages: refresh them once a month
+        # Everything else (e.g. translation progress, translation units, job queue, page info) isn't cached
+    }
+    PROBE_INTERVAL: Final[int] = 60     # Re-use the result of a page state probe for 60 seconds
+
+    def __init__(self, path: str, max_size: int = 200 * 1024 * 1024, ttl: Optional[Dict[str, int]] = None):
+        """
+        @param path: SQLite file to store the cache in (will be created if necessary)
+        @param max_size: maximum size of all cached responses in bytes (default: 200 MB)
+        @param ttl: change the time-to-live for some kinds of requests (see DEFAULT_TTL)
+        """
+        self.logger = logging.getLogger('pywikitools.apicache')
+        self._max_size: Final[int] = max_size
+        self._ttl: Dict[str, int] = dict(self.DEFAULT_TTL)
+        if ttl is not None:
+            self._ttl.update(ttl)
+        self._lock = threading.Lock()
+        # Results of the last page state probes: title -> (time of the probe, state)
+        self._page_states: Dict[str, Tuple[float, str]] = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, "
+                                     "page_states TEXT, size INTEGER, created REAL, accessed REAL)")
+
+    @classmethod
+    def from_config(cls, config: ConfigParser) -> Optional["ApiCache"]:
+        """Create the cache as configured in section [apicache] of config.ini (None if it isn't configured)"""
+        if not config.has_option("apicache", "file"):
+            return None
+        ttl: Dict[str, int] = {}
+        for option, value in config.items("apicache"):
+            if option.startswith("ttl_"):
+                ttl[option[4:]] = int(value)
+        max_size = config.getint("apicache", "max_size", fallback=200) * 1024 * 1024
+        return cls(config.get("apicache", "file"), max_size, ttl)
+
+    @staticmethod
+    def get_kind(params: Dict[str, str]) -> str:
+        """
+        What kind of request is this? For queries this is the query module, otherwise the action:
+        {"action": "query", "prop": "revisions", ...} -> "revisions"
+        {"action": "parse", ...} -> "parse"
+        """
+        if params.get("action") == "query":
+            for module in ["prop", "list", "meta"]:
+                if module in params:
+                    return params[module]
+        return params.get("action", "")
+
+    @staticmethod
+    def get_titles(params: Dict[str, str]) -> List[str]:
+        """Which pages does the response of this request depend on? (empty list if not page-specific)"""
+        if "rvstartid" in params:   # A specific older revision of a page will never change
+            return []
+        if "titles" in params:
+            return params["titles"].split("|")
+        if "page" in params:
+            return [params["page"]]
+        return []
+
+    @staticmethod
+    def make_key(params: Dict[str, str]) -> str:
+        """Normalize request parameters so that the same request always results in the same key"""
+        return json.dumps(sorted((str(key), str(value)) for key, value in params.items()))
+
+    def is_cacheable(self, params: Dict[str, str]) -> bool:
+        return self._ttl.get(self.get_kind(params), 0) > 0
+
+    def get(self, params: Dict[str, str]) -> Optional[Tuple[Any, Dict[str, str]]]:
+        """
+        Look up a cached response
+        @return Tuple of the response and the state of the pages it depends on; None if not cached or expired
+        """
+        if not self.is_cacheable(params):
+            return None
+        now = time.time()
+        key = self.make_key(params)
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT response, page_states, created FROM responses WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is None:
+                return None
+            if row[2] + self._ttl[self.get_kind(params)] < now:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, params: Dict[str, str], response: Any, page_states: Dict[str, str]) -> None:
+        """
+        Store a response in the cache (and evict least recently used entries if necessary)
+        @param page_states: state of the pages the response depends on (see ForTrainingLib._get_page_states())
+        """
+        if not self.is_cacheable(params):
+            return
+        now = time.time()
+        encoded = json.dumps(response)
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                     (self.make_key(params), encoded, json.dumps(page_states),
+                                      len(encoded), now, now))
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until we're below our maximum size. Caller must hold the lock"""
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self._max_size:
+            return
+        evict: List[str] = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if total_size <= self._max_size:
+                break
+            evict.append(key)
+            total_size -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in evict])
+        self.logger.debug(f"Evicted {len(evict)} responses from the cache")
+
+    def get_page_states(self, titles: List[str]) -> Dict[str, str]:
+        """Return the recently probed page states for those of the given titles that we know about"""
+        now = time.time()
+        with self._lock:
+            return {title: self._page_states[title][1] for title in titles
+                    if title in self._page_states and self._page_states[title][0] + self.PROBE_INTERVAL >= now}
+
+    def set_page_states(self, page_states: Dict[str, str]) -> None:
+        """Remember the result of a page state probe"""
+        now = time.time()
+        with self._lock:
+            for title, state in page_states.items():
+                self._page_states[title] = (now, state)
+
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+            self._page_states.clear()
+
+    def close(self) -> None:
+        self._connection.close()
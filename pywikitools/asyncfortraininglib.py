@@ -0,0 +1,344 @@
+"""
+Asynchronous twin of ForTrainingLib, built on aiohttp
+
+Offers the same API methods as ForTrainingLib, but as coroutines. So callers can issue many API requests
+concurrently over a pool of keep-alive connections. A semaphore limits how many requests are sent at the same time.
+The logic of all methods is shared with ForTrainingLib (see the @api_call decorator in fortraininglib.py)
+
+aiohttp is an optional dependency (pip install pywikitools[async]): it is only imported when
+an AsyncForTrainingLib gets created.
+
+Example:
+    async with AsyncForTrainingLib("https://www.4training.net") as lib:
+        titles = await asyncio.gather(*[lib.get_translated_title(page, "de") for page in lib.get_worksheet_list()])
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Final, List, Optional
+
+from pywikitools.apicache import ApiCache
+from pywikitools.fortraininglib import ApiSteps, ForTrainingLib, T
+from pywikitools.instrumentation import Metrics
+from pywikitools.lang.translated_page import TranslatedPage, TranslationUnit
+from pywikitools.resourcesbot.data_structures import TranslationProgress
+from pywikitools.retrypolicy import RequestCounters, RetryPolicy
+from pywikitools.worksheet_source import WorksheetSource
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+def _import_aiohttp() -> ModuleType:
+    """Import the optional aiohttp dependency"""
+    try:
+        import aiohttp
+    except ImportError as err:
+        raise ImportError("AsyncForTrainingLib needs aiohttp. Install it with pip install pywikitools[async]") from err
+    return aiohttp
+
+
+class AsyncForTrainingLib():
+    """
+    Same methods as ForTrainingLib but as coroutines (methods that don't query the API stay normal methods)
+
+    Failed requests are retried as in ForTrainingLib (see retrypolicy.py).
+    mark_for_translation() isn't available here (it's no API call).
+    """
+    TIMEOUT: Final[int] = ForTrainingLib.TIMEOUT
+    MAX_CONCURRENCY: Final[int] = 10    # Default for how many requests may be sent at the same time
+
+    def __init__(self, base_url: str, script_path: str = "/mediawiki", cache: Optional[ApiCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None, max_concurrency: int = MAX_CONCURRENCY):
+        """
+        @param base_url: Domain of the mediawiki system we want to query (example: "https://www.example.com")
+        @param cache: Optional persistent cache for API responses
+        @param retry_policy: How to retry failed requests and how fast to send requests (default: RetryPolicy())
+        @param max_concurrency: maximum number of requests that are sent at the same time
+        """
+        self._aiohttp: Final[ModuleType] = _import_aiohttp()
+        # Our synchronous twin: we use its methods for preparing requests and evaluating responses
+        self._lib: Final[ForTrainingLib] = ForTrainingLib(base_url, script_path, cache, retry_policy)
+        self.api_url: Final[str] = self._lib.api_url
+        self.cache: Optional[ApiCache] = cache
+        self.retry_policy: RetryPolicy = self._lib.retry_policy
+        self.counters: RequestCounters = self._lib.counters
+        self.metrics: Metrics = self._lib.metrics
+        self.logger: logging.Logger = logging.getLogger('pywikitools.lib')
+        self._max_concurrency: Final[int] = max_concurrency
+        # Created on first use because they need to be created inside the event loop
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncForTrainingLib":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close all connections. Call this when you're done (or use "async with")"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._lib.session.close()
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None:
+            # Keep-alive connections: one for each request that may run at the same time
+            connector = self._aiohttp.TCPConnector(limit=self._max_concurrency)
+            self._session = self._aiohttp.ClientSession(connector=connector,
+                                                        timeout=self._aiohttp.ClientTimeout(total=self.TIMEOUT))
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._session
+
+    async def _run(self, steps: ApiSteps[T]) -> T:
+        """Send all API requests of a ForTrainingLib method decorated with @api_call and return its result"""
+        try:
+            params = next(steps)
+            while True:
+                params = steps.send(await self._get(params))
+        except StopIteration as stop:
+            return stop.value
+
+    async def _get(self, params: Dict[str, str]) -> Any:
+        """
+        Query the API, using our cache if possible (see ForTrainingLib._get())
+        The cache (sqlite) is accessed in a worker thread to not block the event loop
+        @return JSON (as from response.json()) or {} in case of an error
+        """
+        if self.cache is None or not self.cache.is_cacheable(params):
+            return await self._request(params)
+        titles: List[str] = ApiCache.get_titles(params)
+        page_states: Dict[str, str] = {}
+        if titles:
+            page_states = await self._run(ForTrainingLib._get_page_states.__wrapped__(self._lib, titles))
+        cached = await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.cache.get, params))
+        if cached is not None and cached[1] == page_states and len(page_states) == len(set(titles)):
+            self.logger.debug(f"Using cached response for API request with parameters {params}")
+            self.metrics.observe_request("apicache", ApiCache.get_kind(params), 0.0)
+            return cached[0]
+
+        response = await self._request(params)
+        if response and "error" not in response and len(page_states) == len(set(titles)):
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(self.cache.put, params, response, page_states))
+        return response
+
+    async def _request(self, params: Dict[str, str]) -> Any:
+        """
+        Send a request with aiohttp and handle timeouts and other issues (like ForTrainingLib._request())
+        @return JSON (as from response.json()) or {} in case of an error
+        """
+        session = self._get_session()
+        assert self._semaphore is not None
+        kind: str = ApiCache.get_kind(params)
+        if self.retry_policy.maxlag > 0:
+            params = {**params, "maxlag": str(self.retry_policy.maxlag)}
+        attempt = 0
+        while True:
+            attempt += 1
+            if self._lib.rate_limiter is not None:
+                await self._wait(self._lib.rate_limiter.reserve())
+            self.counters.increment("requests")
+            if attempt > 1:
+                self.counters.increment("retries")
+            retry_after: Optional[str] = None
+            start: float = 0.0
+            size: int = 0
+            success: bool = False
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()     # Don't count waiting for the semaphore
+                    async with session.get(self.api_url, params=params) as response:
+                        self.logger.debug(f"API Request with parameters {params}... {response.status}")
+                        retry_after = response.headers.get("Retry-After")
+                        if self.retry_policy.is_retryable_status(response.status):
+                            self.counters.increment("throttled")
+                            problem = f"Server responded with HTTP {response.status}"
+                        else:
+                            body: bytes = await response.read()
+                            size = len(body)
+                            result = json.loads(body)
+                            if not self.retry_policy.is_maxlag_error(result):
+                                success = True
+                                return result
+                            self.counters.increment("maxlag")
+                            problem = f"Server is lagged: {result['error'].get('info', '')}"
+            except asyncio.TimeoutError:
+                self.counters.increment("timeouts")
+                problem = "Request timed out"
+            except self._aiohttp.ClientConnectionError as err:
+                self.counters.increment("connection_errors")
+                problem = f"Connection error: {err}"
+            except json.JSONDecodeError as e:
+                self.logger.warning(f"Unexpected error: Received an invalid JSON: {e}")
+                self.counters.increment("failed")
+                return {}
+            finally:
+                if start > 0:
+                    self.metrics.observe_request("api", kind, time.perf_counter() - start, size, error=not success)
+
+            if attempt >= self.retry_policy.max_attempts:
+                self.logger.warning(f"{problem}. This was attempt #{attempt}.")
+                break
+            delay = self.retry_policy.get_delay(attempt, retry_after)
+            self.logger.warning(f"{problem}. This was attempt #{attempt}. Trying again in {delay:.1f}s...")
+            await self._wait(delay)
+
+        self.logger.warning(f"Tried {attempt} times to query {params}, all failed. Giving up.")
+        self.counters.increment("failed")
+        return {}
+
+    async def _wait(self, seconds: float) -> None:
+        """Sleep (because of backoff or rate limiting) and count how long we waited"""
+        if seconds > 0:
+            self.counters.increment("waited", seconds)
+            await asyncio.sleep(seconds)
+
+    def get_worksheet_list(self) -> List[str]:
+        return self._lib.get_worksheet_list()
+
+    def get_file_types(self) -> List[str]:
+        return self._lib.get_file_types()
+
+    def get_language_direction(self, language_code: str) -> str:
+        return self._lib.get_language_direction(language_code)
+
+    def title_to_message(self, title: str) -> str:
+        return self._lib.title_to_message(title)
+
+    async def get_language_names(self, translate_to: Optional[str] = None) -> Dict[str, str]:
+        return await self._run(ForTrainingLib.get_language_names.__wrapped__(self._lib, translate_to))
+
+    async def get_language_name(self, language_code: str, translate_to: Optional[str] = None) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_language_name.__wrapped__(self._lib, language_code, translate_to))
+
+    async def get_file_url(self, filename: str) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_file_url.__wrapped__(self._lib, filename))
+
+    async def get_file_infos(self, filenames: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Like ForTrainingLib.get_file_infos(), but requests the chunks of MAX_TITLES files concurrently
+        """
+        result: Dict[str, Optional[Dict[str, Any]]] = {filename: None for filename in filenames}
+        unique_filenames: List[str] = list(result)
+        chunks: List[List[str]] = [unique_filenames[start:start + ForTrainingLib.MAX_TITLES]
+                                   for start in range(0, len(unique_filenames), ForTrainingLib.MAX_TITLES)]
+        for chunk_result in await asyncio.gather(*[
+                self._run(ForTrainingLib.get_file_infos.__wrapped__(self._lib, chunk)) for chunk in chunks]):
+            result.update(chunk_result)
+        return result
+
+    async def get_page_source(self, page: str, revision_id: Optional[int] = None) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_page_source.__wrapped__(self._lib, page, revision_id))
+
+    async def get_page_sources(self, titles: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Like ForTrainingLib.get_page_sources(), but requests the chunks of MAX_TITLES pages concurrently
+        """
+        result: Dict[str, Optional[str]] = {title: None for title in titles}
+        unique_titles: List[str] = list(result)
+        chunks: List[List[str]] = [unique_titles[start:start + ForTrainingLib.MAX_TITLES]
+                                   for start in range(0, len(unique_titles), ForTrainingLib.MAX_TITLES)]
+        for chunk_result in await asyncio.gather(*[
+                self._run(ForTrainingLib.get_page_sources.__wrapped__(self._lib, chunk)) for chunk in chunks]):
+            result.update(chunk_result)
+        return result
+
+    async def get_page_html(self, page: str) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_page_html.__wrapped__(self._lib, page))
+
+    async def get_translated_title(self, page: str, language_code: str,
+                                   revision_id: Optional[int] = None) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_translated_title.__wrapped__(
+            self._lib, page, language_code, revision_id))
+
+    async def get_translated_unit(self, page: str, language_code: str, identifier: int,
+                                  revision_id: Optional[int] = None) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_translated_unit.__wrapped__(
+            self._lib, page, language_code, identifier, revision_id))
+
+    def add_worksheet_source(self, page: str, content: str, revision_id: Optional[int] = None) -> WorksheetSource:
+        return self._lib.add_worksheet_source(page, content, revision_id)
+
+    async def get_worksheet_source(self, page: str, revision_id: Optional[int] = None) -> Optional[WorksheetSource]:
+        return await self._run(ForTrainingLib.get_worksheet_source.__wrapped__(self._lib, page, revision_id))
+
+    async def get_pdf_name(self, page: str, language_code: str) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_pdf_name.__wrapped__(self._lib, page, language_code))
+
+    async def get_version(self, page: str, language_code: str) -> Optional[str]:
+        return await self._run(ForTrainingLib.get_version.__wrapped__(self._lib, page, language_code))
+
+    async def list_page_translations(self, page: str, include_unfinished=False) -> Dict[str, TranslationProgress]:
+        return await self._run(ForTrainingLib.list_page_translations.__wrapped__(
+            self._lib, page, include_unfinished))
+
+    async def get_translation_progress(self, pages: List[str], language_code: Optional[str] = None) \
+            -> Dict[str, Dict[str, TranslationProgress]]:
+        """Like ForTrainingLib.get_translation_progress(), but querying all pages concurrently"""
+        if language_code is not None:
+            return await self._run(ForTrainingLib.get_translation_progress.__wrapped__(
+                self._lib, pages, language_code))
+        result: Dict[str, Dict[str, TranslationProgress]] = {}
+        for page_result in await asyncio.gather(*[
+                self._run(ForTrainingLib.get_translation_progress.__wrapped__(self._lib, [page])) for page in pages]):
+            result.update(page_result)
+        return result
+
+    async def list_page_templates(self, page: str) -> List[str]:
+        return await self._run(ForTrainingLib.list_page_templates.__wrapped__(self._lib, page))
+
+    async def list_templates(self, pages: List[str]) -> Dict[str, List[str]]:
+        return await self._run(ForTrainingLib.list_templates.__wrapped__(self._lib, pages))
+
+    async def get_latest_revisions(self, titles: List[str]) -> Dict[str, Optional[int]]:
+        return await self._run(ForTrainingLib.get_latest_revisions.__wrapped__(self._lib, titles))
+
+    async def get_translation_units(self, page: str, language_code: str,
+                                    limit: int = 500) -> Optional[TranslatedPage]:
+        return await self._run(ForTrainingLib.get_translation_units.__wrapped__(
+            self._lib, page, language_code, limit))
+
+    async def iter_translation_units(self, page: str, language_code: str,
+                                     limit: int = 500) -> AsyncIterator[TranslationUnit]:
+        """Like ForTrainingLib.iter_translation_units(): yields the translation units as soon as they arrive"""
+        self.logger.info(f"Retrieving translation of {page} into language {language_code}...")
+        arrived: List[TranslationUnit] = []
+        steps = self._lib._query_translation_units(page, language_code, limit, arrived.extend)
+        try:
+            params = next(steps)
+            while True:
+                params = steps.send(await self._get(params))
+                for unit in arrived:
+                    yield unit
+                arrived.clear()
+        except StopIteration:
+            for unit in arrived:
+                yield unit
+
+    async def get_translation_units_for_languages(self, page: str, language_codes: List[str],
+                                                  limit: int = 500) -> Dict[str, Optional[TranslatedPage]]:
+        """
+        Get the translation units of a page for several languages (all requested concurrently)
+        @return dictionary language code -> result of get_translation_units()
+        """
+        language_codes = list(dict.fromkeys(language_codes))
+        results = await asyncio.gather(*[self.get_translation_units(page, lang, limit) for lang in language_codes])
+        return dict(zip(language_codes, results))
+
+    async def get_recent_changes(self, since: str) -> Optional[List[Dict[str, Any]]]:
+        return await self._run(ForTrainingLib.get_recent_changes.__wrapped__(self._lib, since))
+
+    async def expand_template(self, raw_template: str) -> str:
+        return await self._run(ForTrainingLib.expand_template.__wrapped__(self._lib, raw_template))
+
+    async def get_cc0_notice(self, version: str, language_code: str) -> str:
+        return await self._run(ForTrainingLib.get_cc0_notice.__wrapped__(self._lib, version, language_code))
+
+    async def count_jobs(self) -> int:
+        return await self._run(ForTrainingLib.count_jobs.__wrapped__(self._lib))
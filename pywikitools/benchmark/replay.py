@@ -0,0 +1,519 @@
+"""
+Record / replay harness: run our tools against recorded mediawiki API responses instead of the real server
+
+A fixture directory contains everything that is needed to answer the requests of a run:
+    fixtures.json       {"base_url": "https://www.4training.net"}: the wiki the fixtures were recorded from
+    api/<hash>.json     one recorded API response: {"params": {...}, "response": {...}}
+                        (<hash> is the SHA1 of the normalized request parameters, see Fixtures.get_key())
+    files/<name>        files (PDFs, images...) with underscores instead of spaces in their names
+    pywikibot.json      what pywikibot sees: {"pages": {title: content},
+                                              "files": {name: {"timestamp": ..., "sha1": ..., "source": ...}}}
+                        (source: name of the file in files/ if it's not the same as name)
+
+ReplayServer is a local HTTP server serving these API responses and files (supporting Range and
+If-Modified-Since requests for files, the modification time of a file is when it was stored). Point ForTrainingLib to it
+and it answers all API requests from the fixtures. URLs of the recorded wiki in the responses are rewritten
+to point to the ReplayServer as well, so files are downloaded from it, too.
+If the server has an upstream (the real wiki with ApiProxy or a generated one, see synthetic.py),
+requests that aren't in the fixtures yet are forwarded to it and recorded.
+
+pywikibot doesn't go through the ReplayServer: patch_pywikibot() replaces pywikibot.Site, pywikibot.Page
+and pywikibot.FilePage with stand-ins that read from pywikibot.json and files/. Saved pages are kept in memory.
+record_pywikibot() records what real pywikibot loads while running.
+
+Example (recording from the real wiki and replaying it later):
+    fixtures = Fixtures("/path/to/fixtures", "https://www.4training.net")
+    with ReplayServer(fixtures, ApiProxy("https://www.4training.net", "/mediawiki")) as server:
+        fortraininglib = ForTrainingLib(server.url)
+        ...
+    with ReplayServer(Fixtures("/path/to/fixtures")) as server, patch_pywikibot(fixtures, server.url) as site:
+        ...
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, Final, Iterable, Iterator, Optional, Tuple
+from unittest.mock import patch
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+import requests
+
+
+class Fixtures:
+    """
+    Access to a fixture directory (see module documentation). Thread-safe.
+    Changes to pywikibot.json are only written by save(), API responses and files immediately.
+    """
+    # These parameters don't change the response
+    IGNORED_PARAMS: Final[Tuple[str, ...]] = ("maxlag",)
+
+    def __init__(self, path: str, base_url: Optional[str] = None):
+        """
+        @param path: fixture directory (will be created if it doesn't exist)
+        @param base_url: the wiki we record from (only necessary when creating new fixtures)
+        """
+        self.path: Final[str] = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(path, "api"), exist_ok=True)
+        os.makedirs(os.path.join(path, "files"), exist_ok=True)
+        meta_file: str = os.path.join(path, "fixtures.json")
+        if os.path.isfile(meta_file):
+            with open(meta_file, "r") as f:
+                self.base_url: str = json.load(f)["base_url"]
+        else:
+            if base_url is None:
+                raise RuntimeError(f"{path} doesn't contain fixtures")
+            self.base_url = base_url
+            with open(meta_file, "w") as f:
+                json.dump({"base_url": base_url}, f)
+        self.pages: Dict[str, str] = {}
+        self.file_infos: Dict[str, Dict[str, str]] = {}
+        pywikibot_file: str = os.path.join(path, "pywikibot.json")
+        if os.path.isfile(pywikibot_file):
+            with open(pywikibot_file, "r") as f:
+                data = json.load(f)
+            self.pages = data["pages"]
+            self.file_infos = data["files"]
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """Titles as pywikibot uses them: "Prayer_de.pdf" -> "Prayer de.pdf" """
+        return title.replace("_", " ").strip()
+
+    @classmethod
+    def get_key(cls, params: Dict[str, str]) -> str:
+        """@return identifier of this API request (the same for the same parameters in a different order)"""
+        normalized = sorted((key, value) for key, value in params.items() if key not in cls.IGNORED_PARAMS)
+        return hashlib.sha1(urlencode(normalized).encode("utf-8")).hexdigest()
+
+    def get_response(self, params: Dict[str, str]) -> Optional[Any]:
+        """@return the recorded response to this API request (None if we don't have it)"""
+        try:
+            with open(os.path.join(self.path, "api", f"{self.get_key(params)}.json"), "r") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+
+    def put_response(self, params: Dict[str, str], response: Any) -> None:
+        content: str = json.dumps({"params": params, "response": response}, ensure_ascii=False)
+        self._write(os.path.join("api", f"{self.get_key(params)}.json"), content.encode("utf-8"))
+
+    def file_path(self, name: str) -> str:
+        """@return where the file with this name is stored (regardless whether it exists)"""
+        info: Dict[str, str] = self.file_infos.get(self.normalize_title(name), {})
+        return os.path.join(self.path, "files", info.get("source", self.normalize_title(name).replace(" ", "_")))
+
+    def get_file(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self.file_path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_modification_time(self, name: str) -> Optional[float]:
+        """@return when the file was stored (as from os.path.getmtime()); None if we don't have it"""
+        try:
+            return os.path.getmtime(self.file_path(name))
+        except OSError:
+            return None
+
+    def put_file(self, name: str, content: bytes) -> None:
+        self._write(os.path.relpath(self.file_path(name), self.path), content)
+
+    def put_page(self, title: str, content: str) -> None:
+        with self._lock:
+            self.pages[self.normalize_title(title)] = content
+
+    def put_file_info(self, name: str, timestamp: datetime, sha1: str, source: Optional[str] = None) -> None:
+        """Add a file page (the file itself needs to be stored with put_file() or be available in files/ as source)"""
+        info: Dict[str, str] = {"timestamp": timestamp.isoformat(), "sha1": sha1}
+        if source is not None:
+            info["source"] = source
+        with self._lock:
+            self.file_infos[self.normalize_title(name)] = info
+
+    def save(self) -> None:
+        """Write what we know about pages and files for pywikibot"""
+        with self._lock:
+            content: str = json.dumps({"pages": self.pages, "files": self.file_infos}, ensure_ascii=False, indent=1)
+        self._write("pywikibot.json", content.encode("utf-8"))
+
+    def _write(self, relative_path: str, content: bytes) -> None:
+        """Write atomically: another thread may read the same file at the same time"""
+        path: str = os.path.join(self.path, relative_path)
+        temp_file: str = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_file, "wb") as f:
+            f.write(content)
+        os.replace(temp_file, path)
+
+
+class Upstream(ABC):
+    """Where the ReplayServer gets what isn't in the fixtures yet"""
+    base_url: str
+
+    @abstractmethod
+    def request(self, params: Dict[str, str]) -> Optional[Any]:
+        """@return response to an API request (None if it failed)"""
+        pass
+
+    @abstractmethod
+    def fetch(self, path: str) -> Optional[bytes]:
+        """@return content of a file, e.g. path = /mediawiki/images/a/ab/Family.png (None if it doesn't exist)"""
+        pass
+
+
+class ApiProxy(Upstream):
+    """Forward requests to the real mediawiki system (for recording)"""
+    TIMEOUT: Final[int] = 30
+
+    def __init__(self, base_url: str, script_path: str = "/mediawiki"):
+        self.base_url = base_url
+        self._api_url: Final[str] = f"{base_url}{script_path}/api.php"
+        self._session = threading.local()
+
+    def _get_session(self) -> requests.Session:
+        session: Optional[requests.Session] = getattr(self._session, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._session.session = session
+        return session
+
+    def request(self, params: Dict[str, str]) -> Optional[Any]:
+        try:
+            response = self._get_session().get(self._api_url, params=params, timeout=self.TIMEOUT)
+            return response.json() if response.status_code == 200 else None
+        except requests.exceptions.RequestException:
+            return None
+
+    def fetch(self, path: str) -> Optional[bytes]:
+        try:
+            response = self._get_session().get(f"{self.base_url}{path}", timeout=self.TIMEOUT)
+            return response.content if response.status_code == 200 else None
+        except requests.exceptions.RequestException:
+            return None
+
+
+class ReplayServer:
+    """
+    Local HTTP server answering mediawiki API requests and file downloads from Fixtures (see module documentation)
+
+    Usage:
+        with ReplayServer(fixtures) as server:
+            fortraininglib = ForTrainingLib(server.url)
+    """
+    def __init__(self, fixtures: Fixtures, upstream: Optional[Upstream] = None, latency: float = 0.0):
+        """
+        @param upstream: Optional: where to get (and record) what isn't in the fixtures yet
+        @param latency: seconds to wait before each response (simulating the network)
+        """
+        self.logger: Final[logging.Logger] = logging.getLogger('pywikitools.benchmark.replay')
+        self.fixtures: Final[Fixtures] = fixtures
+        self.upstream: Final[Optional[Upstream]] = upstream
+        self.latency: Final[float] = latency
+        self._lock = threading.Lock()
+        # Number of requests answered from the fixtures / recorded from upstream / that we couldn't answer
+        self.stats: Dict[str, int] = {"replayed": 0, "recorded": 0, "misses": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self.url: Final[str] = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "ReplayServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_api_response(self, params: Dict[str, str]) -> Optional[str]:
+        """@return JSON of the response (with URLs pointing to us) or None if we can't answer this request"""
+        response = self.fixtures.get_response(params)
+        if response is not None:
+            self._count("replayed")
+        elif self.upstream is not None:
+            response = self.upstream.request(params)
+            if response is not None:
+                self.fixtures.put_response(params, response)
+                self._count("recorded")
+        if response is None:
+            self.logger.warning(f"No recorded response for API request {params}")
+            self._count("misses")
+            return None
+        return json.dumps(response, ensure_ascii=False).replace(self.fixtures.base_url, self.url)
+
+    @staticmethod
+    def _file_name(path: str) -> str:
+        return unquote(path.rsplit("/", 1)[-1])
+
+    def get_last_modified(self, path: str) -> Optional[float]:
+        """@return modification time of the requested file (None if we don't have it)"""
+        return self.fixtures.get_modification_time(self._file_name(path))
+
+    def get_file(self, path: str) -> Optional[bytes]:
+        """@return content of the requested file (None if we don't have it)"""
+        name: str = self._file_name(path)
+        content: Optional[bytes] = self.fixtures.get_file(name)
+        if content is not None:
+            self._count("replayed")
+        elif self.upstream is not None:
+            content = self.upstream.fetch(path)
+            if content is not None:
+                self.fixtures.put_file(name, content)
+                self._count("recorded")
+        if content is None:
+            self.logger.warning(f"No recorded file for {path}")
+            self._count("misses")
+        return content
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep connections alive as a real web server would
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16              # send headers and content together
+
+            def do_GET(self):
+                if server.latency > 0:
+                    time.sleep(server.latency)
+                url = urlsplit(self.path)
+                if url.path.endswith("/api.php"):
+                    content: Optional[str] = server.get_api_response(dict(parse_qsl(url.query,
+                                                                                    keep_blank_values=True)))
+                    if content is None:
+                        self._send(404, b'{"error": {"code": "replay-miss", "info": "Not recorded"}}',
+                                   "application/json")
+                    else:
+                        self._send(200, content.encode("utf-8"), "application/json; charset=utf-8")
+                    return
+                data: Optional[bytes] = server.get_file(url.path)
+                if data is None:
+                    self._send(404, b"Not found", "text/plain")
+                    return
+                headers: Dict[str, str] = {}
+                last_modified: Optional[float] = server.get_last_modified(url.path)
+                if last_modified is not None:
+                    headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+                    if self._not_modified_since(int(last_modified)):
+                        self._send(304, b"", "application/octet-stream", headers)
+                        return
+                handler = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+                if handler is None or handler.group(1) == handler.group(2) == "":
+                    self._send(200, data, "application/octet-stream", headers)
+                    return
+                if handler.group(1) == "":      # suffix range: the last bytes of the file
+                    first: int = max(0, len(data) - int(handler.group(2)))
+                    last: int = len(data) - 1
+                else:
+                    first = int(handler.group(1))
+                    last = min(int(handler.group(2)) if handler.group(2) else len(data) - 1, len(data) - 1)
+                if first >= len(data):
+                    self._send(416, b"", "application/octet-stream", {"Content-Range": f"bytes */{len(data)}"})
+                    return
+                self._send(206, data[first:last + 1], "application/octet-stream",
+                           {**headers, "Content-Range": f"bytes {first}-{last}/{len(data)}"})
+
+            def _not_modified_since(self, last_modified: int) -> bool:
+                """Does the client have the current version of the file already (If-Modified-Since)?"""
+                since: Optional[str] = self.headers.get("If-Modified-Since")
+                if since is None:
+                    return False
+                try:
+                    return parsedate_to_datetime(since).timestamp() >= last_modified
+                except (TypeError, ValueError):
+                    return False
+
+            def _send(self, status: int, content: bytes, content_type: str,
+                      headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("Accept-Ranges", "bytes")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                server.logger.debug(format % args)
+
+        return Handler
+
+
+class ReplayFileInfo:
+    """Stand-in for pywikibot.page.FileInfo"""
+    __slots__ = ["url", "timestamp", "sha1"]
+
+    def __init__(self, url: str, timestamp: datetime, sha1: str):
+        self.url: Final[str] = url
+        self.timestamp: Final[datetime] = timestamp
+        self.sha1: Final[str] = sha1
+
+
+class ReplaySite:
+    """Stand-in for pywikibot.site.APISite: pages are read from Fixtures, saved pages are kept in memory"""
+    def __init__(self, fixtures: Fixtures, url: str):
+        """@param url: where the files can be downloaded from (ReplayServer.url)"""
+        self.fixtures: Final[Fixtures] = fixtures
+        self.url: Final[str] = url
+        self._lock = threading.Lock()
+        self._pages: Dict[str, str] = dict(fixtures.pages)
+        # Pages that were saved: title -> number of times they were saved
+        self.saved: Dict[str, int] = {}
+
+    def logged_in(self) -> bool:
+        return True
+
+    def login(self) -> None:
+        pass
+
+    def get_text(self, title: str) -> Optional[str]:
+        with self._lock:
+            return self._pages.get(Fixtures.normalize_title(title))
+
+    def save_text(self, title: str, content: str) -> None:
+        title = Fixtures.normalize_title(title)
+        with self._lock:
+            self._pages[title] = content
+            self.saved[title] = self.saved.get(title, 0) + 1
+
+    def preloadpages(self, pagelist: Iterable["ReplayPage"], groupsize: int = 50, **kwargs) -> Iterator["ReplayPage"]:
+        """Like APISite.preloadpages(): load the content of all given pages"""
+        for page in pagelist:
+            page.text
+            yield page
+
+
+class ReplayPage:
+    """Stand-in for pywikibot.Page (only what our tools need)"""
+    def __init__(self, site: ReplaySite, title: str, ns: int = 0):
+        self.site: Final[ReplaySite] = site
+        self._title: Final[str] = Fixtures.normalize_title(title)
+        self._text: Optional[str] = None
+
+    def title(self, with_ns: bool = True, underscore: bool = False, **kwargs) -> str:
+        title: str = self._title
+        if not with_ns and ":" in title:
+            title = title.split(":", 1)[1]
+        return title.replace(" ", "_") if underscore else title
+
+    def full_url(self) -> str:
+        return f"{self.site.url}/{self.title(underscore=True)}"
+
+    def exists(self) -> bool:
+        return self.site.get_text(self._title) is not None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.site.get_text(self._title) or ""
+        return self._text
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self._text = value
+
+    def save(self, summary: str = "", *args, **kwargs) -> None:
+        self.site.save_text(self._title, self.text)
+
+    def isRedirectPage(self) -> bool:
+        return False
+
+    def getRedirectTarget(self) -> "ReplayPage":
+        return self
+
+
+class ReplayFilePage(ReplayPage):
+    """Stand-in for pywikibot.FilePage"""
+    def __init__(self, site: ReplaySite, title: str):
+        super().__init__(site, title if title.startswith("File:") else f"File:{title}")
+        self._name: Final[str] = self.title(with_ns=False)
+
+    def exists(self) -> bool:
+        return self._name in self.site.fixtures.file_infos
+
+    @property
+    def latest_file_info(self) -> ReplayFileInfo:
+        info: Dict[str, str] = self.site.fixtures.file_infos[self._name]
+        return ReplayFileInfo(f"{self.site.url}/mediawiki/images/{self._name.replace(' ', '_')}",
+                              datetime.fromisoformat(info["timestamp"]), info["sha1"])
+
+    def download(self, filename: Optional[str] = None, **kwargs) -> bool:
+        source: str = self.site.fixtures.file_path(self._name)
+        if not self.exists() or not os.path.isfile(source):
+            return False
+        shutil.copyfile(source, filename if filename is not None else self._name.replace(" ", "_"))
+        return True
+
+
+@contextmanager
+def patch_pywikibot(fixtures: Fixtures, url: str) -> Iterator[ReplaySite]:
+    """
+    While in this context, pywikibot.Site(), pywikibot.Page() and pywikibot.FilePage() return our stand-ins
+    @param url: where the files can be downloaded from (ReplayServer.url)
+    """
+    site = ReplaySite(fixtures, url)
+    with patch("pywikibot.Site", return_value=site), patch("pywikibot.Page", ReplayPage), \
+         patch("pywikibot.FilePage", ReplayFilePage):
+        yield site
+
+
+@contextmanager
+def record_pywikibot(fixtures: Fixtures) -> Iterator[None]:
+    """
+    Record what pywikibot loads while in this context: content of pages and information on files
+    (downloading the files as well). Nothing is recorded from saving pages.
+    Afterwards everything is written to the fixture directory.
+    """
+    import pywikibot
+    original_get = pywikibot.page.BasePage.get
+    original_exists = pywikibot.FilePage.exists
+
+    def get(page, *args, **kwargs) -> str:
+        content: str = original_get(page, *args, **kwargs)
+        fixtures.put_page(page.title(), content)
+        return content
+
+    def exists(file_page) -> bool:
+        result: bool = original_exists(file_page)
+        if result:
+            info = file_page.latest_file_info
+            name: str = file_page.title(with_ns=False)
+            fixtures.put_file_info(name, info.timestamp, info.sha1)
+            if not os.path.isfile(fixtures.file_path(name)):
+                file_page.download(fixtures.file_path(name))
+        return result
+
+    pywikibot.page.BasePage.get = get   # type: ignore[method-assign]
+    pywikibot.FilePage.exists = exists  # type: ignore[method-assign]
+    try:
+        yield
+    finally:
+        pywikibot.page.BasePage.get = original_get      # type: ignore[method-assign]
+        pywikibot.FilePage.exists = original_exists     # type: ignore[method-assign]
+        fixtures.save()
@@ -0,0 +1,251 @@
+"""
+Benchmark of the resourcesbot pipeline that doesn't need the network (see replay.py and synthetic.py)
+
+We measure the wall time of
+- crawl: querying all worksheets and their translations including analysis of the PDF files
+  (ResourcesBot._query_all_worksheets())
+- sync_and_compare: comparing the results of all languages with what is stored in the mediawiki system
+  (ResourcesBot._sync_and_compare(), after preloading the stored JSON). Some languages are new,
+  some have changes, most are unchanged.
+- preload: loading all pages the post-processors are going to write (see PageWriter)
+- postprocessor:<name>: each post-processor for all languages, forced to do all its work
+  (ExportRepository is left out: it needs git repositories with a remote)
+
+By default we generate a mediawiki system with 120 languages (see SyntheticWiki). Each request to it
+is answered by a local ReplayServer with a simulated network latency.
+Alternatively we can replay fixtures that were recorded from the real mediawiki system
+(--record-from records them while doing a normal benchmark run; pywikibot doesn't save anything then).
+
+Each benchmark is run several times, we report the minimum and the median.
+Results are written as JSON together with the git commit and all parameters so that different commits
+can be compared:
+    python3 -m pywikitools.benchmark.resourcesbot_benchmark -o before.json
+    git checkout ...
+    python3 -m pywikitools.benchmark.resourcesbot_benchmark -o after.json --compare before.json
+
+Command line options:
+    --languages NUMBER: number of languages of the synthetic mediawiki system (default: 120)
+    --seed NUMBER: for generating the synthetic mediawiki system (default: 1)
+    --fixtures FOLDER: replay these fixtures instead of using a synthetic mediawiki system
+    --record-from URL: record what's missing in the fixtures from this mediawiki system, e.g. https://www.4training.net
+    --latency SECONDS: simulated network latency of each request (default: 0.02)
+    --workers NUMBER: number of worksheets queried in parallel (see option workers in config.example.ini)
+                      and of worksheets / images fetched in parallel by ExportHTML (see html_export_workers)
+    --repeat NUMBER: how often each benchmark is run (default: 3)
+    -o, --output FILE: write results as JSON into this file
+    --compare FILE: compare the results with an earlier run
+    -l, --loglevel: change logging level (default: error)
+"""
+import argparse
+from configparser import ConfigParser
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pywikitools.benchmark.replay import ApiProxy, Fixtures, ReplayServer, ReplaySite, Upstream, \
+                                         patch_pywikibot, record_pywikibot
+from pywikitools.benchmark.synthetic import SyntheticWiki
+from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.resourcesbot.bot import ResourcesBot
+from pywikitools.resourcesbot.consistency_checks import ConsistencyCheck
+from pywikitools.resourcesbot.data_structures import LanguageInfo, language_info_from_json, language_info_to_json
+from pywikitools.resourcesbot.export_html import ExportHTML
+from pywikitools.resourcesbot.scheduler import PostProcessingScheduler
+from pywikitools.resourcesbot.write_lists import WriteList
+from pywikitools.resourcesbot.write_report import WriteReport
+from pywikitools.resourcesbot.write_sidebar_messages import WriteSidebarMessages
+from pywikitools.resourcesbot.write_summary import WriteSummary
+
+
+def _prepare_stored_json(site: ReplaySite, result: Dict[str, LanguageInfo], seed: int) -> None:
+    """
+    Store the JSON of our results in the mediawiki system as if we had run before:
+    10% of the languages are new, 20% have a removed worksheet, the others are unchanged
+    """
+    rng = random.Random(seed)
+    for lang, language_info in result.items():
+        choice: float = rng.random()
+        if choice < 0.1:
+            continue
+        stored: LanguageInfo = language_info_from_json(language_info_to_json(language_info))
+        if choice < 0.3 and len(stored.worksheets) > 0:
+            stored.remove_worksheet_info(next(iter(stored.worksheets)))
+        site.save_text(f"4training:{lang}.json", language_info_to_json(stored))
+    site.saved.clear()
+
+
+def _run_once(url: str, temp_dir: str, workers: int, seed: int,
+              site: Optional[ReplaySite]) -> Tuple[Dict[str, float], Dict[str, Any], int]:
+    """
+    Run all benchmarks once
+    @param url: base URL of the mediawiki system (our ReplayServer)
+    @param site: our stand-in for pywikibot (None if we're recording with the real pywikibot)
+    @return wall time of each benchmark, the requests we sent (see Metrics.as_dict()), number of languages
+    """
+    config = ConfigParser()
+    config.read_dict({"mediawiki": {"baseurl": url, "scriptpath": "/mediawiki"},
+                      "Paths": {"temp": temp_dir, "htmlexport": os.path.join(temp_dir, "html")},
+                      "resourcesbot": {"workers": str(workers), "pdf_metadata_cache": "", "snapshot": "",
+                                       "run_report": "", "username": "", "password": ""}})
+    bot = ResourcesBot(config)
+    timings: Dict[str, float] = {}
+    try:
+        start: float = time.perf_counter()
+        bot._result = {"en": LanguageInfo("en", "English")}
+        bot._query_all_worksheets()
+        timings["crawl"] = time.perf_counter() - start
+
+        if site is not None:
+            _prepare_stored_json(site, bot._result, seed)
+        start = time.perf_counter()
+        bot._preload_own_pages()
+        for lang, language_info in bot._result.items():
+            bot._changelog[lang] = bot._sync_and_compare(language_info)
+        timings["sync_and_compare"] = time.perf_counter() - start
+
+        scheduler = PostProcessingScheduler()
+        scheduler.add(ConsistencyCheck(bot.fortraininglib))
+        scheduler.add(ExportHTML(bot.fortraininglib, config.get("Paths", "htmlexport"), force_rewrite=True,
+                                 workers=workers))
+        scheduler.add(WriteList(bot.fortraininglib, bot.site, "", "", force_rewrite=True,
+                                page_writer=bot._page_writer))
+        scheduler.add(WriteReport(bot.fortraininglib, bot.site, force_rewrite=True, page_writer=bot._page_writer))
+        scheduler.add(WriteSidebarMessages(bot.fortraininglib, bot.site, force_rewrite=True,
+                                           page_writer=bot._page_writer))
+        scheduler.add(WriteSummary(bot.site, force_rewrite=True, page_writer=bot._page_writer))
+        start = time.perf_counter()
+        bot._page_writer.preload(scheduler.pages_to_preload(bot._result, bot._changelog))
+        timings["preload"] = time.perf_counter() - start
+        scheduler.run(bot._result, bot._changelog)
+        for name, seconds in scheduler.timings.items():
+            timings[f"postprocessor:{name}"] = seconds
+        return timings, bot.fortraininglib.metrics.as_dict()["requests"], len(bot._result)
+    finally:
+        bot.fortraininglib.session.close()
+
+
+def run_benchmarks(fixtures: Fixtures, upstream: Optional[Upstream] = None, latency: float = 0.02,
+                   workers: int = 1, repeat: int = 3, seed: int = 1, record: bool = False) -> Dict[str, Any]:
+    """
+    Run all benchmarks repeat times
+    @param upstream: Optional: where to get what's missing in the fixtures
+    @param record: use the real pywikibot and record what it loads (instead of our stand-in)
+    @return results in the format we write to the JSON file
+    """
+    runs: Dict[str, List[float]] = {}
+    requests: Dict[str, Any] = {}
+    languages: int = 0
+    with ReplayServer(fixtures, upstream, latency) as server:
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as temp_dir:
+                if record:
+                    import pywikibot
+                    pywikibot.config.simulate = True    # Never change anything in the real mediawiki system
+                    with record_pywikibot(fixtures):
+                        timings, requests, languages = _run_once(server.url, temp_dir, workers, seed, None)
+                else:
+                    with patch_pywikibot(fixtures, server.url) as site:
+                        timings, requests, languages = _run_once(server.url, temp_dir, workers, seed, site)
+            for name, seconds in timings.items():
+                runs.setdefault(name, []).append(seconds)
+        replay_stats: Dict[str, int] = dict(server.stats)
+
+    return {
+        "benchmark": {"commit": _get_commit(), "python": platform.python_version(), "fixtures": fixtures.base_url,
+                      "languages": languages, "seed": seed, "latency": latency, "workers": workers,
+                      "repeat": repeat},
+        "results": {name: {"median": round(statistics.median(values), 4), "min": round(min(values), 4),
+                           "runs": [round(value, 4) for value in values]} for name, values in runs.items()},
+        "requests": requests,
+        "replay": replay_stats}
+
+
+def _get_commit() -> str:
+    """@return the git commit we're benchmarking ("unknown" if we can't find out)"""
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """@return human-readable comparison of the medians of two benchmark runs"""
+    lines: List[str] = []
+    parameters = ["fixtures", "languages", "seed", "latency", "workers"]
+    different: List[str] = [parameter for parameter in parameters
+                            if old["benchmark"].get(parameter) != new["benchmark"].get(parameter)]
+    if len(different) > 0:
+        lines.append(f"Warning: results are not comparable, different {', '.join(different)}")
+    lines.append(f"{'Benchmark':40} {old['benchmark']['commit'][:8]:>10} {new['benchmark']['commit'][:8]:>10}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            lines.append(f"{name:40} {'-':>10} {result['median']:>9.3f}s")
+            continue
+        old_median: float = old["results"][name]["median"]
+        change: str = f"{(result['median'] - old_median) / old_median:+.1%}" if old_median > 0 else ""
+        lines.append(f"{name:40} {old_median:>9.3f}s {result['median']:>9.3f}s {change:>8}")
+    return lines
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the resourcesbot without network access")
+    parser.add_argument("--languages", type=int, default=120, help="Number of languages of the synthetic system")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for generating the synthetic system")
+    parser.add_argument("--fixtures", help="Replay these fixtures instead of using a synthetic system")
+    parser.add_argument("--record-from", help="Record what's missing in the fixtures from this mediawiki system")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated network latency in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worksheets / images fetched in parallel")
+    parser.add_argument("--repeat", type=int, default=3, help="How often each benchmark is run")
+    parser.add_argument("-o", "--output", help="Write results as JSON into this file")
+    parser.add_argument("--compare", help="Compare with the results of an earlier run (JSON file)")
+    parser.add_argument("-l", "--loglevel", choices=["debug", "info", "warning", "error"], default="error",
+                        help="set loglevel for the script")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+    if args.record_from is not None and args.fixtures is None:
+        sys.exit("--record-from needs --fixtures")
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        upstream: Optional[Upstream] = None
+        if args.fixtures is not None:
+            fixtures = Fixtures(args.fixtures, args.record_from)
+            if args.record_from is not None:
+                upstream = ApiProxy(args.record_from)
+        else:
+            wiki = SyntheticWiki(ForTrainingLib(SyntheticWiki.BASE_URL).get_worksheet_list(), args.languages,
+                                 args.seed)
+            fixtures = Fixtures(synthetic_dir, wiki.base_url)
+            wiki.populate(fixtures)
+            upstream = wiki
+        results = run_benchmarks(fixtures, upstream, args.latency, args.workers, args.repeat, args.seed,
+                                 record=args.record_from is not None)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            print("\n".join(compare(json.load(f), results)))
+    else:
+        for name, result in results["results"].items():
+            print(f"{name:40} median {result['median']:>9.3f}s   min {result['min']:>9.3f}s")
+    if results["replay"]["misses"] > 0:
+        print(f"Warning: {results['replay']['misses']} requests couldn't be answered from the fixtures")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+A generated mediawiki system with as many languages as we want: upstream for the ReplayServer (see replay.py)
+
+All worksheets get a version, a PDF and an ODT file. Each language translates a random selection of worksheets
+(some translations are unfinished or outdated, some don't have an ODT file).
+The data only depends on the number of languages and the seed, so it is the same on every run.
+The language codes are from the range qaa-qtz (reserved for local use by ISO 639), so they can't be confused
+with real languages.
+
+Answers the API requests that the resourcesbot and its post-processors send:
+- meta=messagegroupstats and meta=languagestats (translation progress)
+- meta=languageinfo (names of all languages)
+- prop=revisions (page sources including translation units)
+- prop=imageinfo (URL, size, SHA1, MIME type and timestamp of files)
+- action=parse (language names with {{#language:}} and HTML of pages)
+- action=expandtemplates
+"""
+import hashlib
+from datetime import datetime
+import os
+import random
+import re
+from string import ascii_lowercase
+from typing import Any, Dict, Final, List, Optional
+
+from pywikitools.benchmark.replay import Fixtures, Upstream
+
+# The PDF and image that all our files are copies of (from the data of our tests)
+SAMPLE_PDF: Final[str] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "data",
+                                      "Gottes_Reden_wahrnehmen.pdf")
+SAMPLE_PNG: Final[bytes] = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                                         "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+SAMPLE_ODT: Final[bytes] = b"PK\x03\x04 synthetic ODT file"
+
+
+class SyntheticWiki(Upstream):
+    """
+    Usage:
+        wiki = SyntheticWiki(worksheets, languages=120)
+        fixtures = Fixtures(path, wiki.base_url)
+        wiki.populate(fixtures)
+        with ReplayServer(fixtures, wiki) as server, patch_pywikibot(fixtures, server.url):
+            ...
+    """
+    # Translation units of each worksheet
+    VERSION_UNIT: Final[int] = 1
+    PDF_UNIT: Final[int] = 2
+    ODT_UNIT: Final[int] = 3
+    TOTAL_UNITS: Final[int] = 40
+    BASE_URL: Final[str] = "https://synthetic.invalid"
+
+    def __init__(self, worksheets: List[str], languages: int = 120, seed: int = 1):
+        """
+        @param worksheets: names of all worksheets (see ForTrainingLib.get_worksheet_list())
+        @param languages: number of languages (without English)
+        """
+        assert 0 < languages <= 26 * 20
+        self.base_url = self.BASE_URL
+        self.worksheets: Final[List[str]] = worksheets
+        self.languages: Final[List[str]] = [f"q{first}{second}" for first in ascii_lowercase[:20]
+                                            for second in ascii_lowercase][:languages]
+        rng = random.Random(seed)
+        self.timestamp: Final[datetime] = datetime(2023, 1, 1)
+        # Mediawiki normalizes titles: page content is stored with spaces instead of underscores
+        self._pages: Dict[str, str] = {}
+        # Translation progress: worksheet -> (language code -> progress as returned by the API)
+        self._progress: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Files: name -> name of the file they're a copy of
+        self._files: Dict[str, str] = {}
+        for index, worksheet in enumerate(self.worksheets):
+            version: str = f"1.{index % 4}"
+            title: str = worksheet.replace("_", " ")
+            self._add_page(worksheet, "\n".join([
+                "{{Version|<translate><!--T:" + str(self.VERSION_UNIT) + "--> " + version + "</translate>}}",
+                "{{PdfDownload|<translate><!--T:" + str(self.PDF_UNIT) + "--> " + worksheet + ".pdf</translate>}}",
+                "{{OdtDownload|<translate><!--T:" + str(self.ODT_UNIT) + "--> " + worksheet + ".odt</translate>}}"] +
+                [f"<translate><!--T:{unit}--> Content of translation unit {unit}</translate>"
+                 for unit in range(self.ODT_UNIT + 1, self.TOTAL_UNITS)]))
+            self._add_translation(worksheet, "en", title, version, f"{worksheet}.pdf", f"{worksheet}.odt")
+            self._progress[worksheet] = {"en": self._progress_entry("en", self.TOTAL_UNITS)}
+            for lang in self.languages:
+                if rng.random() > 0.35:
+                    continue
+                translated: int = self.TOTAL_UNITS if rng.random() > 0.15 else self.TOTAL_UNITS // 2
+                self._progress[worksheet][lang] = self._progress_entry(lang, translated)
+                self._add_translation(worksheet, lang, f"{title} ({lang})",
+                                      version if rng.random() > 0.1 else "1.0",
+                                      f"{worksheet}_{lang}.pdf", f"{worksheet}_{lang}.odt" if rng.random() > 0.5
+                                      else None)
+
+    def _add_page(self, title: str, content: str) -> None:
+        self._pages[Fixtures.normalize_title(title)] = content
+
+    def _add_translation(self, worksheet: str, lang: str, title: str, version: str,
+                         pdf: str, odt: Optional[str]) -> None:
+        self._add_page(f"Translations:{worksheet}/Page display title/{lang}", title)
+        self._add_page(f"Translations:{worksheet}/{self.VERSION_UNIT}/{lang}", version)
+        self._add_page(f"Translations:{worksheet}/{self.PDF_UNIT}/{lang}", pdf)
+        self._files[Fixtures.normalize_title(pdf)] = "sample.pdf"
+        if odt is not None:
+            self._add_page(f"Translations:{worksheet}/{self.ODT_UNIT}/{lang}", odt)
+            self._files[Fixtures.normalize_title(odt)] = "sample.odt"
+
+    def _progress_entry(self, lang: str, translated: int) -> Dict[str, Any]:
+        return {"total": self.TOTAL_UNITS, "translated": translated, "fuzzy": 0, "proofread": 0,
+                "code": lang, "language": lang}
+
+    def get_language_name(self, language_code: str) -> str:
+        """English name of a language"""
+        return "English" if language_code == "en" else f"Synthetic {language_code}"
+
+    def populate(self, fixtures: Fixtures) -> None:
+        """Write what pywikibot needs into the fixtures: the files and the pages we're going to update"""
+        with open(SAMPLE_PDF, "rb") as f:
+            fixtures.put_file("sample.pdf", f.read())
+        fixtures.put_file("sample.odt", SAMPLE_ODT)
+        for name, source in self._files.items():
+            sha1: str = hashlib.sha1(name.encode("utf-8")).hexdigest()     # all files are different (in theory)
+            fixtures.put_file_info(name, self.timestamp, sha1, source)
+        for lang in self.languages:
+            language: str = self.get_language_name(lang)
+            fixtures.put_page(language, f"== <translate>Available training resources in {language}</translate> ==\n"
+                                        "* [[Prayer]]\n\nMore content\n")
+        fixtures.save()
+
+    def request(self, params: Dict[str, str]) -> Optional[Any]:
+        if params.get("action") == "query":
+            if params.get("meta") == "messagegroupstats":
+                worksheet: str = params.get("mgsgroup", "")[5:]
+                return {"query": {"messagegroupstats": list(self._progress.get(worksheet, {}).values())}}
+            if params.get("meta") == "languagestats":
+                lang: str = params.get("lslanguage", "")
+                return {"query": {"languagestats": [
+                    {**progress[lang], "group": f"page-{worksheet.replace('_', ' ')}"}
+                    for worksheet, progress in self._progress.items() if lang in progress]}}
+            if params.get("meta") == "languageinfo":    # Same names as {{#language:}} returns (see below)
+                return {"query": {"languageinfo": {lang: {"code": lang, "autonym": lang.upper(),
+                                                          "name": self.get_language_name(lang)}
+                                                   for lang in ["en"] + self.languages}}}
+            if params.get("prop") == "revisions":
+                return self._query_pages(params.get("titles", ""), lambda title, content: {
+                    "revisions": [{"slots": {"main": {"contentmodel": "wikitext", "*": content}}}]})
+            if params.get("prop") == "imageinfo":
+                return self._query_pages(params.get("titles", ""), lambda title, content: {
+                    "imageinfo": [self._image_info(title[5:])]}, files=True)
+        if params.get("action") == "parse":
+            if "page" in params:
+                page: str = params["page"]
+                return {"parse": {"title": page, "text": {"*": self._render(page)}}}
+            handler = re.fullmatch(r"\{\{#language:([^|}]+)(\|[^}]+)?\}\}", params.get("text", ""))
+            if handler:
+                name = self.get_language_name(handler.group(1)) if handler.group(2) else handler.group(1).upper()
+                html: str = f'<div class="mw-parser-output"><p>{name}\n</p></div>'
+                return {"parse": {"title": "API", "text": {"*": html}}}
+        if params.get("action") == "expandtemplates":
+            return {"expandtemplates": {"wikitext": f"Expanded {params.get('text', '')}"}}
+        return {"error": {"code": "unknown", "info": f"Synthetic wiki doesn't understand {params}"}}
+
+    def _query_pages(self, titles: str, page_details, files: bool = False) -> Dict[str, Any]:
+        """Answer a query for several titles as the mediawiki API does (including normalization of titles)"""
+        pages: Dict[str, Dict[str, Any]] = {}
+        normalized: List[Dict[str, str]] = []
+        for index, title in enumerate(titles.split("|")):
+            normalized_title: str = Fixtures.normalize_title(title)
+            if normalized_title != title:
+                normalized.append({"from": title, "to": normalized_title})
+            if files:   # all images exist
+                exists: bool = normalized_title[5:] in self._files or normalized_title.endswith(".png")
+            else:
+                exists = normalized_title in self._pages
+            if exists:
+                pages[str(index + 1)] = {"pageid": index + 1, "ns": 0, "title": normalized_title,
+                                         **page_details(normalized_title, self._pages.get(normalized_title))}
+            else:
+                pages[str(-index - 1)] = {"ns": 0, "title": normalized_title, "missing": ""}
+        query: Dict[str, Any] = {"pages": pages}
+        if normalized:
+            query["normalized"] = normalized
+        return {"batchcomplete": "", "query": query}
+
+    def _image_info(self, name: str) -> Dict[str, Any]:
+        """Details on a file as returned by prop=imageinfo (SHA1 as in populate(); images: of their real content)"""
+        info: Dict[str, Any] = {"url": f"{self.base_url}/mediawiki/images/{name.replace(' ', '_')}",
+                                "timestamp": self.timestamp.isoformat() + "Z"}
+        if name.endswith(".png"):
+            return {**info, "size": len(SAMPLE_PNG), "sha1": hashlib.sha1(SAMPLE_PNG).hexdigest(),
+                    "mime": "image/png"}
+        mime: str = "application/pdf" if name.endswith(".pdf") else "application/vnd.oasis.opendocument.text"
+        return {**info, "size": os.path.getsize(SAMPLE_PDF) if name.endswith(".pdf") else len(SAMPLE_ODT),
+                "sha1": hashlib.sha1(name.encode("utf-8")).hexdigest(), "mime": mime}
+
+    def _render(self, page: str) -> str:
+        """HTML of a page: some paragraphs and an image"""
+        worksheet, _, lang = page.rpartition("/")
+        image: str = f"{worksheet.replace(' ', '_')}.png"
+        return ('<div class="mw-parser-output">' +
+                f'<p><img src="/mediawiki/images/a/ab/{image}" width="100" height="100"></p>' +
+                "".join(f"<p>Content of translation unit {unit} ({lang})</p>"
+                        for unit in range(self.ODT_UNIT + 1, self.TOTAL_UNITS)) + "</div>")
+
+    def fetch(self, path: str) -> Optional[bytes]:
+        if path.endswith(".png"):
+            return SAMPLE_PNG
+        return None
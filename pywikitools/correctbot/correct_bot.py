@@ -23,7 +23,9 @@ import re
 import sys
 from typing import Callable, List, Optional
 
+from pywikitools.apicache import ApiCache
 from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.retrypolicy import RetryPolicy
 from pywikitools.correctbot.correctors.base import CorrectionResult, CorrectorBase
 from pywikitools.lang.translated_page import TranslatedPage, TranslationUnit
 
@@ -36,7 +38,9 @@ class CorrectBot:
            not self._config.has_option('mediawiki', 'scriptpath'):
             raise RuntimeError("Missing settings for mediawiki connection in config.ini")
         self.fortraininglib: ForTrainingLib = ForTrainingLib(self._config.get('mediawiki', 'baseurl'),
-                                                             self._config.get('mediawiki', 'scriptpath'))
+                                                             self._config.get('mediawiki', 'scriptpath'),
+                                                             ApiCache.from_config(self._config),
+                                                             RetryPolicy.from_config(self._config))
         self.logger: logging.Logger = logging.getLogger("pywikitools.correctbot")
         self.site: pywikibot.site.APISite = pywikibot.Site()
         self._simulate: bool = simulate
@@ -48,17 +48,22 @@ except FileExistsError:
 fortraininglib = ForTrainingLib("https://www.4training.net")
 translations = fortraininglib.list_page_translations(worksheetname)
 logging.info(f'Worksheet {worksheetname} is translated into {len(translations)} languages: {translations.keys()}')
+pdfs = {}     # language code -> name of the PDF file
 for language in translations.keys():
     pdf = fortraininglib.get_pdf_name(worksheetname, language)
     if pdf is None:
         logging.warning(f"Couldn't find PDF name in {worksheetname}/{language}")
         continue
     logging.debug(f"Language: {language}, filename: {pdf}")
-    url = fortraininglib.get_file_url(pdf)
-    if not url:
+    pdfs[language] = pdf
+# Get the URLs of all PDF files at once (one request for up to 50 files)
+file_infos = fortraininglib.get_file_infos(list(pdfs.values()))
+for language, pdf in pdfs.items():
+    file_info = file_infos[pdf]
+    if file_info is None:
         logging.warning(f"Language: {language}, file: {pdf} doesn't seem to exist, ignoring")
         continue
-    file_request = requests.get(url, allow_redirects=True)
+    file_request = requests.get(file_info["url"], allow_redirects=True)
     language_autonym = fortraininglib.get_language_name(language)
     language_english = fortraininglib.get_language_name(language, 'en')
     if language_autonym is None or language_english is None:
@@ -4,28 +4,74 @@
 Contains common functions, many of wrapping API calls
 We didn't name this 4traininglib.py because starting a python file name with a number causes problems
 """
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 import re
-from typing import Any, Final, List, Optional, Dict
+import threading
+import time
+from typing import Any, Callable, Final, Generator, Iterator, List, Optional, Dict, Protocol, Tuple, TypeVar, cast
 import requests
 
+from pywikitools.apicache import ApiCache
+from pywikitools.instrumentation import Metrics
 from pywikitools.lang.translated_page import TranslatedPage, TranslationUnit
+from pywikitools.retrypolicy import RateLimiter, RequestCounters, RetryPolicy
 from pywikitools.resourcesbot.data_structures import TranslationProgress
+from pywikitools.worksheet_source import WorksheetSource
 
 # Language codes of all right-to-left languages we currently have
 RTL_LANGUAGES = ["ar", "fa", "ckb", "ar-urdun", "ps", "ur"]
 
+T = TypeVar("T")
+T_co = TypeVar("T_co", covariant=True)
+# Generator yielding the parameters of API requests, receiving the responses and finally returning a T
+ApiSteps = Generator[Dict[str, str], Any, T]
+
+
+class ApiMethod(Protocol[T_co]):
+    """
+    Type of a method decorated with @api_call: calling it sends the requests and returns the result of the generator.
+    The generator function itself is available as __wrapped__
+    """
+    def __call__(self, *args: Any, **kwargs: Any) -> T_co: ...
+
+    @property
+    def __wrapped__(self) -> Callable[..., ApiSteps[T_co]]: ...
+
+
+def api_call(func: Callable[..., ApiSteps[T]]) -> ApiMethod[T]:
+    """
+    Decorator for all ForTrainingLib methods that query the mediawiki API
+
+    The decorated method is written as a generator: it yields the parameters of each API request
+    and receives the response (JSON) back. So the logic of the method doesn't depend on how requests are sent:
+    ForTrainingLib sends them one after the other with requests, AsyncForTrainingLib concurrently with aiohttp.
+    A method declared as returning ApiSteps[T] returns T when called (see ApiMethod).
+    The undecorated generator function is available as __wrapped__ (e.g. ForTrainingLib.get_page_source.__wrapped__)
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self._run(func(self, *args, **kwargs))
+    return cast(ApiMethod[T], wrapper)
+
 
 class ForTrainingLib():
     TIMEOUT: int = 30           # Timeout after 30s (prevent indefinite hanging when there is network issues)
-    CONNECT_RETRIES: int = 3    # In case a request timed out, let's try again up to three times
+    CONNECT_RETRIES: int = 3    # Default: in case a request failed, let's try again up to three times
+    MAX_TITLES: int = 50        # Maximum number of titles the mediawiki API accepts in one query
 
-    __slots__ = ["base_url", "script_path", "api_url", "index_url", "logger", "session"]
+    __slots__ = ["base_url", "script_path", "api_url", "index_url", "logger", "session", "cache",
+                 "retry_policy", "rate_limiter", "counters", "metrics", "_worksheet_sources",
+                 "_language_names", "_memo_lock"]
 
-    def __init__(self, base_url: str, script_path: str = "/mediawiki"):
+    def __init__(self, base_url: str, script_path: str = "/mediawiki", cache: Optional[ApiCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         """
         @param base_url: Domain of the mediawiki system we want to query (example: "https://www.example.com")
         @param api_path: path of the mediawiki API endpoint (relative to base_url)
+        @param cache: Optional persistent cache for API responses
+        @param retry_policy: How to retry failed requests and how fast to send requests (default: RetryPolicy())
         """
         self.base_url: Final[str] = base_url
         self.script_path: Final[str] = script_path
@@ -33,28 +79,162 @@ class ForTrainingLib():
         self.index_url: Final[str] = f"{base_url}{script_path}/index.php"
         self.logger: logging.Logger = logging.getLogger('pywikitools.lib')
         self.session: requests.Session = requests.Session()
+        self.cache: Optional[ApiCache] = cache
+        self.retry_policy: RetryPolicy = retry_policy if retry_policy is not None \
+            else RetryPolicy(max_attempts=self.CONNECT_RETRIES)
+        self.rate_limiter: Optional[RateLimiter] = RateLimiter.for_host(base_url, self.retry_policy.requests_per_second)
+        # Statistics on our requests (see RequestCounters.as_dict())
+        self.counters: RequestCounters = RequestCounters()
+        # Latencies, transferred bytes and errors per kind of request (see Metrics)
+        self.metrics: Metrics = Metrics()
+        # Parsed English worksheets: (page, revision id) -> WorksheetSource. Revision id None: current revision
+        self._worksheet_sources: Dict[Tuple[str, Optional[int]], WorksheetSource] = {}
+        # Language names: target language (None: autonyms) -> (language code -> name). See get_language_names()
+        self._language_names: Dict[Optional[str], Dict[str, str]] = {}
+        self._memo_lock = threading.Lock()     # protects _worksheet_sources and _language_names
 
     def _get(self, params: Dict[str, str]) -> Any:
+        """
+        Query the API, using our cache if possible
+        @return JSON (as from response.json()) or {} in case of an error
+        """
+        if self.cache is None or not self.cache.is_cacheable(params):
+            return self._request(params)
+        titles: List[str] = ApiCache.get_titles(params)
+        page_states: Dict[str, str] = {}
+        if titles:
+            # Probe before requesting: if a page changes in between, the cached response will be invalid next time
+            page_states = self._get_page_states(titles)
+        cached = self.cache.get(params)
+        if cached is not None and cached[1] == page_states and len(page_states) == len(set(titles)):
+            self.logger.debug(f"Using cached response for API request with parameters {params}")
+            self.metrics.observe_request("apicache", ApiCache.get_kind(params), 0.0)
+            return cached[0]
+
+        response = self._request(params)
+        if response and "error" not in response and len(page_states) == len(set(titles)):
+            self.cache.put(params, response, page_states)
+        return response
+
+    def _run(self, steps: ApiSteps[T]) -> T:
+        """Send all API requests of a method decorated with @api_call and return its result"""
+        try:
+            params = next(steps)
+            while True:
+                params = steps.send(self._get(params))
+        except StopIteration as stop:
+            return stop.value
+
+    @api_call
+    def _get_page_states(self, titles: List[str]) -> ApiSteps[Dict[str, str]]:
+        """
+        Find out the current state of pages (last revision and when it was last touched) with cheap prop=info queries.
+        Used to check whether cached responses are still valid.
+        @return dictionary title -> state (titles as requested); incomplete in case of an error
+        """
+        assert self.cache is not None
+        result: Dict[str, str] = self.cache.get_page_states(titles)
+        unknown_titles: List[str] = [title for title in dict.fromkeys(titles) if title not in result]
+        for start in range(0, len(unknown_titles), self.MAX_TITLES):
+            chunk: List[str] = unknown_titles[start:start + self.MAX_TITLES]
+            json = yield {      # prop=info requests don't get cached so this goes to _request() directly
+                "action": "query",
+                "prop": "info",
+                "format": "json",
+                "titles": "|".join(chunk)
+            }
+            try:
+                requested: Dict[str, List[str]] = self._get_requested_titles(json)
+                for page in json["query"]["pages"].values():
+                    state = "missing"
+                    if "missing" not in page and "invalid" not in page:
+                        state = f"{page['lastrevid']}@{page['touched']}"
+                    for title in requested.get(page["title"], [page["title"]]):
+                        result[title] = state
+            except KeyError as err:
+                self.logger.warning(f"Unexpected error while probing state of {len(chunk)} pages: {err}")
+        self.cache.set_page_states({title: result[title] for title in unknown_titles if title in result})
+        return result
+
+    @staticmethod
+    def _get_requested_titles(json: Any) -> Dict[str, List[str]]:
+        """
+        The API normalizes titles (e.g. "Forgiving_Step_by_Step" -> "Forgiving Step by Step")
+        and reports pages with their normalized names: Map them back to the titles we requested
+        @return dictionary normalized title -> list of requested titles (only for titles that got normalized)
+        """
+        requested: Dict[str, List[str]] = {}
+        for entry in json["query"].get("normalized", []):
+            requested.setdefault(entry["to"], []).append(entry["from"])
+        return requested
+
+    def _request(self, params: Dict[str, str]) -> Any:
         """
         Wrapper around requests.Session.get to handle timeouts and other issues
+
+        Timeouts, connection errors, HTTP 429 / 503 and maxlag errors are retried as defined in self.retry_policy
         @return JSON (as from response.json()) or {} in case of an error
         """
-        retries = 0
-        while retries < self.CONNECT_RETRIES:
+        kind: str = ApiCache.get_kind(params)
+        if self.retry_policy.maxlag > 0:
+            params = {**params, "maxlag": str(self.retry_policy.maxlag)}
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                self._wait(self.rate_limiter.reserve())
+            self.counters.increment("requests")
+            if attempt > 1:
+                self.counters.increment("retries")
+            retry_after: Optional[str] = None
+            start: float = time.perf_counter()
+            size: int = 0
+            success: bool = False
             try:
                 response = self.session.get(self.api_url, params=params, timeout=self.TIMEOUT)
                 self.logger.debug(f"API Request with parameters {params}... {response.status_code}")
-                return response.json()
+                size = len(response.content or b"")
+                retry_after = response.headers.get("Retry-After")
+                if self.retry_policy.is_retryable_status(response.status_code):
+                    self.counters.increment("throttled")
+                    problem = f"Server responded with HTTP {response.status_code}"
+                else:
+                    json = response.json()
+                    if not self.retry_policy.is_maxlag_error(json):
+                        success = True
+                        return json
+                    self.counters.increment("maxlag")
+                    problem = f"Server is lagged: {json['error'].get('info', '')}"
             except requests.exceptions.Timeout:
-                retries += 1
-                self.logger.warning(f"Request timed out. This was attempt #{retries}. Trying again...")
+                self.counters.increment("timeouts")
+                problem = "Request timed out"
+            except requests.exceptions.ConnectionError as err:
+                self.counters.increment("connection_errors")
+                problem = f"Connection error: {err}"
             except requests.exceptions.JSONDecodeError as e:
                 self.logger.warning(f"Unexpected error: Received an invalid JSON: {e}")
+                self.counters.increment("failed")
                 return {}
+            finally:
+                self.metrics.observe_request("api", kind, time.perf_counter() - start, size, error=not success)
+
+            if attempt >= self.retry_policy.max_attempts:
+                self.logger.warning(f"{problem}. This was attempt #{attempt}.")
+                break
+            delay = self.retry_policy.get_delay(attempt, retry_after)
+            self.logger.warning(f"{problem}. This was attempt #{attempt}. Trying again in {delay:.1f}s...")
+            self._wait(delay)
 
-        self.logger.warning(f"Tried {retries} times to query {params}, all timed out. Giving up.")
+        self.logger.warning(f"Tried {attempt} times to query {params}, all failed. Giving up.")
+        self.counters.increment("failed")
         return {}
 
+    def _wait(self, seconds: float) -> None:
+        """Sleep (because of backoff or rate limiting) and count how long we waited"""
+        if seconds > 0:
+            self.counters.increment("waited", seconds)
+            time.sleep(seconds)
+
     def get_worksheet_list(self) -> List[str]:
         """
         Returns the list of all worksheets. For now hard-coded as this doesn't change very often. Could be changed to
@@ -96,9 +276,54 @@ class ForTrainingLib():
             return "rtl"
         return "ltr"
 
-    def get_language_name(self, language_code: str, translate_to: Optional[str] = None) -> Optional[str]:
+    @api_call
+    def get_language_names(self, translate_to: Optional[str] = None) -> ApiSteps[Dict[str, str]]:
+        """
+        Returns the names of all languages the mediawiki system knows
+        They are loaded with one meta=languageinfo request (plus continuations), which gives us the autonyms
+        and the names in the target language at the same time. The result is kept for the rest of the run
+        (and cached on disk if ForTrainingLib has an ApiCache, see ApiCache.DEFAULT_TTL["languageinfo"])
+        @param translate_to: target language of the names (None returns autonyms)
+        @return dictionary language code -> language name; empty in case of an error (also logs a warning)
+        """
+        with self._memo_lock:
+            if translate_to in self._language_names:
+                return self._language_names[translate_to]
+        uselang: str = translate_to if translate_to is not None else "en"
+        params: Dict[str, str] = {
+            "action": "query",
+            "meta": "languageinfo",
+            "liprop": "autonym|name",
+            "uselang": uselang,
+            "format": "json"}
+        autonyms: Dict[str, str] = {}
+        names: Dict[str, str] = {}
+        while True:
+            json = yield dict(params)
+            try:
+                for language_code, info in json["query"]["languageinfo"].items():
+                    if info.get("autonym"):
+                        autonyms[language_code] = info["autonym"]
+                    if info.get("name"):
+                        names[language_code] = info["name"]
+            except (KeyError, TypeError, AttributeError):
+                # Don't remember the failure: the next call will try again
+                self.logger.warning(f"fortraininglib.get_language_names({translate_to}): Unexpected error")
+                return {}
+            if "continue" not in json:
+                break
+            params.update(json["continue"])
+        with self._memo_lock:
+            # Languages without a name are looked up one by one later in get_language_name()
+            self._language_names.setdefault(None, {}).update(autonyms)
+            self._language_names.setdefault(uselang, {}).update(names)
+            return self._language_names[translate_to]
+
+    @api_call
+    def get_language_name(self, language_code: str, translate_to: Optional[str] = None) -> ApiSteps[Optional[str]]:
         """ Returns the name of a language as either the autonym or translated into another language
-        This function is calling the mediawiki {{#language:}} parser function and does no additional checks
+        The names of all languages are loaded at once with get_language_names(). Only if a language is missing there,
+        we call the mediawiki {{#language:}} parser function (without additional checks)
         See https://www.mediawiki.org/wiki/Help:Magic_words#Miscellaneous
         Examples:
             get_language_name('de') = 'Deutsch'
@@ -109,59 +334,85 @@ class ForTrainingLib():
         @return Language name if successful
         @return None in case of error (also logs a warning)
         """
+        names: Dict[str, str] = yield from self.get_language_names.__wrapped__(self, translate_to)
+        if language_code in names:
+            return names[language_code]
         lang_parameter: str = language_code
         if isinstance(translate_to, str):
             lang_parameter += '|' + translate_to
-        json = self._get({
+        json = yield {
             'action': 'parse',
             'text': '{{#language:' + lang_parameter + '}}',
             'contentmodel': 'wikitext',
             'format': 'json',
             'prop': 'text',
-            'disablelimitreport': 'true'})
+            'disablelimitreport': 'true'}
 
         try:
             langname = re.search('<p>([^<]*)</p>', json['parse']['text']['*'], re.MULTILINE)
             if langname:
-                return langname.group(1).strip()
+                with self._memo_lock:   # Don't ask again
+                    names[language_code] = langname.group(1).strip()
+                return names[language_code]
             self.logger.warning("fortraininglib.get_language_name({language_code}): Unexpected parser result")
             return None
         except KeyError:
             self.logger.warning("fortraininglib.get_language_name({language_code}): Unexpected error")
             return None
 
-    def get_file_url(self, filename: str) -> Optional[str]:
+    @api_call
+    def get_file_url(self, filename: str) -> ApiSteps[Optional[str]]:
         """ Return the full URL of the requested file
+        (use get_file_infos() if you need the URLs of several files)
 
         @return string with the URL or None in case of an error
         """
-        # request url for downloading odt-file
-
         self.logger.info(f"Retrieving URL of file {filename}... ")
-        json = self._get({
-            "action": "query",
-            "format": "json",
-            "prop": "imageinfo",
-            "titles": f"File:{filename}",
-            "iiprop": "url"
-        })
-
-        try:
-            # check if there is only one page in the answer and get its name
-            if len(list(json["query"]["pages"])) == 1:
-                page_number = list(json["query"]["pages"])[0]
-            else:
-                self.logger.warning(f"Couldn't get URL of {filename}: multiple pages detected")
-                return None
-
-            if int(page_number) == -1:
-                self.logger.info(f"Couldn't get URL of {filename}: file doesn't seem to exist.")
-                return None
-            return json["query"]["pages"][page_number]["imageinfo"][0]["url"]
-        except KeyError:
+        file_infos = yield from self.get_file_infos.__wrapped__(self, [filename])
+        file_info: Optional[Dict[str, Any]] = file_infos[filename]
+        if file_info is None:
+            self.logger.info(f"Couldn't get URL of {filename}: file doesn't seem to exist.")
             return None
-
-    def get_page_source(self, page: str, revision_id: Optional[int] = None) -> Optional[str]:
+        return file_info["url"]
+
+    @api_call
+    def get_file_infos(self, filenames: List[str]) -> ApiSteps[Dict[str, Optional[Dict[str, Any]]]]:
+        """
+        Return details on the current version of several files: url, size (in bytes), sha1,
+        mime (e.g. "application/pdf") and timestamp (of the upload, e.g. "2023-01-01T00:00:00Z")
+        Requests up to MAX_TITLES files with one API call.
+        @param filenames: names of the files (without "File:")
+        @return dictionary file name (as requested) -> dictionary with the details mentioned above
+                The value is None if the file doesn't exist or in case of an error
+        """
+        result: Dict[str, Optional[Dict[str, Any]]] = {filename: None for filename in filenames}
+        unique_filenames: List[str] = list(result)
+        for start in range(0, len(unique_filenames), self.MAX_TITLES):
+            titles: Dict[str, str] = {f"File:{filename}": filename
+                                      for filename in unique_filenames[start:start + self.MAX_TITLES]}
+            json = yield {
+                "action": "query",
+                "format": "json",
+                "prop": "imageinfo",
+                "iiprop": "url|size|sha1|mime|timestamp",
+                "titles": "|".join(titles)
+            }
+            try:
+                requested: Dict[str, List[str]] = self._get_requested_titles(json)
+                for page in json["query"]["pages"].values():
+                    if "imageinfo" not in page or len(page["imageinfo"]) == 0:
+                        continue
+                    details: Dict[str, Any] = {key: page["imageinfo"][0].get(key)
+                                               for key in ["url", "size", "sha1", "mime", "timestamp"]}
+                    for title in requested.get(page["title"], [page["title"]]):
+                        if title in titles:
+                            result[titles[title]] = details
+            except (KeyError, TypeError) as err:
+                self.logger.warning(f"Unexpected error in get_file_infos() for {len(titles)} files: {err}")
+        return result
+
+    @api_call
+    def get_page_source(self, page: str, revision_id: Optional[int] = None) -> ApiSteps[Optional[str]]:
         """
         Return the wikitext (source) of a page.
         @param revision_id Specify this to retrieve an older revision (default: retrieve current revision)
@@ -178,36 +429,75 @@ class ForTrainingLib():
         }
         if revision_id is not None:
             params['rvstartid'] = str(revision_id)
-        json = self._get(params)
+        json = yield params
         try:
             pageid = next(iter(json["query"]["pages"]))
             return json["query"]["pages"][pageid]['revisions'][0]['slots']['main']['*']
         except KeyError:
             return None
 
-    def get_page_html(self, page: str) -> Optional[str]:
+    @api_call
+    def get_page_sources(self, titles: List[str]) -> ApiSteps[Dict[str, Optional[str]]]:
+        """
+        Return the wikitext (source) of several pages (always the current revision).
+        Requests up to MAX_TITLES pages with one API call, so this is much faster than calling
+        get_page_source() for each page.
+        @return dictionary title -> page source, with the titles exactly as requested
+                The value is None if the page doesn't exist or in case of an error
+        """
+        result: Dict[str, Optional[str]] = {title: None for title in titles}
+        unique_titles: List[str] = list(result)
+        for start in range(0, len(unique_titles), self.MAX_TITLES):
+            chunk: List[str] = unique_titles[start:start + self.MAX_TITLES]
+            json = yield {
+                "action": "query",
+                "prop": "revisions",
+                "rvprop": "content",
+                "rvslots": "main",
+                "format": "json",
+                "titles": "|".join(chunk)
+            }
+            try:
+                requested: Dict[str, List[str]] = self._get_requested_titles(json)
+                for page in json["query"]["pages"].values():
+                    if "missing" in page or "invalid" in page or "revisions" not in page:
+                        continue
+                    content = page["revisions"][0]["slots"]["main"]["*"]
+                    for title in requested.get(page["title"], [page["title"]]):
+                        if title in result:
+                            result[title] = content
+            except KeyError as err:
+                self.logger.warning(f"Unexpected error in get_page_sources() for {len(chunk)} pages: {err}")
+        return result
+
+    @api_call
+    def get_page_html(self, page: str) -> ApiSteps[Optional[str]]:
         """
         Return the HTML representation of a page
         @return None on error
         """
-        json = self._get({
+        json = yield {
             "action": "parse",
             "page": page,
-            "format": "json"})
+            "format": "json"}
         try:
             return json["parse"]["text"]['*']
         except KeyError:
             return None
 
-    def get_translated_title(self, page: str, language_code: str, revision_id: Optional[int] = None) -> Optional[str]:
+    @api_call
+    def get_translated_title(self, page: str, language_code: str,
+                             revision_id: Optional[int] = None) -> ApiSteps[Optional[str]]:
         """
         Returns the translated title of a worksheet
         @return None on error
         """
-        return self.get_page_source(f"Translations:{page}/Page display title/{language_code}", revision_id)
+        return (yield from self.get_page_source.__wrapped__(
+            self, f"Translations:{page}/Page display title/{language_code}", revision_id))
 
+    @api_call
     def get_translated_unit(self, page: str, language_code: str, identifier: int,
-                            revision_id: Optional[int] = None) -> Optional[str]:
+                            revision_id: Optional[int] = None) -> ApiSteps[Optional[str]]:
         """
         Returns the translation of one translation unit of a page into a given language
 
@@ -220,68 +510,107 @@ class ForTrainingLib():
         (similar to https://www.4training.net/mediawiki/index.php?title=Translations:Hearing_from_God/2/de&oldid=26928 )
         @return the translated string or None if translation doesn't exist
         """
-        return self.get_page_source(f"Translations:{page}/{identifier}/{language_code}", revision_id)
+        return (yield from self.get_page_source.__wrapped__(
+            self, f"Translations:{page}/{identifier}/{language_code}", revision_id))
+
+    @staticmethod
+    def _normalize_title(page: str) -> str:
+        return page.replace("_", " ").strip()
+
+    def add_worksheet_source(self, page: str, content: str, revision_id: Optional[int] = None) -> WorksheetSource:
+        """
+        Parse the source of an English worksheet that was retrieved elsewhere (e.g. with get_page_sources())
+        and remember it so that get_worksheet_source() doesn't need to request it again.
+        @param revision_id: revision of content (None: it's the current revision)
+        """
+        source = WorksheetSource(page, content, revision_id)
+        with self._memo_lock:
+            self._worksheet_sources[(self._normalize_title(page), revision_id)] = source
+        return source
 
-    def get_pdf_name(self, page: str, language_code: str) -> Optional[str]:
+    @api_call
+    def get_worksheet_source(self, page: str, revision_id: Optional[int] = None) -> ApiSteps[Optional[WorksheetSource]]:
+        """
+        Return the parsed source of an English worksheet.
+        Each revision is requested and parsed only once; without revision_id we take the current revision
+        at the time of the first call (good enough for the run of a script)
+        @return None on error
+        """
+        key: Tuple[str, Optional[int]] = (self._normalize_title(page), revision_id)
+        with self._memo_lock:
+            if key in self._worksheet_sources:
+                return self._worksheet_sources[key]
+        params = {
+            "action": "query",
+            "prop": "revisions",
+            "rvlimit": "1",
+            "rvprop": "content|ids",
+            "rvslots": "main",
+            "format": "json",
+            "titles": page
+        }
+        if revision_id is not None:
+            params['rvstartid'] = str(revision_id)
+        json = yield params
+        try:
+            pageid = next(iter(json["query"]["pages"]))
+            revision = json["query"]["pages"][pageid]['revisions'][0]
+            content = revision['slots']['main']['*']
+        except KeyError:
+            return None
+        source = WorksheetSource(page, content, revision.get("revid", revision_id))
+        with self._memo_lock:
+            self._worksheet_sources[key] = source
+            if source.revision_id is not None:
+                self._worksheet_sources[(key[0], source.revision_id)] = source
+        return source
+
+    @api_call
+    def get_pdf_name(self, page: str, language_code: str) -> ApiSteps[Optional[str]]:
         """ returns the name of the PDF associated with that worksheet translated into a specific language
         @return None in case we didn't find it
         """
-        # we need to retrieve the page source of the English original and scan it for the name of the PDF file
-        content = self.get_page_source(page)
-        if not content:
+        # we need the English original with its PdfDownload template (see WorksheetSource)
+        source = yield from self.get_worksheet_source.__wrapped__(self, page)
+        if source is None:
             return None
-        # We have the page source, scan it for the PDFDownload template
-        # Example: {{PdfDownload|<translate><!--T:4--> Prayer.pdf</translate>}}
-        pdfdownload = re.search(r'{{PdfDownload[^}]*}', content)
-        if not pdfdownload:
-            return None
-        # Identify the PDF name
-        pdffile = re.search(r'[^ \n>]+\.pdf', pdfdownload.group())
-        if not pdffile:
+        pdf_download = source.get_download("pdf")
+        if pdf_download is None or not pdf_download[0].endswith(".pdf"):
             return None
         if language_code == 'en':    # we're already done
-            return pdffile.group()
-        translation_unit: int = 0   # the number of the translation unit containing the name of the PDF file
-        search_tu = re.search(r'--T:(\d+)--', pdfdownload.group())
-        if search_tu:
-            translation_unit = int(search_tu.group(1))
-        if translation_unit == 0:
+            return pdf_download[0]
+        if pdf_download[1] is None:
             self.logger.warning("Couldn't find number of translation unit containing the PDF file name")
             return None
 
         # now we just need to look up the translation of this translation unit
-        return self.get_page_source(f"Translations:{page}/{translation_unit}/{language_code}")
+        return (yield from self.get_page_source.__wrapped__(
+            self, f"Translations:{page}/{pdf_download[1]}/{language_code}"))
 
-    def get_version(self, page: str, language_code: str) -> Optional[str]:
+    @api_call
+    def get_version(self, page: str, language_code: str) -> ApiSteps[Optional[str]]:
         """ Returns the version of the page in the specified language
         @return None in case we didn't find it
         """
-        # we need to retrieve the page source of the English original and scan it for the name of the PDF file
-        content = self.get_page_source(page)
-        if not content:
-            return None
-        # We have the page source, scan it for the version template.
-        # Example: {{Version|<translate><!--T:6--> 1.1</translate>}}
-        version_template = re.search(r'{{Version[^}]*}}', content)
-        if not version_template:
+        # we need the English original with its version template (see WorksheetSource)
+        source = yield from self.get_worksheet_source.__wrapped__(self, page)
+        if source is None or source.version is None:
             return None
-        version = re.search(r'\d\.\d+\w?', version_template.group())
+        version = re.search(r'\d\.\d+\w?', source.version)
         if not version:
             return None
         if language_code == 'en':    # we're already done
             return version.group()
-        translation_unit: int = 0   # the number of the translation unit containing the version number
-        search_tu = re.search(r'--T:(\d+)--', version_template.group())
-        if search_tu:
-            translation_unit = int(search_tu.group(1))
-        if translation_unit == 0:
+        if source.version_unit is None:
             self.logger.warning("Couldn't find number of translation unit containing the version number")
             return None
 
         # now we just need to look up the translation of this translation unit
-        return self.get_page_source(f"Translations:{page}/{translation_unit}/{language_code}")
+        return (yield from self.get_page_source.__wrapped__(
+            self, f"Translations:{page}/{source.version_unit}/{language_code}"))
 
-    def list_page_translations(self, page: str, include_unfinished=False) -> Dict[str, TranslationProgress]:
+    @api_call
+    def list_page_translations(self, page: str, include_unfinished=False) -> ApiSteps[Dict[str, TranslationProgress]]:
         """ Returns all the existing translations of a page
         @param page the worksheet name
         @param include_unfinished whether unfinished translations should also be included
@@ -292,106 +621,269 @@ class ForTrainingLib():
                 In case of an error the map will be empty {}
                 if you're not interested in the unfinished translations, you're probably only interested in the keys
         """
-        counter = 1
-        while counter < 4:
-            # Tricky: Often we need to run this query for a second time so that all data is gathered.
-            if counter == 1:
+        progress = yield from self.get_translation_progress.__wrapped__(self, [page])
+        if page not in progress:
+            return {}
+        return {language_code: language_progress for language_code, language_progress in progress[page].items()
+                if include_unfinished or not language_progress.is_unfinished()}
+
+    @api_call
+    def get_translation_progress(self, pages: List[str], language_code: Optional[str] = None) \
+            -> ApiSteps[Dict[str, Dict[str, TranslationProgress]]]:
+        """
+        Returns the translation progress of several pages: for all translations with at least one translated unit
+        (including unfinished translations, see TranslationProgress.is_unfinished())
+
+        Without language_code this needs one request per page (meta=messagegroupstats).
+        With language_code we only look at this language and the English originals: then two requests
+        are enough for all pages (meta=languagestats)
+        Example: https://www.4training.net/mediawiki/api.php?action=query&meta=languagestats&lslanguage=de
+        @return dictionary page -> (language code -> TranslationProgress)
+                Pages are missing in the result in case of an error
+        """
+        result: Dict[str, Dict[str, TranslationProgress]] = {}
+        if language_code is None:
+            for page in pages:
                 self.logger.info(f"Retrieving translation information of {page}...")
-            else:
-                self.logger.info(f"Trying again to gather all data... (#{counter})")
+                entries = yield from self._query_with_continue({
+                    'action': 'query',
+                    'meta': 'messagegroupstats',
+                    'format': 'json',
+                    'mgsgroup': f"page-{page}"}, "messagegroupstats")
+                if entries is None:
+                    self.logger.warning(f"Error while trying to get all translations of {page}")
+                    continue
+                result[page] = {}
+                for entry in entries:
+                    if entry.get('translated', 0) > 0:
+                        result[page][entry['language']] = TranslationProgress(**entry)
+            return result
 
-            json = self._get({
+        # Group IDs of translatable pages are "page-" + page name (we may get them with spaces instead of underscores)
+        groups: Dict[str, str] = {f"page-{page}".replace("_", " "): page for page in pages}
+        for lang in dict.fromkeys(["en", language_code]):
+            self.logger.info(f"Retrieving translation information of all pages in language {lang}...")
+            entries = yield from self._query_with_continue({
                 'action': 'query',
-                'meta': 'messagegroupstats',
+                'meta': 'languagestats',
                 'format': 'json',
-                'mgsgroup': f"page-{page}"})
-            if 'continue' not in json:  # Now we have a complete response
-                break
-            counter += 1
-        if ('continue' in json) or (counter == 4):
-            self.logger.warning(f"Error while trying to get all translations of {page} - tried 3 times, giving up")
-            return {}
-
-        available_translations: Dict[str, TranslationProgress] = {}     # map of language codes -> translation progress
-        try:
-            for line in json['query']['messagegroupstats']:
-                if line['translated'] > 0:
-                    # Definition: a translation is unfinished if more than 4 units are neither translated nor fuzzy
-                    progress = TranslationProgress(**line)
-                    if not progress.is_unfinished() or include_unfinished:
-                        available_translations[line['language']] = progress
-        except KeyError:
-            return {}
-
-        return available_translations
+                'lslanguage': lang}, "languagestats")
+            if entries is None:
+                self.logger.warning(f"Error while trying to get translation progress of language {lang}")
+                return {}
+            for entry in entries:
+                group_page: Optional[str] = groups.get(str(entry.get('group', '')).replace("_", " "))
+                if group_page is not None and entry.get('translated', 0) > 0:
+                    result.setdefault(group_page, {})[lang] = TranslationProgress(**entry)
+        return result
+
+    def _query_with_continue(self, params: Dict[str, str], key: str) -> ApiSteps[Optional[List[Dict[str, Any]]]]:
+        """
+        Run a query and follow the continue tokens until we have all results
+        (to be used with yield from in API methods, see @api_call)
+        @param key: the results are in json["query"][key]
+        @return list of all results; None in case of an error
+        """
+        params = dict(params)
+        result: List[Dict[str, Any]] = []
+        while True:
+            json = yield dict(params)
+            try:
+                result.extend(json["query"][key])
+            except (KeyError, TypeError):
+                return None
+            if "continue" not in json:
+                return result
+            params.update(json["continue"])
 
-    def list_page_templates(self, page: str) -> List[str]:
+    @api_call
+    def list_page_templates(self, page: str) -> ApiSteps[List[str]]:
         """ Returns list of templates that are transcluded by a given page
         Strips potential language code at the end of a template (returns 'Template:Italic', not 'Template:Italic/en')
         See also https://translatewiki.net/w/api.php?action=help&modules=query%2Btemplates
         Example: https://www.4training.net/mediawiki/api.php?action=query&format=json&titles=Polish&prop=templates
         @return empty list in case of an error
         """
-        json = self._get({
-            'action': 'query',
-            'format': 'json',
-            'titles': page,
-            'prop': 'templates'})
-        try:
-            if len(list(json["query"]["pages"])) == 1:
-                pageid = list(json["query"]["pages"])[0]
-            else:
-                self.logger.warning("fortraininglib:list_page_templates: Error, multiple pages detected")
-                return []
-            result = []
-            for line in json['query']['pages'][pageid]['templates']:
-                if 'title' in line:
-                    language_code = line['title'].find('/')
-                    if language_code == -1:
-                        result.append(line['title'])
-                    else:
-                        result.append(line['title'][0:language_code])
-            return result
-        except KeyError:
-            return []
+        return (yield from self.list_templates.__wrapped__(self, [page]))[page]
 
-    def get_translation_units(self, page: str, language_code: str, limit: int = 500) -> Optional[TranslatedPage]:
+    @api_call
+    def list_templates(self, pages: List[str]) -> ApiSteps[Dict[str, List[str]]]:
         """
-        Get the translation units of a page translated into the language identified by language_code
-        Example: https://www.4training.net/mediawiki/api.php?action=query&format=json&list=messagecollection&mcgroup=page-Forgiving_Step_by_Step&mclanguage=de  # noqa: E501
-        @param limit: Maximum number of translation units to return (default limit in API is also 500)
-        @return None in case of an error
+        Returns the templates that are transcluded by several pages (see list_page_templates())
+        Requests up to MAX_TITLES pages with one API call (and follows the continue tokens if there are many templates)
+        @return dictionary page (as requested) -> list of templates; empty list for pages we couldn't query
         """
-        self.logger.info(f"Retrieving translation of {page} into language {language_code}...")
-        json = self._get({
+        result: Dict[str, List[str]] = {page: [] for page in pages}
+        unique_pages: List[str] = list(result)
+        for start in range(0, len(unique_pages), self.MAX_TITLES):
+            chunk: List[str] = unique_pages[start:start + self.MAX_TITLES]
+            params: Dict[str, str] = {
+                'action': 'query',
+                'format': 'json',
+                'titles': '|'.join(chunk),
+                'prop': 'templates',
+                'tllimit': 'max'}
+            requested: Dict[str, List[str]] = {}
+            while True:
+                json = yield dict(params)
+                try:
+                    requested.update(self._get_requested_titles(json))
+                    for page in json["query"]["pages"].values():
+                        templates: List[str] = [line['title'].split('/')[0]
+                                                for line in page.get('templates', []) if 'title' in line]
+                        for title in requested.get(page["title"], [page["title"]]):
+                            if title in result:
+                                result[title] = list(dict.fromkeys(result[title] + templates))
+                except (KeyError, TypeError) as err:
+                    self.logger.warning(f"Unexpected error in list_templates() for {len(chunk)} pages: {err}")
+                    break
+                if "continue" not in json:
+                    break
+                params.update(json["continue"])
+        return result
+
+    @api_call
+    def get_latest_revisions(self, titles: List[str]) -> ApiSteps[Dict[str, Optional[int]]]:
+        """
+        Returns the ids of the latest revisions of several pages (with cheap prop=info queries)
+        @return dictionary title (as requested) -> revision id; None if the page doesn't exist or in case of an error
+        """
+        result: Dict[str, Optional[int]] = {title: None for title in titles}
+        unique_titles: List[str] = list(result)
+        for start in range(0, len(unique_titles), self.MAX_TITLES):
+            chunk: List[str] = unique_titles[start:start + self.MAX_TITLES]
+            json = yield {
+                "action": "query",
+                "prop": "info",
+                "format": "json",
+                "titles": "|".join(chunk)
+            }
+            try:
+                requested: Dict[str, List[str]] = self._get_requested_titles(json)
+                for page in json["query"]["pages"].values():
+                    if "lastrevid" not in page:
+                        continue
+                    for title in requested.get(page["title"], [page["title"]]):
+                        if title in result:
+                            result[title] = int(page["lastrevid"])
+            except (KeyError, TypeError) as err:
+                self.logger.warning(f"Unexpected error in get_latest_revisions() for {len(chunk)} pages: {err}")
+        return result
+
+    def _query_translation_units(self, page: str, language_code: str, limit: int,
+                                 add_units: Callable[[List[TranslationUnit]], None]) -> ApiSteps[bool]:
+        """
+        Request the translation units of a page and follow the continue tokens until we have all of them
+        (to be used with yield from in API methods, see @api_call)
+        @param limit: Number of translation units to request at once (maximum of the API is 500)
+        @param add_units: is called with the translation units of each response as soon as it arrives
+        @return False in case of an error (also logs a warning)
+        """
+        params: Dict[str, str] = {
             "action": "query",
             "format": "json",
             "list": "messagecollection",
             "mcgroup": f"page-{page}",
             "mclanguage": language_code,
             "mclimit": str(limit)
-        })
+        }
+        while True:
+            json = yield dict(params)
+            try:
+                if "error" in json:
+                    if json["error"]["code"] == "badparameter":
+                        self.logger.warning(f"Couldn't get translation units: Page {page} doesn't exist.")
+                    else:
+                        self.logger.warning(f"Couldn't get translation units. Error: {json['error']['info']}")
+                    return False
+                units: List[TranslationUnit] = []
+                for tu in json["query"]["messagecollection"]:
+                    if str(tu["targetLanguage"]) != language_code:
+                        self.logger.warning(f"Unexpected error in get_translation_units({page}/{language_code}): "
+                                            f"{tu['key']} has targetLanguage {tu['targetLanguage']}")
+                        continue
+                    units.append(TranslationUnit(str(tu["key"]), language_code, str(tu["definition"]),
+                                                 tu["translation"]))   # tu["translation"] may be None
+            except (KeyError, TypeError) as err:
+                self.logger.warning(f"Unexpected error in get_translation_units({page}/{language_code}): {err}")
+                return False
+            add_units(units)
+            if "continue" not in json:
+                return True
+            params.update(json["continue"])
+
+    @api_call
+    def get_translation_units(self, page: str, language_code: str,
+                              limit: int = 500) -> ApiSteps[Optional[TranslatedPage]]:
+        """
+        Get the translation units of a page translated into the language identified by language_code
+        Example: https://www.4training.net/mediawiki/api.php?action=query&format=json&list=messagecollection&mcgroup=page-Forgiving_Step_by_Step&mclanguage=de  # noqa: E501
+        Large pages need several requests: We follow the continue tokens, so all translation units are returned.
+        @param limit: Number of translation units to request at once (maximum of the API is 500)
+        @return None in case of an error
+        """
+        self.logger.info(f"Retrieving translation of {page} into language {language_code}...")
+        result: List[TranslationUnit] = []
+        if not (yield from self._query_translation_units(page, language_code, limit, result.extend)):
+            return None
+        return TranslatedPage(page, language_code, result)
 
-        result = []
+    def iter_translation_units(self, page: str, language_code: str, limit: int = 500) -> Iterator[TranslationUnit]:
+        """
+        Like get_translation_units(), but yields the translation units as soon as their response arrives
+        (so processing can start before large pages are loaded completely)
+        In case of an error the iteration ends early (and a warning is logged)
+        """
+        self.logger.info(f"Retrieving translation of {page} into language {language_code}...")
+        arrived: List[TranslationUnit] = []
+        steps = self._query_translation_units(page, language_code, limit, arrived.extend)
         try:
-            if "error" in json:
-                if json["error"]["code"] == "badparameter":
-                    self.logger.warning(f"Couldn't get translation units: Page {page} doesn't exist.")
-                else:
-                    self.logger.warning(f"Couldn't get translation units. Error: {json['error']['info']}")
-                return None
-            for tu in json["query"]["messagecollection"]:
-                if str(tu["targetLanguage"]) != language_code:
-                    self.logger.warning(f"Unexpected error in get_translation_units({page}/{language_code}): "
-                                        f"{tu['key']} has targetLanguage {tu['targetLanguage']}")
-                    continue
-                translation_unit = TranslationUnit(str(tu["key"]), language_code, str(tu["definition"]),
-                                                   tu["translation"])   # tu["translation"] may be None
-                result.append(translation_unit)
-            return TranslatedPage(page, language_code, result)
-        except KeyError as err:
-            self.logger.warning(f"Unexpected error in get_translation_units({page}/{language_code}): {err}")
-            return None
+            params = next(steps)
+            while True:
+                params = steps.send(self._get(params))
+                yield from arrived
+                arrived.clear()
+        except StopIteration:
+            yield from arrived
+
+    def get_translation_units_for_languages(self, page: str, language_codes: List[str], workers: int = 4,
+                                            limit: int = 500) -> Dict[str, Optional[TranslatedPage]]:
+        """
+        Get the translation units of a page for several languages (requested in parallel)
+        @param workers: How many languages are requested at the same time
+        @return dictionary language code -> result of get_translation_units()
+        """
+        language_codes = list(dict.fromkeys(language_codes))
+        if workers <= 1 or len(language_codes) <= 1:
+            return {lang: self.get_translation_units(page, lang, limit) for lang in language_codes}
+        with ThreadPoolExecutor(max_workers=min(workers, len(language_codes))) as executor:
+            return dict(zip(language_codes, executor.map(
+                lambda lang: self.get_translation_units(page, lang, limit), language_codes)))
+
+    @api_call
+    def get_recent_changes(self, since: str) -> ApiSteps[Optional[List[Dict[str, Any]]]]:
+        """
+        Returns all edits, page creations and log events (e.g. uploads, deletions) since the given time
+        Example: https://www.4training.net/mediawiki/api.php?action=query&list=recentchanges&rcdir=newer&rcstart=2022-05-01T00:00:00Z  # noqa: E501
+        @param since: timestamp in ISO 8601 format, e.g. "2022-05-01T12:00:00Z"
+        @return list of changes (oldest first) as returned by the API, e.g.
+                {"type": "edit", "title": "Translations:Prayer/5/de", "timestamp": "2022-05-01T12:30:00Z", ...}
+                {"type": "log", "logtype": "upload", "title": "File:Gebet.pdf", ...}
+        @return None in case of an error
+        """
+        result = yield from self._query_with_continue({
+            "action": "query",
+            "format": "json",
+            "list": "recentchanges",
+            "rcdir": "newer",
+            "rcstart": since,
+            "rctype": "edit|new|log",
+            "rcprop": "title|timestamp|ids|loginfo",
+            "rclimit": "500"
+        }, "recentchanges")
+        if result is None:
+            self.logger.warning(f"Couldn't get recent changes since {since}")
+        return result
 
     def title_to_message(self, title: str) -> str:
         """Converts a mediawiki title to its corresponding system message
@@ -411,23 +903,25 @@ class ForTrainingLib():
         ret = ret.lower()
         return 'sidebar-' + ret
 
-    def expand_template(self, raw_template: str) -> str:
+    @api_call
+    def expand_template(self, raw_template: str) -> ApiSteps[str]:
         """
         TODO more documentation
         https://www.4training.net/mediawiki/api.php?action=expandtemplates&text={{CC0Notice/de|1.3}}&prop=wikitext&format=json
         """
-        json = self._get({
+        json = yield {
             "action": "expandtemplates",
             "text": raw_template,
             "prop": "wikitext",
-            "format": "json"})
+            "format": "json"}
         try:
             return json["expandtemplates"]["wikitext"]
         except KeyError:
             self.logger.warning(f"Warning: couldn't expand template {raw_template}")
             return ""
 
-    def get_cc0_notice(self, version: str, language_code: str) -> str:
+    @api_call
+    def get_cc0_notice(self, version: str, language_code: str) -> ApiSteps[str]:
         """
         Returns the translated CC0 notice (https://www.4training.net/Template:CC0Notice)
         @param version Version number to put in
@@ -435,7 +929,8 @@ class ForTrainingLib():
         @return The translated notice (for footers in worksheets)
         @return string with a TODO in case the translation doesn't exist
         """
-        expanded = self.expand_template("{{CC0Notice/" + language_code + "|" + version + "}}")
+        expanded = yield from self.expand_template.__wrapped__(
+            self, "{{CC0Notice/" + language_code + "|" + version + "}}")
         if "mw-translate-fuzzy" in expanded:
             self.logger.warning("Warning: Template:CC0Notice not correctly translated into this language. "
                                 "Please check https://www.4training.net/Template:CC0Notice")
@@ -445,18 +940,19 @@ class ForTrainingLib():
             return "TODO translate https://www.4training.net/Template:CC0Notice"
         return expanded
 
-    def count_jobs(self) -> int:
+    @api_call
+    def count_jobs(self) -> ApiSteps[int]:
         """
         Return the number of jobs in the mediawiki job queue
 
         https://www.4training.net/mediawiki/api.php?action=query&meta=siteinfo&siprop=statistics
         """
-        json = self._get({
+        json = yield {
             "action": "query",
             "format": "json",
             "meta": "siteinfo",
             "siprop": "statistics"
-        })
+        }
 
         try:
             return int(json["query"]["statistics"]["jobs"])
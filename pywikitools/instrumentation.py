@@ -0,0 +1,221 @@
+"""
+Measure where the time of a run goes: requests (mediawiki API, pywikibot, PDF downloads) and wall time of steps
+
+- Requests are recorded per source ("api", "pywikibot", "pdf") and kind (for the mediawiki API: the query module
+  or action, see ApiCache.get_kind(); for pywikibot: the action, e.g. "query" for loading and "edit" for saving).
+  For each we count requests, errors, transferred bytes and keep a histogram of the latencies.
+- Wall time is recorded per category and name, e.g. ("postprocessor", "WriteList") or ("language", "de")
+
+At the end of a run the results can be written as JSON report and as Prometheus textfile
+(for the textfile collector of the node exporter, see https://github.com/prometheus/node_exporter).
+
+Example:
+    metrics = Metrics()
+    with metrics.timer("phase", "query"):
+        ...
+    metrics.write_json("report.json")
+"""
+from contextlib import contextmanager
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Final, Iterator, List, Optional, Tuple
+
+
+class Histogram:
+    """Distribution of latencies (in seconds) with fixed buckets, similar to Prometheus histograms"""
+    BUCKETS: Final[Tuple[float, ...]] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+    __slots__ = ["counts", "total"]
+
+    def __init__(self):
+        self.counts: List[int] = [0] * len(self.BUCKETS)    # Number of observations for each bucket (not cumulative)
+        self.total: float = 0.0                             # Sum of all observations
+
+    def observe(self, seconds: float) -> None:
+        for index, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.total += seconds
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """@return list of (upper bound, number of observations <= upper bound) as in the Prometheus format"""
+        result: List[Tuple[str, int]] = []
+        count: int = 0
+        for bound, bucket_count in zip(self.BUCKETS, self.counts):
+            count += bucket_count
+            result.append(("+Inf" if math.isinf(bound) else str(bound), count))
+        return result
+
+
+class RequestStats:
+    """Statistics on one kind of requests"""
+    __slots__ = ["count", "errors", "bytes", "latency"]
+
+    def __init__(self):
+        self.count: int = 0
+        self.errors: int = 0
+        self.bytes: int = 0
+        self.latency: Histogram = Histogram()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "errors": self.errors, "bytes": self.bytes,
+                "seconds": round(self.latency.total, 3), "latency": dict(self.latency.cumulative())}
+
+
+class Metrics:
+    """
+    Collects all measurements of one run
+
+    Thread-safe: can be used by several threads in parallel
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Final[float] = time.time()
+        # (source, kind) -> statistics
+        self._requests: Dict[Tuple[str, str], RequestStats] = {}
+        # category -> (name -> seconds)
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def observe_request(self, source: str, kind: str, seconds: float, size: int = 0, error: bool = False) -> None:
+        """
+        Record one request
+        @param source: "api", "pywikibot", "pdf"...
+        @param kind: what kind of request, e.g. "revisions"
+        @param size: number of transferred bytes (if known)
+        @param error: did the request fail?
+        """
+        with self._lock:
+            stats = self._requests.get((source, kind))
+            if stats is None:
+                stats = RequestStats()
+                self._requests[(source, kind)] = stats
+            stats.count += 1
+            stats.errors += 1 if error else 0
+            stats.bytes += size
+            stats.latency.observe(seconds)
+
+    def add_time(self, category: str, name: str, seconds: float) -> None:
+        """Add wall time to what was recorded for this category and name before"""
+        with self._lock:
+            timings = self._timings.setdefault(category, {})
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, category: str, name: str) -> Iterator[None]:
+        """Measure the wall time of a with-block (see add_time())"""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(category, name, time.perf_counter() - start)
+
+    @contextmanager
+    def instrument_pywikibot(self) -> Iterator[None]:
+        """
+        Record all requests that pywikibot sends while the with-block runs (loading and saving pages...)
+        This works by wrapping pywikibot.data.api.Request.submit(), so it affects all threads
+        """
+        from pywikibot.data import api
+        original = api.Request.submit
+        metrics = self
+
+        def submit(request: api.Request) -> Any:
+            start: float = time.perf_counter()
+            error: bool = True
+            try:
+                result = original(request)
+                error = False
+                return result
+            finally:
+                metrics.observe_request("pywikibot", str(request.action), time.perf_counter() - start, error=error)
+
+        api.Request.submit = submit     # type: ignore[method-assign]
+        try:
+            yield
+        finally:
+            api.Request.submit = original   # type: ignore[method-assign]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        @return all measurements, e.g. {"started": ..., "duration": ...,
+            "requests": {"api": {"revisions": {"count": 12, "errors": 0, "bytes": 4567, "seconds": 3.2,
+                                               "latency": {"0.05": 0, "0.1": 3, ..., "+Inf": 12}}}},
+            "timings": {"postprocessor": {"WriteList": 1.5}}}
+        """
+        with self._lock:
+            requests: Dict[str, Dict[str, Any]] = {}
+            for (source, kind), stats in sorted(self._requests.items()):
+                requests.setdefault(source, {})[kind] = stats.as_dict()
+            return {"started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._started)),
+                    "duration": round(time.time() - self._started, 3),
+                    "requests": requests,
+                    "timings": {category: {name: round(seconds, 3) for name, seconds in timings.items()}
+                                for category, timings in self._timings.items()}}
+
+    def write_json(self, path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write all measurements as JSON report (see as_dict())
+        @param extra: more information to include in the report (e.g. RequestCounters.as_dict())
+        """
+        report: Dict[str, Any] = self.as_dict()
+        if extra is not None:
+            report.update(extra)
+        self._write_atomically(path, json.dumps(report, indent=2))
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def to_prometheus(self, prefix: str) -> str:
+        """@return all measurements in the Prometheus text format, all metric names start with prefix"""
+        lines: List[str] = []
+        with self._lock:
+            requests = sorted(self._requests.items())
+            timings = [(category, name, seconds) for category, values in self._timings.items()
+                       for name, seconds in values.items()]
+        for metric, description, value_type in [("requests_total", "Number of requests", "count"),
+                                                ("request_errors_total", "Number of failed requests", "errors"),
+                                                ("request_bytes_total", "Transferred bytes", "bytes")]:
+            lines.append(f"# HELP {prefix}_{metric} {description}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for (source, kind), stats in requests:
+                lines.append(f'{prefix}_{metric}{{source="{self._escape(source)}",kind="{self._escape(kind)}"}} '
+                             f'{getattr(stats, value_type)}')
+        lines.append(f"# HELP {prefix}_request_duration_seconds Latency of requests")
+        lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+        for (source, kind), stats in requests:
+            labels: str = f'source="{self._escape(source)}",kind="{self._escape(kind)}"'
+            for bound, count in stats.latency.cumulative():
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{labels}}} {stats.latency.total}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{labels}}} {stats.count}")
+        lines.append(f"# HELP {prefix}_duration_seconds Wall time of the steps of our run")
+        lines.append(f"# TYPE {prefix}_duration_seconds gauge")
+        for category, name, seconds in timings:
+            lines.append(f'{prefix}_duration_seconds{{category="{self._escape(category)}",'
+                         f'name="{self._escape(name)}"}} {seconds}')
+        lines.append(f"# HELP {prefix}_last_run_timestamp_seconds When the run started")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {self._started}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str) -> None:
+        """Write all measurements as Prometheus textfile (see to_prometheus())"""
+        self._write_atomically(path, self.to_prometheus(prefix))
+
+    @staticmethod
+    def _write_atomically(path: str, content: str) -> None:
+        """Readers (e.g. the node exporter) must never see a half-written file"""
+        handle, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as f:
+                f.write(content)
+            os.replace(temp_file, path)
+        except OSError:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
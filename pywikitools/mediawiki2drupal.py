@@ -22,7 +22,9 @@ import logging
 from typing import Final, Dict
 from bs4 import BeautifulSoup, Comment
 import configparser
+from pywikitools.apicache import ApiCache
 from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.retrypolicy import RetryPolicy
 
 
 class Mediawiki2Drupal():
@@ -207,7 +209,9 @@ if __name__ == "__main__":
     if config.has_option("mediawiki", "baseurl") and config.has_option("mediawiki", "scriptpath") and \
        config.has_option("mediawiki2drupal", "endpoint") and \
        config.has_option("mediawiki2drupal", "username") and config.has_option("mediawiki2drupal", "password"):
-        fortraininglib = ForTrainingLib(config.get("mediawiki", "baseurl"), config.get("mediawiki", "scriptpath"))
+        fortraininglib = ForTrainingLib(config.get("mediawiki", "baseurl"), config.get("mediawiki", "scriptpath"),
+                                        ApiCache.from_config(config),
+                                        RetryPolicy.from_config(config))
         mediawiki2drupal = Mediawiki2Drupal(fortraininglib, config.get("mediawiki2drupal", "endpoint"),
                                             config.get("mediawiki2drupal", "username"),
                                             config.get("mediawiki2drupal", "password"))
@@ -8,52 +8,111 @@ This contains our standards for filling metadata.
 TODO: Find a good place for our standards in a dedicated module and avoid duplicate code -
       they're also in TranslateODT._set_properties()
 """
+import io
 import re
+import time
+from typing import IO, TYPE_CHECKING, BinaryIO, Final, Tuple, Union, cast
+
 import pikepdf
-from pywikitools.fortraininglib import ForTrainingLib
 
-from pywikitools.resourcesbot.data_structures import PdfMetadataSummary, WorksheetInfo
+# Only imported where needed: read_metadata_timed() runs in the analysis processes of pdf_pipeline.py,
+# which then don't have to import pywikibot and requests
+if TYPE_CHECKING:
+    from pywikitools.fortraininglib import ForTrainingLib
+    from pywikitools.resourcesbot.data_structures import PdfMetadataSummary, WorksheetInfo
+
+
+class PdfMetadata:
+    """
+    The raw metadata properties of a PDF file, as read by read_metadata()
+
+    This is a simple picklable structure so that reading can happen in another process
+    (see resourcesbot/pdf_pipeline.py)
+    """
+    __slots__ = ["title", "subject", "keywords", "only_docinfo", "pdfa_status"]
+
+    def __init__(self, title: str, subject: str, keywords: str, only_docinfo: bool, pdfa_status: str):
+        """
+        @param only_docinfo: True if the PDF has no XMP metadata but only the deprecated DocInfo
+        @param pdfa_status: PDF/A conformance as reported by pikepdf (e.g. "1A"; "" if not PDF/A)
+        """
+        self.title: Final[str] = title
+        self.subject: Final[str] = subject
+        self.keywords: Final[str] = keywords
+        self.only_docinfo: Final[bool] = only_docinfo
+        self.pdfa_status: Final[str] = pdfa_status
+
+
+def read_metadata(source: Union[str, IO[bytes], io.RawIOBase]) -> PdfMetadata:
+    """Read title, subject, keywords and PDF/A status of a PDF file (XMP metadata if available, otherwise DocInfo)
+    For a file name this doesn't need any network access and can be run in a separate process.
+    @param source: path of the PDF file to read or a seekable file object (e.g. HttpRangeFile, see rangefile.py)
+    """
+    # pikepdf declares BinaryIO but only needs read(), seek() and tell()
+    pdf = pikepdf.open(source if isinstance(source, str) else cast(BinaryIO, source))
+    try:
+        only_docinfo = False
+        title = ""
+        subject = ""
+        keywords = ""
+        meta = pdf.open_metadata()
+        if meta:
+            # This PDF has proper XMP metadata
+            if "dc:title" in meta:
+                title = meta["dc:title"]
+            if "dc:description" in meta:
+                subject = meta["dc:description"]
+            if "pdf:Keywords" in meta:
+                keywords = meta["pdf:Keywords"]
+        else:
+            # This PDF has only DocInfo metadata (deprecated)
+            only_docinfo = True
+            if "/Title" in pdf.docinfo:
+                title = str(pdf.docinfo["/Title"])
+            if "/Subject" in pdf.docinfo:
+                subject = str(pdf.docinfo["/Subject"])
+            if "/Keywords" in pdf.docinfo:
+                keywords = str(pdf.docinfo["/Keywords"])
+        return PdfMetadata(str(title), str(subject), str(keywords), only_docinfo, str(meta.pdfa_status))
+    finally:
+        pdf.close()
 
 
-def check_metadata(fortraininglib: ForTrainingLib, filename: str, info: WorksheetInfo) -> PdfMetadataSummary:
+def read_metadata_timed(filename: str) -> Tuple[PdfMetadata, float]:
+    """Read the metadata and measure how long that took (runs in the analysis processes of pdf_pipeline.py)"""
+    start: float = time.perf_counter()
+    metadata = read_metadata(filename)
+    return metadata, time.perf_counter() - start
+
+
+def check_metadata(fortraininglib: "ForTrainingLib", filename: str, info: "WorksheetInfo") -> "PdfMetadataSummary":
+    """Check the PDF metadata whether it meets our standards (see evaluate_metadata())
+    @param filename: path of the PDF file to analyze
+    @param info: WorksheetInfo so that we can compare the PDF metadata with the expected results
+    """
+    return evaluate_metadata(fortraininglib, read_metadata(filename), info)
+
+
+def evaluate_metadata(fortraininglib: "ForTrainingLib", metadata: PdfMetadata,
+                      info: "WorksheetInfo") -> "PdfMetadataSummary":
     """Check the PDF metadata whether it meets our standards. This involves:
     - title must start with translated title (identical if there is no subheadline)
     - subject must start with English worksheet name and end with correct language names
     - keywords must include version number
 
     Extracts the version number as well ("" indicates an error)
-    @param filename: path of the PDF file to analyze
+    @param metadata: the properties of the PDF file (see read_metadata())
     @param info: WorksheetInfo so that we can compare the PDF metadata with the expected results
     """
-    pdf = pikepdf.open(filename)
+    from pywikitools.resourcesbot.data_structures import PdfMetadataSummary
     version = ""
     metadata_correct = True
-    only_docinfo = False
     warnings = ""
-    title = ""
-    subject = ""
-    keywords = ""
-    if (meta := pdf.open_metadata()):
-        # This PDF has proper XMP metadata
-        if "dc:title" in meta:
-            title = meta["dc:title"]
-        if "dc:description" in meta:
-            subject = meta["dc:description"]
-        if "pdf:Keywords" in meta:
-            keywords = meta["pdf:Keywords"]
-    else:
-        # This PDF has only DocInfo metadata (deprecated)
-        only_docinfo = True
-        if "/Title" in pdf.docinfo:
-            title = str(pdf.docinfo["/Title"])
-        if "/Subject" in pdf.docinfo:
-            subject = str(pdf.docinfo["/Subject"])
-        if "/Keywords" in pdf.docinfo:
-            keywords = str(pdf.docinfo["/Keywords"])
+    keywords = metadata.keywords
 
     # Little hack: Let's not care if it's God’s Story or God's Story
-    title = title.replace("’", "'")
-    subject = subject.replace("’", "'")
+    title = metadata.title.replace("’", "'")
+    subject = metadata.subject.replace("’", "'")
 
     # Check title metadata
     expected_title = info.title
@@ -92,4 +151,4 @@ def check_metadata(fortraininglib: ForTrainingLib, filename: str, info: Workshee
         metadata_correct = False
         warnings += f"Couldn't extract version from keyword string '{keywords}'"
 
-    return PdfMetadataSummary(version, metadata_correct, meta.pdfa_status == "1A", only_docinfo, warnings)
+    return PdfMetadataSummary(version, metadata_correct, metadata.pdfa_status == "1A", metadata.only_docinfo, warnings)
@@ -0,0 +1,70 @@
+"""
+Persistent cache for the metadata of PDF files, keyed by the SHA1 hash of the file content
+
+The mediawiki system tells us the SHA1 hash of every uploaded file (imageinfo). If we already analyzed
+a file with the same hash, we don't need to download it again: its metadata can't have changed.
+
+We cache the raw metadata (see PdfMetadata) and not the result of checking it against our standards,
+because that result also depends on the worksheet (e.g. its translated title), which may have changed.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Final, Optional
+
+from pywikitools.pdftools.metadata import PdfMetadata
+
+
+class PdfMetadataCache:
+    """
+    Stores PdfMetadata in a SQLite file
+
+    Thread-safe: can be used by several threads in parallel
+    """
+    # Entries that weren't used for 90 days are removed (the file was probably replaced or deleted)
+    MAX_AGE: Final[int] = 90 * 24 * 3600
+
+    def __init__(self, path: str):
+        """
+        @param path: SQLite file to store the cache in (will be created if necessary)
+        """
+        self.logger = logging.getLogger('pywikitools.pdftools.metadata_cache')
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (sha1 TEXT PRIMARY KEY, metadata TEXT, "
+                                     "accessed REAL)")
+            deleted = self._connection.execute("DELETE FROM metadata WHERE accessed < ?",
+                                               (time.time() - self.MAX_AGE,)).rowcount
+        if deleted > 0:
+            self.logger.debug(f"Removed {deleted} outdated entries from PDF metadata cache")
+
+    def get(self, sha1: str) -> Optional[PdfMetadata]:
+        """
+        @param sha1: SHA1 hash of the PDF file (as given by the mediawiki API)
+        @return cached metadata; None if we don't know this file
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT metadata FROM metadata WHERE sha1 = ?", (sha1,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE metadata SET accessed = ? WHERE sha1 = ?", (time.time(), sha1))
+        try:
+            values = json.loads(row[0])
+            return PdfMetadata(values["title"], values["subject"], values["keywords"],
+                               values["only_docinfo"], values["pdfa_status"])
+        except (ValueError, KeyError, TypeError) as err:
+            self.logger.warning(f"Invalid entry in PDF metadata cache for {sha1}: {err}")
+            return None
+
+    def put(self, sha1: str, metadata: PdfMetadata) -> None:
+        """Store the metadata of a PDF file with this SHA1 hash"""
+        encoded = json.dumps({name: getattr(metadata, name) for name in PdfMetadata.__slots__})
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                                     (sha1, encoded, time.time()))
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,139 @@
+"""
+Read-only file object for a file on a web server, fetching only the parts that are actually read (HTTP Range requests)
+
+pikepdf can open such a file object: it only reads the trailer, the cross-reference table and the objects
+that are accessed. So reading the metadata of a large PDF needs only a small fraction of the file.
+
+Example:
+    with HttpRangeFile("https://www.4training.net/mediawiki/images/1/1a/Prayer.pdf", requests.Session()) as file:
+        metadata = read_metadata(file)
+"""
+import io
+import re
+from typing import Dict, Final, Optional, Tuple
+
+import requests
+
+
+class RangeRequestsNotSupported(Exception):
+    """The server doesn't support HTTP Range requests (so we need to download the whole file)"""
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Seekable, read-only file object that fetches blocks of the remote file on demand and keeps them in memory
+
+    Not thread-safe (use one object per thread)
+    """
+    BLOCK_SIZE: Final[int] = 64 * 1024
+    TIMEOUT: Final[int] = 30
+
+    def __init__(self, url: str, session: requests.Session, block_size: int = BLOCK_SIZE):
+        """
+        Already fetches the last block of the file (that's where reading a PDF starts)
+        @param url: full URL of the file
+        @param session: for sending the requests
+        @param block_size: how many bytes we fetch at least with one request
+        @raise RangeRequestsNotSupported: if the server doesn't support range requests
+        @raise requests.RequestException: on network errors
+        """
+        super().__init__()
+        self.url: Final[str] = url
+        self._session: Final[requests.Session] = session
+        self._block_size: Final[int] = block_size
+        self._blocks: Dict[int, bytes] = {}     # number of block -> content
+        self._position: int = 0
+        self.bytes_received: int = 0            # How many bytes we fetched so far
+        self.requests: int = 0                  # How many requests we sent so far
+        response = self._request(f"bytes=-{block_size}")
+        start, size = self._parse_content_range(response)
+        self.size: Final[int] = size
+        if start % block_size == 0:
+            self._store(start // block_size, response.content)
+        else:
+            # The last block is the incomplete one: split up what we received accordingly
+            first_block = start // block_size + 1
+            self._store(first_block, response.content[first_block * block_size - start:])
+
+    def _request(self, byte_range: str) -> requests.Response:
+        """Send a range request and make sure that we got a partial response"""
+        self.requests += 1
+        response = self._session.get(self.url, headers={"Range": byte_range}, timeout=self.TIMEOUT, stream=True)
+        if response.status_code != 206:
+            response.close()
+            if response.status_code in [200, 416]:
+                raise RangeRequestsNotSupported(f"{self.url}: HTTP {response.status_code} for range {byte_range}")
+            response.raise_for_status()
+            raise RangeRequestsNotSupported(f"{self.url}: Unexpected HTTP {response.status_code}")
+        self.bytes_received += len(response.content)
+        return response
+
+    @staticmethod
+    def _parse_content_range(response: requests.Response) -> Tuple[int, int]:
+        """
+        Evaluate the Content-Range header (e.g. "bytes 0-65535/1048576")
+        @return Tuple of the position of the first received byte and the total file size
+        """
+        handler = re.fullmatch(r"bytes\s+(\d+)-(\d+)/(\d+)", response.headers.get("Content-Range", "").strip())
+        if not handler or int(handler.group(2)) - int(handler.group(1)) + 1 != len(response.content):
+            raise RangeRequestsNotSupported(f"Invalid Content-Range header: {response.headers.get('Content-Range')}")
+        return int(handler.group(1)), int(handler.group(3))
+
+    def _store(self, first_block: int, content: bytes) -> None:
+        """Split received content into blocks and keep them"""
+        for offset in range(0, len(content), self._block_size):
+            self._blocks[first_block + offset // self._block_size] = content[offset:offset + self._block_size]
+
+    def _fetch(self, first_block: int, last_block: int) -> None:
+        """Make sure all blocks between first_block and last_block (inclusive) are available"""
+        block = first_block
+        while block <= last_block:
+            if block in self._blocks:
+                block += 1
+                continue
+            # Fetch all consecutive missing blocks with one request
+            end_block = block
+            while end_block + 1 <= last_block and end_block + 1 not in self._blocks:
+                end_block += 1
+            start = block * self._block_size
+            end = min((end_block + 1) * self._block_size, self.size) - 1
+            response = self._request(f"bytes={start}-{end}")
+            if self._parse_content_range(response)[0] != start:
+                raise RangeRequestsNotSupported(f"{self.url}: Received other range than requested")
+            self._store(block, response.content)
+            block = end_block + 1
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if self._position < 0:
+            raise ValueError("Negative seek position")
+        return self._position
+
+    def readinto(self, buffer) -> Optional[int]:    # type: ignore[override]
+        length = min(len(buffer), self.size - self._position)
+        if length <= 0:
+            return 0
+        first_block = self._position // self._block_size
+        last_block = (self._position + length - 1) // self._block_size
+        self._fetch(first_block, last_block)
+        data = b"".join(self._blocks[block] for block in range(first_block, last_block + 1))
+        offset = self._position - first_block * self._block_size
+        buffer[:length] = data[offset:offset + length]
+        self._position += length
+        return length
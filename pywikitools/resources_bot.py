@@ -21,8 +21,15 @@ Main steps:
 Command line options:
     --lang LANGUAGECODE: only look at this one language (significantly faster)
     -l, --loglevel: change logging level (standard: warning; other options: debug, info)
-    --rewrite-all: Rewrite all language information pages
+    --rewrite TYPE: Rewrite pages even if nothing changed (without it only what changed gets written).
+                    Every TYPE rewrites the summary, additionally:
+                    all: language information pages; list: language reports; report: only the summary;
+                    html: HTML export; sidebar: sidebar system messages
     --read-from-cache: Read from the JSON structure instead of querying the current status of all worksheets
+    --incremental: Read from the JSON structure and only query what changed since the last run (much faster)
+    --read-from-snapshot: Read from the local snapshot of the last run (doesn't load anything from the server)
+    --sidebar-dry-run: Don't write the sidebar system messages, only report which ones would change
+                       (combine with --rewrite sidebar -l info to check all of them)
 
 Logging:
     If configured in config.ini (see config.example.ini), output will be logged to three different files
@@ -71,7 +78,14 @@ def parse_arguments() -> ResourcesBot:
     parser.add_argument('--lang', help='run script for only one language')
     parser.add_argument('-l', '--loglevel', choices=log_levels, default="warning", help='set loglevel for the script')
     parser.add_argument('--read-from-cache', action='store_true', help='Read results from json cache from the server')
-    parser.add_argument('--rewrite', choices=rewrite_types, default="all", action='store_true', help='set rewrite type')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only query worksheets that changed since the last run')
+    parser.add_argument('--read-from-snapshot', action='store_true',
+                        help='Read results from the local snapshot of the last run (works offline)')
+    parser.add_argument('--rewrite', choices=rewrite_types, default=None,
+                        help='rewrite pages of this type even if nothing changed')
+    parser.add_argument('--sidebar-dry-run', action='store_true',
+                        help="Don't write sidebar system messages, only report what would change")
 
     args = parser.parse_args()
     limit_to_lang = None
@@ -82,8 +96,9 @@ def parse_arguments() -> ResourcesBot:
     numeric_level = getattr(logging, args.loglevel.upper(), None)
     assert isinstance(numeric_level, int)
     set_loglevel(config, numeric_level)
-    return ResourcesBot(config, limit_to_lang=limit_to_lang, rewrite_all=args.rewrite_all,
-                        read_from_cache=args.read_from_cache)
+    return ResourcesBot(config, limit_to_lang=limit_to_lang, rewrite_type=args.rewrite,
+                        read_from_cache=args.read_from_cache, incremental=args.incremental,
+                        read_from_snapshot=args.read_from_snapshot, sidebar_dry_run=args.sidebar_dry_run)
 
 
 def set_loglevel(config: ConfigParser, loglevel: int):
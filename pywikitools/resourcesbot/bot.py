@@ -1,20 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import os
-import re
 import logging
+import sqlite3
+import time
 import json
 from configparser import ConfigParser
-from typing import List, Optional, Dict, Tuple
+from typing import Any, Final, Iterator, List, Optional, Dict, Set, Tuple, Union
 import pywikibot
 
+from pywikitools.apicache import ApiCache
 from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.instrumentation import Metrics
+from pywikitools.retrypolicy import RetryPolicy
+from pywikitools.worksheet_source import WorksheetSource
 from pywikitools.pdftools.metadata import check_metadata
 from pywikitools.resourcesbot.changes import ChangeLog
 from pywikitools.resourcesbot.consistency_checks import ConsistencyCheck
+from pywikitools.resourcesbot.diff import LanguageInfoDiff
 from pywikitools.resourcesbot.export_html import ExportHTML
 from pywikitools.resourcesbot.export_repository import ExportRepository
+from pywikitools.resourcesbot.page_writer import PageWriter
+from pywikitools.resourcesbot.pdf_pipeline import PdfPipeline
+from pywikitools.resourcesbot.scheduler import PostProcessingScheduler
+from pywikitools.resourcesbot.snapshot import Snapshot
 from pywikitools.resourcesbot.write_lists import WriteList
-from pywikitools.resourcesbot.data_structures import FileInfo, WorksheetInfo, LanguageInfo, \
-                                                     DataStructureEncoder, json_decode
+from pywikitools.resourcesbot.data_structures import FileInfo, TranslationProgress, WorksheetInfo, LanguageInfo, \
+                                                     language_info_from_json, language_info_to_json
 from pywikitools.resourcesbot.write_report import WriteReport
 from pywikitools.resourcesbot.write_sidebar_messages import WriteSidebarMessages
 from pywikitools.resourcesbot.write_summary import WriteSummary
@@ -38,13 +51,21 @@ class ForTrainingFamily(pywikibot.family.Family):  # noqa: D101
 
 class ResourcesBot:
     """Contains all the logic of our bot"""
+    # Where we store the state of our last run (needed for incremental runs)
+    STATE_PAGE: Final[str] = "4training:resourcesbot.json"
 
-    def __init__(self, config: ConfigParser, limit_to_lang: Optional[str] = None, rewrite_type: str = 'rewrite-all',
-                 read_from_cache: bool = False):
+    def __init__(self, config: ConfigParser, limit_to_lang: Optional[str] = None, rewrite_type: Optional[str] = None,
+                 read_from_cache: bool = False, incremental: bool = False, read_from_snapshot: bool = False,
+                 sidebar_dry_run: bool = False):
         """
         @param limit_to_lang: limit processing to one language (string with a language code)
-        @param rewrite_type: Set rewrite type. Default is rewrite all language information regardless of changes
+        @param rewrite_type: Rewrite pages of this type regardless of changes (see resources_bot.py).
+                             Default: only write what changed
         @param read_from_cache: Read from json cache from the mediawiki system (don't query individual worksheets)
+        @param incremental: Read from json cache and only query worksheets that changed since our last run
+        @param read_from_snapshot: Read from our local snapshot (see snapshot.py) without loading anything
+                                   from the mediawiki system
+        @param sidebar_dry_run: Don't write sidebar system messages, only report what would change
         """
         # read-only list of download file types
         self._file_types = ["pdf", "odt", "odg", "printPdf"]
@@ -65,15 +86,26 @@ class ResourcesBot:
             os.makedirs(self._config.get("Paths", "temp"))
 
         self.fortraininglib: ForTrainingLib = ForTrainingLib(self._config.get('mediawiki', 'baseurl'),
-                                                             self._config.get('mediawiki', 'scriptpath'))
+                                                             self._config.get('mediawiki', 'scriptpath'),
+                                                             ApiCache.from_config(self._config),
+                                                             RetryPolicy.from_config(self._config))
 
         self._limit_to_lang: Optional[str] = limit_to_lang
         self._read_from_cache: bool = read_from_cache
-        self._rewrite_type: str = rewrite_type
+        self._incremental: bool = incremental
+        self._read_from_snapshot: bool = read_from_snapshot
+        self._sidebar_dry_run: bool = sidebar_dry_run
+        self._rewrite_type: Optional[str] = rewrite_type
+        # Number of worksheets that are queried in parallel (1 means querying one worksheet after the other)
+        self._workers: int = max(1, self._config.getint("resourcesbot", "workers", fallback=1))
         if self._limit_to_lang is not None:
             self.logger.info(f"Parameter lang is set, limiting processing to language {limit_to_lang}")
         if self._read_from_cache:
             self.logger.info("Parameter --read-from-cache is set, reading from JSON...")
+        if self._incremental:
+            self.logger.info("Parameter --incremental is set, only querying what changed since the last run")
+        if self._read_from_snapshot:
+            self.logger.info("Parameter --read-from-snapshot is set, reading from local snapshot...")
         if self._rewrite_type:
             self.logger.info(f'Parameter {rewrite_type} is set')
 
@@ -83,41 +115,64 @@ class ResourcesBot:
         # Changes since the last run (will be filled after gathering of all information is done)
         self._changelog: Dict[str, ChangeLog] = {}
 
-    def run(self):
-        if self._read_from_cache:
-            try:
-                language_list: List[str] = []   # List of languages to be read from cache
-                if self._limit_to_lang is None:
-                    page = pywikibot.Page(self.site, "4training:languages.json")
-                    if not page.exists():
-                        raise RuntimeError("Couldn't load list of languages from 4training:languages.json")
-                    language_list = json.loads(page.text)
-                    assert isinstance(language_list, list)
-                else:
-                    language_list.append(self._limit_to_lang)
-                    language_list.append("en")  # We need the English infos for LanguagePostProcessors
-
-                for lang in language_list:      # Now we read the details for each language
-                    self.logger.info(f"Reading details for language {lang} from cache...")
-                    page = pywikibot.Page(self.site, f"4training:{lang}.json")
-                    if not page.exists():
-                        raise RuntimeError(f"Couldn't load from cache for language {lang}")
-                    language_info = json.loads(page.text, object_hook=json_decode)
-                    assert isinstance(language_info, LanguageInfo)
-                    assert language_info.language_code == lang
-                    self._result[lang] = language_info
-            except AssertionError:
-                raise RuntimeError("Unexpected error while parsing JSON data from cache.")
+        # Incremental runs: languages that we queried again (None if we queried everything or nothing)
+        self._changed_languages: Optional[Set[str]] = None
+        # Translated files that are referenced but don't exist (yet): file name -> (worksheet, language code)
+        # We need to remember them so that an incremental run notices when they get uploaded later
+        self._missing_files: Dict[str, Tuple[str, str]] = {}
+        # Translation progress fetched in advance for all worksheets: worksheet -> (language code -> progress)
+        # (only with --lang, otherwise each worksheet fetches its own progress in _query_translations())
+        self._translation_progress: Dict[str, Dict[str, TranslationProgress]] = {}
+        # JSON of each language as we read it from the mediawiki system in the beginning (see _load_from_cache())
+        # so that _sync_and_compare() doesn't need to load it again
+        self._stored_json: Dict[str, str] = {}
+        # Downloads and analyzes PDF files in the background while we're querying all worksheets
+        # (None: _add_file_type() analyzes PDF files immediately)
+        self._pdf_pipeline: Optional[PdfPipeline] = None
+        # Post-processors that failed: language code -> names of post-processors (see PostProcessingScheduler)
+        self._postprocessing_failures: Dict[str, List[str]] = {}
+        # Loads (in batches) and saves all pages we write, shared with the post-processors
+        self._page_writer: PageWriter = PageWriter(self.site)
 
-        else:
-            self._result["en"] = LanguageInfo("en", "English")
-            for worksheet in self.fortraininglib.get_worksheet_list():
-                # Gather all data (this takes quite some time!)
-                self._query_translations(worksheet)
+    def run(self):
+        """Do everything. In the end we write a report on where the time went (see instrumentation.py)"""
+        completed: bool = False
+        try:
+            with self.fortraininglib.metrics.instrument_pywikibot():
+                self._run()
+            completed = True
+        finally:
+            self._write_run_report(completed)
+
+    def _run(self) -> None:
+        metrics: Metrics = self.fortraininglib.metrics
+        phase_start: float = time.perf_counter()
+        # Remember when we started: an incremental run afterwards needs to look at all changes since then.
+        # Go back a few minutes in case our clock isn't exactly in sync with the server
+        run_start: str = (datetime.now(timezone.utc) - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        state: Optional[Dict[str, Any]] = None
+        # Did we just read our stored data (instead of querying anything)?
+        read_only: bool = self._read_from_cache or self._read_from_snapshot
+        if self._read_from_snapshot:
+            self._load_from_snapshot()
+        elif self._read_from_cache:
+            self._load_from_cache()
+        elif self._incremental:
+            state = self._load_state()
+            if state is not None:
+                self._load_from_cache()
+                state = self._query_changed_worksheets(state)
+        if state is None and not read_only:
+            self._result = {"en": LanguageInfo("en", "English")}
+            self._changed_languages = None
+            self._missing_files = {}
+            self._query_all_worksheets()
+            state = {"timestamp": run_start, "rcid": 0}
+        metrics.add_time("phase", "gather", time.perf_counter() - phase_start)
 
         # That shouldn't be necessary but for some reasons the script sometimes failed with WARNING from pywikibot:
         # "No user is logged in on site 4training:en" -> better check and try to log in if necessary
-        if not self.site.logged_in():
+        if not self._read_from_snapshot and not self.site.logged_in():
             self.logger.info("We're not logged in. Trying to log in...")
             self.site.login()
             if not self.site.logged_in():
@@ -126,58 +181,332 @@ class ResourcesBot:
                 raise RuntimeError("Login with pywikibot failed.")
 
         # Find out what has been changed since our last run
+        phase_start = time.perf_counter()
+        if not read_only:
+            self._preload_own_pages()
         for lang, language_info in self._result.items():
-            self._changelog[lang] = self._sync_and_compare(language_info) if not self._read_from_cache else ChangeLog()
-        if not self._read_from_cache and self._limit_to_lang is None:
+            if read_only or (self._changed_languages is not None and lang not in self._changed_languages):
+                self._changelog[lang] = ChangeLog()     # We didn't query anything new for this language
+            else:
+                self._changelog[lang] = self._sync_and_compare(language_info)
+        if not self._read_from_snapshot:
+            self._save_snapshot()
+        if not read_only and self._limit_to_lang is None:
             self._save_languages_list()
             self._save_number_of_languages()        # TODO move this to a GlobalPostProcessor
-
-        # Run all LanguagePostProcessors
-        write_list = WriteList(self.fortraininglib, self.site,
-                               self._config.get("resourcesbot", "username", fallback=""),
-                               self._config.get("resourcesbot", "password", fallback=""),
-                               True if self._rewrite_type == 'all' else False)
-        write_report = WriteReport(self.fortraininglib, self.site, True if self._rewrite_type == 'list' else False)
+            assert state is not None
+            self._save_state(state)
+        metrics.add_time("phase", "sync", time.perf_counter() - phase_start)
+
+        # Run all post-processors (the scheduler finds out the order from their dependencies)
+        phase_start = time.perf_counter()
+        scheduler = PostProcessingScheduler(self._config.getint("resourcesbot", "postprocessing_workers", fallback=1),
+                                            metrics)
+        scheduler.add(ConsistencyCheck(self.fortraininglib))
+        scheduler.add(ExportHTML(self.fortraininglib, self._config.get("Paths", "htmlexport", fallback=""),
+                                 True if self._rewrite_type == 'html' else False,
+                                 self._config.getint("resourcesbot", "html_export_workers", fallback=4)))
+        scheduler.add(ExportRepository(self._config.get("Paths", "htmlexport", fallback="")))
+        scheduler.add(WriteList(self.fortraininglib, self.site,
+                                self._config.get("resourcesbot", "username", fallback=""),
+                                self._config.get("resourcesbot", "password", fallback=""),
+                                True if self._rewrite_type == 'all' else False, page_writer=self._page_writer))
+        scheduler.add(WriteReport(self.fortraininglib, self.site, True if self._rewrite_type == 'list' else False,
+                                  page_writer=self._page_writer))
         write_sidebar_messages = WriteSidebarMessages(self.fortraininglib, self.site,
-                                                      True if self._rewrite_type == 'sidebar' else False)
-        consistency_check = ConsistencyCheck(self.fortraininglib)
-        export_html = ExportHTML(self.fortraininglib, self._config.get("Paths", "htmlexport", fallback=""),
-                                 True if self._rewrite_type == 'html' else False)
-        export_repository = ExportRepository(self._config.get("Paths", "htmlexport", fallback=""))
-        assert "en" in self._result
-        for lang in self._result:
-            consistency_check.run(self._result[lang], self._result["en"], ChangeLog())
-            export_html.run(self._result[lang], self._result["en"], self._changelog[lang])
-            export_repository.run(self._result[lang], self._result["en"], self._changelog[lang])
-            write_list.run(self._result[lang], self._result["en"], self._changelog[lang])
-            write_report.run(self._result[lang], self._result["en"], self._changelog[lang])
-            write_sidebar_messages.run(self._result[lang], self._result["en"], self._changelog[lang])
-
-        # Now run all GlobalPostProcessors
+                                                      True if self._rewrite_type == 'sidebar' else False,
+                                                      page_writer=self._page_writer,
+                                                      dry_run=self._sidebar_dry_run)
+        scheduler.add(write_sidebar_messages)
         if not self._limit_to_lang:
-            write_summary = WriteSummary(self.site, self._rewrite_type)
-            write_summary.run(self._result, self._changelog)
+            scheduler.add(WriteSummary(self.site, bool(self._rewrite_type), page_writer=self._page_writer))
+        if not self._read_from_snapshot:
+            self._page_writer.preload(scheduler.pages_to_preload(self._result, self._changelog))
+        scheduler.run(self._result, self._changelog)
+        self._postprocessing_failures = scheduler.failures
+        if self._sidebar_dry_run:
+            self.logger.info(write_sidebar_messages.format_dry_run_report())
+        for lang, failed in scheduler.failures.items():
+            self.logger.warning(f"Post-processing of {f'language {lang}' if lang else 'all languages'} "
+                                f"incomplete: {', '.join(failed)} failed")
+        metrics.add_time("phase", "postprocessing", time.perf_counter() - phase_start)
+        self.logger.info(f"Statistics on API requests: {self.fortraininglib.counters}")
+
+    def _write_run_report(self, completed: bool) -> None:
+        """
+        Write what we measured during this run as JSON report and optionally as Prometheus textfile
+        (configured in section [resourcesbot] of config.ini: run_report and prometheus_textfile)
+        """
+        metrics: Metrics = self.fortraininglib.metrics
+        report_file: str = self._config.get("resourcesbot", "run_report",
+                                            fallback=os.path.join(self._config.get("Paths", "temp"),
+                                                                  "resourcesbot_report.json"))
+        prometheus_file: str = self._config.get("resourcesbot", "prometheus_textfile", fallback="")
+        try:
+            if report_file:
+                metrics.write_json(report_file, {
+                    "completed": completed,
+                    "mode": "snapshot" if self._read_from_snapshot else "cache" if self._read_from_cache
+                    else "incremental" if self._incremental else "full",
+                    "language": self._limit_to_lang,
+                    "languages": len(self._result),
+                    "changes": sum(change_log.count_changes() for change_log in self._changelog.values()),
+                    "counters": self.fortraininglib.counters.as_dict(),
+                    "pages": dict(self._page_writer.stats),
+                    "failures": self._postprocessing_failures})
+                self.logger.info(f"Wrote run report to {report_file}")
+            if prometheus_file:
+                metrics.write_prometheus(prometheus_file, "resourcesbot")
+        except OSError as err:
+            self.logger.warning(f"Couldn't write run report: {err}")
+
+    def _load_from_cache(self) -> None:
+        """
+        Read the details for all languages (or only for self._limit_to_lang and English) from our JSON cache
+        that is stored in the mediawiki system, e.g. https://www.4training.net/4training:de.json
+        """
+        try:
+            language_list: List[str] = []   # List of languages to be read from cache
+            if self._limit_to_lang is None:
+                page = self._page_writer.get_page("4training:languages.json")
+                if not page.exists():
+                    raise RuntimeError("Couldn't load list of languages from 4training:languages.json")
+                language_list = json.loads(page.text)
+                assert isinstance(language_list, list)
+            else:
+                language_list.append(self._limit_to_lang)
+                language_list.append("en")  # We need the English infos for LanguagePostProcessors
+
+            self._page_writer.preload([f"4training:{lang}.json" for lang in language_list])
+            for lang in language_list:      # Now we read the details for each language
+                self.logger.info(f"Reading details for language {lang} from cache...")
+                page = self._page_writer.get_page(f"4training:{lang}.json")
+                if not page.exists():
+                    raise RuntimeError(f"Couldn't load from cache for language {lang}")
+                language_info = language_info_from_json(page.text)
+                assert language_info.language_code == lang
+                self._result[lang] = language_info
+                self._stored_json[lang] = page.text
+        except (AssertionError, ValueError):
+            raise RuntimeError("Unexpected error while parsing JSON data from cache.")
+
+    def _load_from_snapshot(self) -> None:
+        """
+        Read the details for all languages (or only for self._limit_to_lang and English) from our local snapshot
+        """
+        snapshot: Optional[Snapshot] = Snapshot.from_config(self._config)
+        if snapshot is None:
+            raise RuntimeError("Can't read from snapshot: it is disabled in config.ini")
+        try:
+            self._result = snapshot.load(None if self._limit_to_lang is None else [self._limit_to_lang, "en"])
+        finally:
+            snapshot.close()
+        self.logger.info(f"Read details for {len(self._result)} languages from {snapshot.path}")
+
+    def _save_snapshot(self) -> None:
+        """Store our results in the local snapshot (if it isn't disabled) so that later runs can read from it"""
+        snapshot: Optional[Snapshot] = Snapshot.from_config(self._config)
+        if snapshot is None:
+            return
+        try:
+            snapshot.save(self._result, complete=self._limit_to_lang is None)
+        except sqlite3.Error as err:
+            self.logger.warning(f"Couldn't save snapshot to {snapshot.path}: {err}")
+        finally:
+            snapshot.close()
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        """
+        Load the state of our last run from https://www.4training.net/4training:resourcesbot.json, e.g.
+        {"timestamp": "2022-05-01T12:00:00Z", "rcid": 12345, "missing_files": {"Gebet.pdf": ["Prayer", "de"]}}
+        @return None if there is no valid state (then an incremental run isn't possible)
+        """
+        page = self._page_writer.get_page(self.STATE_PAGE)
+        if not page.exists():
+            self.logger.warning(f"{self.STATE_PAGE} doesn't exist yet. "
+                                "Can't do an incremental run, querying everything.")
+            return None
+        try:
+            state = json.loads(page.text)
+            assert isinstance(state, dict)
+            assert isinstance(state.get("timestamp"), str)
+        except (json.JSONDecodeError, AssertionError):
+            self.logger.warning(f"Couldn't parse {self.STATE_PAGE}. Can't do an incremental run, querying everything.")
+            return None
+        for file_name, (page_name, lang) in state.get("missing_files", {}).items():
+            self._missing_files[file_name] = (page_name, lang)
+        return state
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        """Save the state of this run (together with the list of missing files) so that incremental runs can follow"""
+        state["missing_files"] = {file_name: list(self._missing_files[file_name])
+                                  for file_name in sorted(self._missing_files)}
+        if self._page_writer.write(self.STATE_PAGE, json.dumps(state), "Updated state of resourcesbot"):
+            self.logger.info(f"Updated {self.STATE_PAGE}")
+
+    def _preload_own_pages(self) -> None:
+        """
+        Load all pages that we're going to compare and write in the sync phase with as few requests as possible
+        (JSON of the languages we queried, list and number of languages, our state)
+        """
+        titles: List[str] = [f"4training:{lang}.json" for lang in self._result if lang not in self._stored_json and
+                             (self._changed_languages is None or lang in self._changed_languages)]
+        if self._limit_to_lang is None:
+            titles.extend(["4training:languages.json", "MediaWiki:Numberoflanguages", self.STATE_PAGE])
+        self._page_writer.preload(titles)
+
+    def _query_changed_worksheets(self, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Incremental run: Look at all changes in the mediawiki system since our last run (edits, uploads, deletions...)
+        and query only the affected worksheets and languages again. The results are merged into self._result
+        (which must be filled from our JSON cache already).
+        @param state: state of our last run (see _load_state())
+        @return new state to be saved after this run; None if we couldn't get the changes
+        """
+        changes = self.fortraininglib.get_recent_changes(state["timestamp"])
+        if changes is None:
+            self.logger.warning("Couldn't get recent changes. Can't do an incremental run, querying everything.")
+            return None
+        new_state: Dict[str, Any] = {"timestamp": state["timestamp"], "rcid": state.get("rcid", 0)}
+        titles: List[str] = []
+        for change in changes:
+            # rcstart is inclusive: ignore changes we already processed in our last run
+            if change.get("rcid", 0) <= state.get("rcid", 0) or change.get("title") == self.STATE_PAGE:
+                continue
+            titles.append(change["title"])
+            if change["rcid"] > new_state["rcid"]:
+                new_state["rcid"] = change["rcid"]
+                new_state["timestamp"] = change["timestamp"]
+
+        self._changed_languages = set()
+        worksheets: List[str] = self.fortraininglib.get_worksheet_list()
+        affected: Dict[str, Optional[Set[str]]] = self._find_affected_worksheets(titles, worksheets)
+        for lang, language_info in self._result.items():
+            # Worksheets that were removed from our list
+            for page in [page for page in language_info.worksheets if page not in worksheets]:
+                language_info.remove_worksheet_info(page)
+                self._changed_languages.add(lang)
+            # New worksheets in our list
+            if lang == "en":
+                for page in worksheets:
+                    if not language_info.has_worksheet(page):
+                        affected[page] = None
+        self.logger.info(f"{len(titles)} changes since {state['timestamp']}, "
+                         f"querying again: {', '.join(affected) if affected else 'nothing'}")
+
+        # Forget about missing files of what we're querying again: we'll find out again if they're still missing
+        for file_name, (page, lang) in list(self._missing_files.items()):
+            if page in affected and (affected[page] is None or lang in affected[page]):  # type: ignore
+                del self._missing_files[file_name]
+
+        pages: List[str] = [page for page in worksheets if page in affected]
+        self._prefetch_translation_progress(pages)
+        with self._analyze_pdfs_in_background():
+            if self._workers > 1:
+                with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                    for page, worksheet_infos in zip(pages, executor.map(
+                            lambda page: self._query_translations(page, affected[page]), pages)):
+                        self._merge_worksheet_infos(page, affected[page], worksheet_infos)
+            else:
+                for page in pages:
+                    self._merge_worksheet_infos(page, affected[page],
+                                                self._query_translations(page, affected[page]))
+
+        # Keep the worksheets in the same order as a full run would produce
+        for lang in self._changed_languages:
+            if lang in self._result:
+                old_worksheets = self._result[lang].worksheets
+                self._result[lang].worksheets = {page: old_worksheets[page] for page in worksheets
+                                                 if page in old_worksheets}
+        return new_state
+
+    def _find_affected_worksheets(self, titles: List[str], worksheets: List[str]) -> Dict[str, Optional[Set[str]]]:
+        """
+        Find out which worksheets and languages are affected by changes of the given pages
+
+        Examples: Translations:Prayer/5/de -> Prayer (de); Prayer/de -> Prayer (de);
+        Prayer -> Prayer (all languages as the English original changed);
+        File:Gebet.pdf -> Prayer (de) if we know that file (or know that it was missing)
+        @param titles: titles of all changed pages (as returned by ForTrainingLib.get_recent_changes())
+        @return dictionary: worksheet -> set of language codes (None: all languages are affected)
+        """
+        worksheet_names: Dict[str, str] = {page.replace("_", " "): page for page in worksheets}
+        files: Dict[str, Tuple[str, str]] = dict(self._missing_files)
+        for lang, language_info in self._result.items():
+            for worksheet_info in language_info.worksheets.values():
+                for file_info in worksheet_info.get_file_infos().values():
+                    files[file_info.get_file_name()] = (worksheet_info.page, lang)
+
+        affected: Dict[str, Optional[Set[str]]] = {}
+        for title in titles:
+            if title.startswith("File:"):
+                file_name = title[5:].replace(" ", "_")
+                if file_name not in files:
+                    continue
+                page, lang = files[file_name]
+            elif title.startswith("Translations:"):
+                parts = title[13:].rsplit("/", 2)
+                if len(parts) != 3:
+                    continue
+                page, lang = parts[0], parts[2]
+            else:
+                page, _, lang = title.partition("/")
+            page = worksheet_names.get(page.replace("_", " "), "")
+            if page == "":
+                continue
+            if lang in ["", "en"]:
+                affected[page] = None   # English original changed: this may affect all translations
+            elif page not in affected:
+                affected[page] = {lang}
+            elif affected[page] is not None:
+                affected[page].add(lang)    # type: ignore
+        if self._limit_to_lang is not None:
+            for page in affected:
+                affected[page] = {self._limit_to_lang}
+        return affected
+
+    def _merge_worksheet_infos(self, page: str, languages: Optional[Set[str]],
+                               worksheet_infos: List[WorksheetInfo]) -> None:
+        """
+        Incremental run: Replace what we know about a worksheet in the given languages
+        with the results of _query_translations()
+        @param languages: the languages that were queried again (None: all languages)
+        """
+        assert self._changed_languages is not None
+        if len(worksheet_infos) == 0:   # Something went wrong: better keep the information we have
+            return
+        new_infos: Dict[str, WorksheetInfo] = {info.language_code: info for info in worksheet_infos}
+        if languages is None:
+            languages = set(self._result) | set(new_infos)
+        else:
+            languages = languages | {"en"}    # We always get the English original as well
+        for lang in languages:
+            if lang in new_infos:
+                self._add_worksheet_infos([new_infos[lang]])
+            elif lang in self._result and self._result[lang].has_worksheet(page):
+                self._result[lang].remove_worksheet_info(page)
+                if lang != "en" and len(self._result[lang].worksheets) == 0:
+                    del self._result[lang]
+            else:
+                continue
+            self._changed_languages.add(lang)
 
-    def get_english_version(self, page_source: str) -> Tuple[str, int]:
+    def get_english_version(self, source: WorksheetSource) -> Tuple[str, int]:
         """
         Extract version of an English worksheet
         @return Tuple of version string and the number of the translation unit where it is stored
         """
-        handler = re.search(r"\{\{Version\|<translate>*?<!--T:(\d+)-->\s*([^<]+)</translate>", page_source)
-        if handler:
-            return (handler.group(2), int(handler.group(1)))
+        if source.version is not None and source.version_unit is not None:
+            return (source.version, source.version_unit)
         self.logger.warning("Couldn't retrieve version from English worksheet!")
         return ("", 0)
 
-    def _query_translated_file(self, worksheet: WorksheetInfo, english_file_info: FileInfo) -> None:
+    def _query_translated_file(self, worksheet: WorksheetInfo, english_file_info: FileInfo,
+                               file_name: Optional[str]) -> None:
         """
-        Query the name of the translated file and see if it is valid. If yes, go ahead and see if such a file exists
+        See if the name of the translated file is valid. If yes, go ahead and see if such a file exists
+        @param file_name: content of the translation unit with the name of the translated file (None if not existing)
         """
-        if english_file_info.translation_unit is None:
-            self.logger.warning(f"Internal error: translation unit is None in {english_file_info}, ignoring.")
-            return
-        file_name = self.fortraininglib.get_translated_unit(worksheet.page, worksheet.language_code,
-                                                            english_file_info.translation_unit)
         warning: str = ""
         if file_name is None:
             warning = "does not exist"
@@ -200,9 +529,18 @@ class ResourcesBot:
             file_page = pywikibot.FilePage(self.site, file_name)
             if file_page.exists():
                 metadata = None
+                if file_type == "pdf" and self._pdf_pipeline is not None:
+                    # The pipeline will add the metadata later
+                    worksheet.add_file_info(file_type=file_type, from_pywikibot=file_page.latest_file_info, unit=unit)
+                    file_info = worksheet.get_file_type_info(file_type)
+                    assert file_info is not None
+                    self._pdf_pipeline.submit(worksheet, file_page, file_info)
+                    return
                 if file_type == "pdf":
                     # If it's a PDF, we try to analyze the metadata and save it also in our data structure
-                    temp_file = os.path.join(self._config.get("Paths", "temp"), file_name)
+                    # Prefix with language code: worksheets may be queried in parallel, avoid clashing file names
+                    temp_file = os.path.join(self._config.get("Paths", "temp"),
+                                             f"{worksheet.language_code}_{file_name}")
                     if file_page.download(temp_file):
                         metadata = check_metadata(self.fortraininglib, temp_file, worksheet)
                         if not metadata.correct:
@@ -218,52 +556,128 @@ class ResourcesBot:
                                         unit=unit, metadata=metadata)
             else:
                 self.logger.warning(f"Page {worksheet.page}/{worksheet.language_code}: Couldn't find {file_name}.")
+                self._missing_files[file_name.replace(" ", "_")] = (worksheet.page, worksheet.language_code)
         except pywikibot.exceptions.Error as err:
             self.logger.warning(f"Exception thrown for {file_type} file: {err}")
 
-    def _add_english_file_infos(self, page_source: str, worksheet: WorksheetInfo) -> None:
+    def _add_english_file_infos(self, source: WorksheetSource, worksheet: WorksheetInfo) -> None:
         """
         Finds out the names of the English downloadable files (originals)
         and adds them to worksheet
         """
         for file_type in self._file_types:
-            handler = re.search(r"\{\{" + file_type[0].upper() + file_type[1:] +
-                                r"Download\|<translate>*?<!--T:(\d+)-->\s*([^<]+)</translate>", page_source)
-            if handler:
-                self._add_file_type(worksheet, file_type, handler.group(2), int(handler.group(1)))
+            download = source.get_download(file_type)
+            if download is not None and download[1] is not None:
+                self._add_file_type(worksheet, file_type, download[0], download[1])
+
+    def _query_all_worksheets(self):
+        """
+        Gather all data on all worksheets into self._result (this takes quite some time!)
 
-    def _query_translations(self, page: str):
+        If configured (option workers in section resourcesbot of config.ini), several worksheets
+        are queried in parallel. The results are always merged in the order of the worksheet list
+        so that self._result is identical to what a sequential run produces.
+        PDF files are downloaded and analyzed in the background (see pdf_pipeline.py).
         """
-        Go through one worksheet, check all existing translations and gather information into self._result
+        worksheets: List[str] = self.fortraininglib.get_worksheet_list()
+        self._prefetch_translation_progress(worksheets)
+        with self._analyze_pdfs_in_background():
+            if self._workers > 1:
+                self.logger.info(f"Querying {len(worksheets)} worksheets with {self._workers} workers")
+                with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                    for worksheet_infos in executor.map(self._query_translations, worksheets):
+                        self._add_worksheet_infos(worksheet_infos)
+            else:
+                for worksheet in worksheets:
+                    self._add_worksheet_infos(self._query_translations(worksheet))
+
+    @contextmanager
+    def _analyze_pdfs_in_background(self) -> Iterator[None]:
+        """
+        While in this context, _add_file_type() hands over PDF files to our PdfPipeline.
+        When leaving, we wait until all PDFs are analyzed and their metadata is added to the worksheets.
+        """
+        self._pdf_pipeline = PdfPipeline.from_config(self.fortraininglib, self._config)
+        try:
+            yield
+        finally:
+            pipeline, self._pdf_pipeline = self._pdf_pipeline, None
+            pipeline.finish()
+
+    def _prefetch_translation_progress(self, worksheets: List[str]):
+        """
+        If we're limited to one language, the translation progress of all worksheets can be fetched
+        with only two API calls (instead of one call per worksheet)
+        """
+        if self._limit_to_lang is not None:
+            self._translation_progress = self.fortraininglib.get_translation_progress(worksheets, self._limit_to_lang)
+
+    def _add_worksheet_infos(self, worksheet_infos: List[WorksheetInfo]):
+        """Store the results of _query_translations() for one worksheet in self._result"""
+        for worksheet_info in worksheet_infos:
+            lang = worksheet_info.language_code
+            if lang not in self._result:
+                language_name = self.fortraininglib.get_language_name(lang, 'en') or ""
+                self._result[lang] = LanguageInfo(lang, language_name)
+            self._result[lang].add_worksheet_info(worksheet_info.page, worksheet_info)
+
+    @staticmethod
+    def _unit_title(page: str, identifier: Union[int, str], language_code: str) -> str:
+        """Page name of a translation unit, e.g. Translations:Prayer/Page display title/de"""
+        return f"Translations:{page}/{identifier}/{language_code}"
+
+    def _query_translations(self, page: str, limit_to_languages: Optional[Set[str]] = None) -> List[WorksheetInfo]:
+        """
+        Go through one worksheet, check all existing translations and gather information on them
+
+        This doesn't modify self._result so it can be called for several worksheets in parallel
         @param: page: Name of the worksheet
+        @param: limit_to_languages: only look at these translations (None: all translations)
+        @return information on the English original (first element) and all translations;
+                empty list if we couldn't get the English original
         """
-        # This is querying more data than necessary when self._limit_to_lang is set. But to save time we'd need to find
-        # a different API call that is only requesting progress for one particular language... for now it's okay
-        available_translations = self.fortraininglib.list_page_translations(page, include_unfinished=True)
-        english_title = self.fortraininglib.get_translated_title(page, "en")
-        page_source = self.fortraininglib.get_page_source(page)
+        available_translations: Optional[Dict[str, TranslationProgress]] = self._translation_progress.get(page)
+        if available_translations is None:
+            available_translations = self.fortraininglib.get_translation_progress([page]).get(page, {})
+        if "en" not in available_translations:
+            self.logger.error(f"Couldn't get translation progress of {page}, skipping.")
+            return []
+        english_title_unit: str = self._unit_title(page, "Page display title", "en")
+        english_sources = self.fortraininglib.get_page_sources([english_title_unit, page])
+        english_title = english_sources[english_title_unit]
+        page_source = english_sources[page]
         if english_title is None or page_source is None:
             self.logger.error(f"Couldn't get English page {page}, skipping.")
-            return
-        version, version_unit = self.get_english_version(page_source)
+            return []
+        # Parse the English worksheet only once and share it with ForTrainingLib (get_pdf_name() etc.)
+        source: WorksheetSource = self.fortraininglib.add_worksheet_source(page, page_source)
+        version, version_unit = self.get_english_version(source)
         english_page_info: WorksheetInfo = WorksheetInfo(page, "en", english_title, available_translations["en"],
                                                          version, version_unit)
-        self._add_english_file_infos(page_source, english_page_info)
-        self._result["en"].add_worksheet_info(page, english_page_info)
+        self._add_english_file_infos(source, english_page_info)
+        result: List[WorksheetInfo] = [english_page_info]
+
+        # We saved information on the English originals already, don't do that again
+        languages: List[str] = [lang for lang in available_translations if lang != "en" and
+                                (self._limit_to_lang is None or self._limit_to_lang == lang) and
+                                (limit_to_languages is None or lang in limit_to_languages)]
+        # Request title, version and file names of all translations at once: that needs only a few API calls
+        identifiers: List[Union[int, str]] = ["Page display title", version_unit]
+        for file_info in english_page_info.get_file_infos().values():
+            if file_info.translation_unit is not None:
+                identifiers.append(file_info.translation_unit)
+        translated_units = self.fortraininglib.get_page_sources([self._unit_title(page, identifier, lang)
+                                                                 for lang in languages for identifier in identifiers])
 
         finished_translations = []
-        for lang, progress in available_translations.items():
-            if (self._limit_to_lang is not None) and (self._limit_to_lang != lang):
-                continue
-            if lang == "en":    # We saved information on the English originals already, don't do that again
-                continue
-
-            translated_title = self.fortraininglib.get_translated_title(page, lang)
+        for lang in languages:
+            progress = available_translations[lang]
+            translated_title = translated_units[self._unit_title(page, "Page display title", lang)]
             if translated_title is None:  # apparently this translation doesn't exist
                 if not progress.is_unfinished():
                     self.logger.warning(f"Language {lang}: Title of {page} not translated, skipping.")
                 continue
-            translated_version = self.fortraininglib.get_translated_unit(page, lang, version_unit)
+            translated_version = translated_units[self._unit_title(page, version_unit, lang)]
             if translated_version is None:
                 if not progress.is_unfinished():
                     self.logger.warning(f"Language {lang}: Version of {page} not translated, skipping.")
@@ -279,62 +693,64 @@ class ResourcesBot:
                                     f" - {english_title} has version {version}")
 
             for file_info in english_page_info.get_file_infos().values():
-                self._query_translated_file(page_info, file_info)
-
-            if lang not in self._result:
-                language_name = self.fortraininglib.get_language_name(lang, 'en') or ""
-                self._result[lang] = LanguageInfo(lang, language_name)
-            self._result[lang].add_worksheet_info(page, page_info)
+                if file_info.translation_unit is None:
+                    self.logger.warning(f"Internal error: translation unit is None in {file_info}, ignoring.")
+                    continue
+                self._query_translated_file(page_info, file_info,
+                                            translated_units[self._unit_title(page, file_info.translation_unit, lang)])
+            result.append(page_info)
 
         self.logger.info(f"Worksheet {page} is translated into: {finished_translations}, "
                          f"ignored {set(available_translations.keys()) - set(finished_translations)}")
+        return result
 
     def _sync_and_compare(self, language_info: LanguageInfo) -> ChangeLog:
         """
         Synchronize our generated data on this language with our "database" and return the changes.
 
         The "database" is the JSON representation of LanguageInfo and is stored in a mediawiki page.
+        We save it only if there are relevant changes (see LanguageInfoDiff).
 
         @param lang language code
         @return comparison to what was previously stored in our database
         """
         lang = language_info.language_code
-        encoded_json = DataStructureEncoder().encode(language_info)
-        old_language_info: LanguageInfo = LanguageInfo(lang, language_info.english_name)
-        rewrite_json: bool = self._rewrite_type
+        new_data: Dict[str, Any] = language_info.to_dict()
+        old_data: Dict[str, Any] = LanguageInfo(lang, language_info.english_name).to_dict()
 
         # Reading data structure from our mediawiki, stored in e.g. https://www.4training.net/4training:de.json
-        page = pywikibot.Page(self.site, f"4training:{lang}.json")
-        if not page.exists():
+        # (no need to load it again if we read it already in the beginning of this run)
+        page = self._page_writer.get_page(f"4training:{lang}.json")
+        old_json: Optional[str] = self._stored_json.pop(lang, None)
+        if old_json is None and page.exists():
+            old_json = page.text
+        if old_json is None:
             # There doesn't seem to be any information on this language stored yet!
             self.logger.warning(f"{page.full_url()} doesn't seem to exist yet. Creating...")
-            page.text = encoded_json
-            page.save("Created JSON data structure")
-            rewrite_json = False
+            self._page_writer.save(page, language_info_to_json(language_info), "Created JSON data structure")
         else:
             # Load "old" data structure of this language (from previous resourcesbot run)
             try:
-                old_language_info = json.loads(page.text, object_hook=json_decode)
-                assert isinstance(old_language_info, LanguageInfo)
+                old_language_info = language_info_from_json(old_json)
                 assert old_language_info.language_code == lang
-            except AssertionError:
+                old_data = old_language_info.to_dict()
+            except (AssertionError, ValueError):
                 self.logger.warning(f"Error while trying to load {lang}.json")
 
-            if encoded_json != page.text:
-                rewrite_json = True
-
-        # compare and find out if new worksheets have been added
-        changes: ChangeLog = language_info.compare(old_language_info)
+        diff = LanguageInfoDiff(new_data, old_data)
+        changes: ChangeLog = diff.to_changelog()
         if changes.is_empty():
             self.logger.info(f"No changes in language {lang} since last run.")
         else:
             self.logger.info(f"Changes in language {lang} since last run:\n{changes}")
 
-        if rewrite_json:
+        if old_json is not None and diff.needs_save():
             # Write the updated JSON structure
-            page.text = encoded_json
-            page.save("Updated JSON data structure")
-            self.logger.info(f"Updated 4training:{lang}.json")
+            if self._page_writer.save(page, language_info_to_json(language_info), "Updated JSON data structure"):
+                self.logger.info(f"Updated 4training:{lang}.json")
+        elif not diff.is_empty():
+            self.logger.debug(f"Not updating 4training:{lang}.json: only volatile fields changed: "
+                              f"{', '.join(str(change) for change in diff.changes)}")
 
         return changes
 
@@ -348,18 +764,13 @@ class ResourcesBot:
         language_list = list(self._result)
         language_list.sort()
         encoded_json: str = json.dumps(language_list)
-        previous_json: str = ""
 
-        page = pywikibot.Page(self.site, "4training:languages.json")
+        page = self._page_writer.get_page("4training:languages.json")
         if not page.exists():
             self.logger.warning("languages.json doesn't seem to exist yet. Creating...")
-        else:
-            previous_json = page.text
 
-        # TODO compare language_list and json.loads(previous_json) to find out if a new language was added
-        if previous_json != encoded_json:
-            page.text = encoded_json
-            page.save("Updated list of languages")
+        # TODO compare language_list and the previous list to find out if a new language was added
+        if self._page_writer.save(page, encoded_json, "Updated list of languages"):
             self.logger.info("Updated 4training:languages.json")
 
     def _save_number_of_languages(self):
@@ -379,17 +790,12 @@ class ResourcesBot:
                 self.logger.debug(f"Not counting {lang} into the number of languages we have")
         self.logger.info(f"Number of languages: {number_of_languages}")
 
-        previous_number_of_languages: int = 0
-        page = pywikibot.Page(self.site, "MediaWiki:Numberoflanguages")
-        if page.exists():
-            previous_number_of_languages = int(page.text)
-        else:
+        page = self._page_writer.get_page("MediaWiki:Numberoflanguages")
+        if not page.exists():
             self.logger.warning("MediaWiki:Numberoflanguages doesn't seem to exist yet. Creating...")
 
-        if previous_number_of_languages != number_of_languages:
-            try:
-                page.text = number_of_languages
-                page.save("Updated number of languages")
+        try:
+            if self._page_writer.save(page, str(number_of_languages), "Updated number of languages"):
                 self.logger.info(f"Updated MediaWiki:Numberoflanguages to {number_of_languages}")
-            except pywikibot.exceptions.PageSaveRelatedError as err:
-                self.logger.warning(f"Error while trying to update MediaWiki:Numberoflanguages: {err}")
+        except pywikibot.exceptions.PageSaveRelatedError as err:
+            self.logger.warning(f"Error while trying to update MediaWiki:Numberoflanguages: {err}")
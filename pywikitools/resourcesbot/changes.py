@@ -3,7 +3,7 @@ Contains the classes ChangeType, ChangeItem and ChangeLog that describe the list
 since the last run of the resourcesbot.
 """
 from enum import Enum
-from typing import List
+from typing import Iterator, List
 
 
 class ChangeType(Enum):
@@ -47,11 +47,10 @@ class ChangeLog:
     """
     Holds all changes that happened in one language since the last resourcesbot run
     """
-    __slots__ = ['_changes', '_iterate_pos']
+    __slots__ = ['_changes']
 
     def __init__(self):
         self._changes: List[ChangeItem] = []
-        self._iterate_pos: int = 0
 
     def add_change(self, worksheet: str, change_type: ChangeType):
         change_item = ChangeItem(worksheet, change_type)
@@ -69,14 +68,9 @@ class ChangeLog:
             output += f"{change_item}\n"
         return output
 
-    def __iter__(self):
-        """Make this class iterable in a simple way (not suitable for concurrency!)"""
-        self._iterate_pos = 0
-        return self
-
-    def __next__(self) -> ChangeItem:
-        """Return a next ChangeItem"""
-        while self._iterate_pos < len(self._changes):
-            self._iterate_pos += 1
-            return self._changes[self._iterate_pos - 1]
-        raise StopIteration
+    def __iter__(self) -> Iterator[ChangeItem]:
+        """
+        Iterate over all ChangeItems
+        Each call returns an independent iterator, so several post-processors can iterate at the same time
+        """
+        return iter(self._changes)
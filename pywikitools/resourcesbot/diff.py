@@ -0,0 +1,159 @@
+"""
+Structural comparison of two versions of the data on one language (LanguageInfo.to_dict())
+
+Instead of comparing JSON strings, we walk through both trees and record every field that changed.
+Lists of worksheets and files are matched by their identifying field (page / file_type), so the order
+of keys and list elements doesn't matter.
+
+From the same list of changes we derive
+- the ChangeLog (see changes.py) that the post-processors work with
+- whether our stored JSON needs to be saved again: changes in volatile fields alone don't justify a new revision
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple
+
+from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+
+Path = Tuple[str, ...]
+
+
+class FieldChange:
+    """
+    One changed field, e.g. path ("worksheets", "Prayer", "files", "pdf", "timestamp")
+    old is None if the field (or list element) was added, new is None if it was removed
+    """
+    __slots__ = ["path", "old", "new"]
+
+    def __init__(self, path: Path, old: Any, new: Any):
+        self.path: Final[Path] = path
+        self.old: Final[Any] = old
+        self.new: Final[Any] = new
+
+    def __str__(self) -> str:
+        return f"{'/'.join(self.path)}: {self.old!r} -> {self.new!r}"
+
+
+class LanguageInfoDiff:
+    """All differences between an older and a newer version of LanguageInfo.to_dict()"""
+    # Lists of objects: which field identifies an element (so that we can match old and new elements)
+    LIST_KEYS: Final[Dict[str, str]] = {"worksheets": "page", "files": "file_type"}
+    # Changes in these fields alone don't make it necessary to save the data again if the condition is met
+    # ("*" matches any worksheet / file type):
+    # - the language name is "" if we couldn't query it this time (but a renamed language needs to be saved)
+    # - the warnings of the PDF metadata check are only details of the other metadata fields
+    VOLATILE_FIELDS: Final[List[Tuple[Path, Callable[[FieldChange], bool]]]] = [
+        (("english_name",), lambda change: change.new == ""),
+        (("worksheets", "*", "files", "*", "metadata", "warnings"), lambda change: True),
+    ]
+    # Which file types are reported in the ChangeLog
+    FILE_CHANGE_TYPES: Final[Dict[str, Tuple[ChangeType, ChangeType, ChangeType]]] = {
+        "pdf": (ChangeType.NEW_PDF, ChangeType.UPDATED_PDF, ChangeType.DELETED_PDF),
+        "odt": (ChangeType.NEW_ODT, ChangeType.UPDATED_ODT, ChangeType.DELETED_ODT),
+    }
+
+    def __init__(self, new: Dict[str, Any], old: Dict[str, Any]):
+        """
+        @param new: result of LanguageInfo.to_dict() of the current data
+        @param old: result of LanguageInfo.to_dict() of the data we stored in our last run
+        """
+        self.changes: List[FieldChange] = []
+        self._compare((), new, old)
+
+    def _compare(self, path: Path, new: Any, old: Any) -> None:
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key, value in new.items():
+                if key in old:
+                    self._compare(path + (key,), value, old[key])
+                elif key in self.LIST_KEYS:     # empty lists are omitted
+                    self._compare(path + (key,), value, [])
+                else:
+                    self.changes.append(FieldChange(path + (key,), None, value))
+            for key, value in old.items():
+                if key not in new:
+                    if key in self.LIST_KEYS:
+                        self._compare(path + (key,), [], value)
+                    else:
+                        self.changes.append(FieldChange(path + (key,), value, None))
+        elif isinstance(new, list) and isinstance(old, list) and len(path) > 0 and path[-1] in self.LIST_KEYS:
+            identifier = self.LIST_KEYS[path[-1]]
+            old_elements: Dict[str, Any] = {element[identifier]: element for element in old}
+            new_elements: Dict[str, Any] = {element[identifier]: element for element in new}
+            for name, element in new_elements.items():
+                if name in old_elements:
+                    self._compare(path + (name,), element, old_elements[name])
+                else:
+                    self.changes.append(FieldChange(path + (name,), None, element))
+            for name, element in old_elements.items():
+                if name not in new_elements:
+                    self.changes.append(FieldChange(path + (name,), element, None))
+        elif new != old:
+            self.changes.append(FieldChange(path, old, new))
+
+    def is_empty(self) -> bool:
+        return len(self.changes) == 0
+
+    @classmethod
+    def is_volatile(cls, change: FieldChange) -> bool:
+        for pattern, condition in cls.VOLATILE_FIELDS:
+            if len(pattern) == len(change.path) and all(p == "*" or p == q for p, q in zip(pattern, change.path)):
+                return condition(change)
+        return False
+
+    def needs_save(self) -> bool:
+        """Are there changes besides changes in volatile fields?"""
+        return any(not self.is_volatile(change) for change in self.changes)
+
+    @staticmethod
+    def _parse_timestamp(timestamp: Optional[str]) -> Optional[datetime]:
+        if timestamp is None:
+            return None
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except (ValueError, TypeError):
+            return None
+
+    def to_changelog(self) -> ChangeLog:
+        """
+        Derive the ChangeLog (same result as LanguageInfo.compare() always gave):
+        In case of NEW_WORKSHEET, no NEW_PDF / NEW_ODT will be emitted (even if files got added)
+        In case of DELETED_WORKSHEET, no DELETED_PDF / DELETED_ODT will be emitted (even if files existed before)
+        A file counts as updated only if its timestamp is newer than before
+        """
+        # Collect changes for each worksheet (in the order the worksheets appear in our list of changes)
+        worksheet_changes: Dict[str, List[ChangeType]] = {}
+        for change in self.changes:
+            if len(change.path) < 2 or change.path[0] != "worksheets":
+                continue
+            worksheet = change.path[1]
+            change_types = worksheet_changes.setdefault(worksheet, [])
+            field: Path = change.path[2:]
+            if len(field) == 0:
+                change_types.append(ChangeType.NEW_WORKSHEET if change.old is None else ChangeType.DELETED_WORKSHEET)
+            elif field == ("version",):
+                change_types.append(ChangeType.UPDATED_WORKSHEET)
+            elif len(field) >= 2 and field[0] == "files" and field[1] in self.FILE_CHANGE_TYPES:
+                new_type, updated_type, deleted_type = self.FILE_CHANGE_TYPES[field[1]]
+                if len(field) == 2:
+                    change_types.append(new_type if change.old is None else deleted_type)
+                elif field[2:] == ("timestamp",):
+                    old_timestamp = self._parse_timestamp(change.old)
+                    new_timestamp = self._parse_timestamp(change.new)
+                    if old_timestamp is not None and new_timestamp is not None and old_timestamp < new_timestamp:
+                        change_types.append(updated_type)
+
+        # Emit them in the order that LanguageInfo.compare() always used: files before the version
+        order: List[ChangeType] = [change_type for change_types in self.FILE_CHANGE_TYPES.values()
+                                   for change_type in change_types] + [ChangeType.UPDATED_WORKSHEET]
+        change_log = ChangeLog()
+        deleted_worksheets: List[str] = []
+        for worksheet, change_types in worksheet_changes.items():
+            if ChangeType.DELETED_WORKSHEET in change_types:
+                deleted_worksheets.append(worksheet)
+            elif ChangeType.NEW_WORKSHEET in change_types:
+                change_log.add_change(worksheet, ChangeType.NEW_WORKSHEET)
+            else:
+                for change_type in sorted(change_types, key=order.index):
+                    change_log.add_change(worksheet, change_type)
+        for worksheet in deleted_worksheets:
+            change_log.add_change(worksheet, ChangeType.DELETED_WORKSHEET)
+        return change_log
@@ -1,15 +1,35 @@
+"""
+Export all finished worksheets of a language as HTML (including the images they use)
+
+The HTML of the worksheets and the images are fetched in parallel (using the session of ForTrainingLib).
+The details of all images are requested in advance with a few batched API calls (ForTrainingLib.get_file_infos()).
+Images that exist locally already are only downloaded again if they changed in the mediawiki system:
+we compare the SHA1 of the local file with the one the mediawiki system reports. Without SHA1 we send
+If-Modified-Since with the modification time of the local file (which we set to the
+Last-Modified time of the server after downloading).
+
+Configuration (optional) in section [resourcesbot] of config.ini:
+html_export_workers = 4     # Number of worksheets / images fetched in parallel (default: 4)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
 import json
 import logging
 import os
 import re
+import time
 import requests
-from typing import Dict, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
 
 from pywikitools.fortraininglib import ForTrainingLib
 from pywikitools.htmltools.beautify_html import BeautifyHTML
 from pywikitools.resourcesbot.changes import ChangeLog
 from pywikitools.resourcesbot.data_structures import LanguageInfo
-from pywikitools.resourcesbot.post_processing import LanguagePostProcessor
+from pywikitools.resourcesbot.post_processing import ALL_CHANGES, LanguagePostProcessor
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 class CustomBeautifyHTML(BeautifyHTML):
@@ -31,13 +51,18 @@ class ExportHTML(LanguagePostProcessor):
     Export all finished worksheets of this language as HTML into a folder
     This is a step towards having a git repo with this content always up-to-date
     """
-    def __init__(self, fortraininglib: ForTrainingLib, folder: str, force_rewrite: bool = False):
+    RELEVANT_CHANGES = ALL_CHANGES
+    CHUNK_SIZE: int = 64 * 1024     # Downloaded files are written to disk in chunks of this size
+
+    def __init__(self, fortraininglib: ForTrainingLib, folder: str, force_rewrite: bool = False, workers: int = 4):
         """
         @param folder: base directory for export; subdirectories will be created for each language
         @param force_rewrite: rewrite even if there were no (relevant) changes
+        @param workers: number of worksheets / images that are fetched in parallel (1: one after the other)
         """
         self._base_folder: str = folder
         self._force_rewrite: bool = force_rewrite
+        self._workers: int = max(1, workers)
         self.fortraininglib = fortraininglib
         self.logger = logging.getLogger('pywikitools.resourcesbot.export_html')
         if self._base_folder != "":
@@ -49,6 +74,9 @@ class ExportHTML(LanguagePostProcessor):
         else:
             self.logger.warning("Missing htmlexport path in config.ini. Won't export HTML files.")
 
+    def is_relevant(self, change_log: ChangeLog) -> bool:
+        return self._force_rewrite or super().is_relevant(change_log)
+
     def has_relevant_change(self, worksheet: str, change_log: ChangeLog) -> bool:
         """
         Is there a relevant change for worksheet?
@@ -67,34 +95,94 @@ class ExportHTML(LanguagePostProcessor):
         filename += ".html"
         return filename
 
-    def download_file(self, files_folder: str, filename: str) -> bool:
-        """Download a file from the mediawiki server
+    def download_file(self, files_folder: str, filename: str, file_info: Optional[Dict[str, Any]] = None) -> bool:
+        """Download a file from the mediawiki server (if we don't have the current version already)
 
-        If a file already exists locally, we don't download it again because usually those
-        files (graphics) don't change.
-        TODO: Implement a way to force re-downloading of files (in case a file was updated in the mediawiki system).
-        Two possible ways:
-        - an extra flag (e.g. --force-rewrite-files)
-        - by getting the time stamp of the file in the mediawiki system, comparing it with the last
-        modified timestamp of the local file and download again if the first is newer
-        (would require adjustments of get_file_url() to also request timestamp)
+        If the file exists locally, we compare its SHA1 with the one of the current version in the mediawiki system.
+        If we don't know that, we ask the server to send the file only if it was modified since then
+        (If-Modified-Since with the modification time of our file). The file is streamed to disk
+        and only replaces the local file when the download is complete.
 
+        @param file_info: details on the file from ForTrainingLib.get_file_infos() (None: request them; {}: missing)
         @return True if we actually downloaded the file, False if not
         """
         file_path = os.path.join(files_folder, filename)
+        if file_info is None:
+            file_info = self.fortraininglib.get_file_infos([filename])[filename]
+        if file_info is None or not file_info.get("url"):
+            self.logger.error(f"Could not get URL of file {filename}, skipping.")
+            return False
+        url: str = file_info["url"]
+
+        headers: Dict[str, str] = {}
         if os.path.isfile(file_path):
-            self.logger.info(f"File {file_path} already exists locally, not downloading.")
-        else:
-            url = self.fortraininglib.get_file_url(filename)
-            if url is None:
-                self.logger.error(f"Could not get URL of file {filename}, skipping.")
-                return False
-
-            response = requests.get(url, allow_redirects=True)
-            with open(file_path, 'wb') as fh:
-                fh.write(response.content)
+            if file_info.get("sha1"):
+                if self._get_sha1(file_path) == file_info["sha1"]:
+                    self.logger.info(f"File {file_path} didn't change, not downloading.")
+                    return False
+            else:
+                headers["If-Modified-Since"] = formatdate(os.path.getmtime(file_path), usegmt=True)
+        temp_path: str = f"{file_path}.part"
+        start: float = time.perf_counter()
+        size: int = 0
+        success: bool = False
+        try:
+            with self.fortraininglib.session.get(url, headers=headers, allow_redirects=True, stream=True,
+                                                 timeout=self.fortraininglib.TIMEOUT) as response:
+                if response.status_code == 304:
+                    success = True
+                    self.logger.info(f"File {file_path} didn't change, not downloading.")
+                    return False
+                response.raise_for_status()
+                with open(temp_path, 'wb') as fh:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        fh.write(chunk)
+                        size += len(chunk)
+                os.replace(temp_path, file_path)
+                self._set_modification_time(file_path, response.headers.get("Last-Modified"))
+            success = True
             self.logger.info(f"Successfully downloaded and saved {file_path}")
             return True
+        except (requests.exceptions.RequestException, OSError) as err:
+            self.logger.warning(f"Couldn't download {filename}: {err}")
+            # Don't leave a half-written file in our export folder
+            try:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            except OSError as remove_err:
+                self.logger.warning(f"Couldn't delete {temp_path}: {remove_err}")
+            return False
+        finally:
+            self.fortraininglib.metrics.observe_request("file", "download", time.perf_counter() - start, size,
+                                                        error=not success)
+
+    def _get_sha1(self, file_path: str) -> Optional[str]:
+        """@return SHA1 hash of a local file (None if we can't read it)"""
+        sha1 = hashlib.sha1()
+        try:
+            with open(file_path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(self.CHUNK_SIZE), b""):
+                    sha1.update(chunk)
+        except OSError:
+            return None
+        return sha1.hexdigest()
+
+    def _set_modification_time(self, file_path: str, last_modified: Optional[str]) -> None:
+        """Set the modification time of a downloaded file to when it was last modified on the server"""
+        if last_modified is None:
+            return
+        try:
+            timestamp: float = parsedate_to_datetime(last_modified).timestamp()
+            os.utime(file_path, (timestamp, timestamp))
+        except (TypeError, ValueError, OSError) as err:
+            self.logger.debug(f"Couldn't set modification time of {file_path} to {last_modified}: {err}")
+
+    def _map(self, function: Callable[[T], R], items: List[T]) -> List[R]:
+        """Call function for all items (in parallel if we have several workers), results are in the same order"""
+        if self._workers == 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self._workers, len(items))) as executor:
+            return list(executor.map(function, items))
 
     def run(self, language_info: LanguageInfo, english_info: LanguageInfo, change_log: ChangeLog):
         if self._base_folder == "":
@@ -121,29 +209,31 @@ class ExportHTML(LanguagePostProcessor):
         beautifyhtml = CustomBeautifyHTML(change_hrefs=change_hrefs, file_collector=file_collector)
 
         html_counter: int = 0   # Counting exported HTML files
-        file_counter: int = 0   # Counting downloaded files (images)
 
-        # Download all worksheets and save the transformed HTML
-        for worksheet, info in language_info.worksheets.items():
-            # As elsewhere, we ignore outdated / unfinished translations
-            if not info.show_in_list(english_info.worksheets[worksheet]):
+        # Download all worksheets (in parallel) and save the transformed HTML
+        # As elsewhere, we ignore outdated / unfinished translations
+        to_export: List[Tuple[str, str]] = [
+            (worksheet, info.title) for worksheet, info in language_info.worksheets.items()
+            if info.show_in_list(english_info.worksheets[worksheet]) and
+            (self._force_rewrite or self.has_relevant_change(worksheet, change_log))]
+        contents = self._map(lambda item: self.fortraininglib.get_page_html(
+            f"{item[0]}/{language_info.language_code}"), to_export)
+        for (worksheet, title), content in zip(to_export, contents):
+            if content is None:
+                self.logger.warning(f"Couldn't get content of {worksheet}/{language_info.language_code}. Skipping")
                 continue
-            if self._force_rewrite or self.has_relevant_change(worksheet, change_log):
-                content = self.fortraininglib.get_page_html(f"{worksheet}/{language_info.language_code}")
-                if content is None:
-                    self.logger.warning(f"Couldn't get content of {worksheet}/{language_info.language_code}. Skipping")
-                    continue
-                html_counter += 1
-                filename = self.make_html_name(info.title)
-                with open(os.path.join(folder, filename), "w") as f:
-                    self.logger.info(f"Exporting HTML to {filename}")
-                    content = f"<h1>{info.title}</h1>" + beautifyhtml.process_html(content)
-                    f.write(content)
-
-        # Download all images we came across in the previous step
-        for file in file_collector:
-            if self.download_file(files_folder, file):
-                file_counter += 1
+            html_counter += 1
+            filename = self.make_html_name(title)
+            with open(os.path.join(folder, filename), "w") as f:
+                self.logger.info(f"Exporting HTML to {filename}")
+                content = f"<h1>{title}</h1>" + beautifyhtml.process_html(content)
+                f.write(content)
+
+        # Download all images we came across in the previous step (in parallel)
+        # Their URLs and hashes are requested in advance: that needs only one API call for up to 50 images
+        file_infos = self.fortraininglib.get_file_infos(sorted(file_collector))
+        file_counter = sum(self._map(lambda file: self.download_file(files_folder, file, file_infos[file] or {}),
+                                     sorted(file_collector)))
 
         # Write contents.json
         # TODO define specifications for contents.json (similar to language jsons?) - for now just a simple structure
@@ -12,7 +12,10 @@ class ExportRepository(LanguagePostProcessor):
     """
     Export the html files (result of ExportHTML) to a git repository.
     Needs to run after ExportHTML.
+    Always runs: it doesn't look at the ChangeLog but at the state of the repository
     """
+    DEPENDS_ON = ("ExportHTML",)
+
     def __init__(self, base_folder: str):
         """
         @param folder: export base directory (repositories will be in subdirectories for each language)
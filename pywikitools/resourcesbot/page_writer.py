@@ -0,0 +1,120 @@
+"""
+Load and save pages in the mediawiki system with as few requests as possible
+
+Most of our post-processors (and ResourcesBot itself) write one page per language after comparing it
+with the current content. Doing that with pywikibot page by page needs one request for checking whether
+the page exists, one for loading its content and one for saving it.
+
+PageWriter
+- loads all pages we're going to write in advance: preload() uses pywikibot's preloadpages()
+  to load up to 50 pages with one request
+- compares the hashes of the new and the current content and only saves if there is a real change
+  (whitespace at the beginning and the end doesn't count, mediawiki strips it anyway)
+- counts how many pages were loaded, saved and left unchanged (see stats)
+
+The mediawiki API can't save several pages with one request: saves still happen one by one,
+pywikibot takes care of the throttling (put_throttle in user-config.py).
+
+PageWriter is thread-safe so that several post-processors can use it in parallel.
+"""
+import hashlib
+import logging
+import threading
+from typing import Dict, Final, Iterable, List, Optional
+
+import pywikibot
+
+
+class PageWriter:
+    """
+    Usage:
+        page_writer = PageWriter(site)
+        page_writer.preload(["4training:de.json", "4training:ru.json"])     # one request
+        page_writer.write("4training:de.json", content, "Updated JSON data structure")  # saves only if changed
+    """
+    GROUP_SIZE: Final[int] = 50     # Maximum number of pages the mediawiki API returns with one request
+
+    def __init__(self, site: pywikibot.site.APISite):
+        self.logger: Final[logging.Logger] = logging.getLogger('pywikitools.resourcesbot.page_writer')
+        self._site: Final[pywikibot.site.APISite] = site
+        self._lock = threading.Lock()
+        # All pages we know: normalized title -> pywikibot page object (with loaded content if preloaded)
+        self._pages: Dict[str, pywikibot.Page] = {}
+        # Statistics: how many pages were preloaded / created without preloading / saved / not saved (no changes)
+        self.stats: Dict[str, int] = {"preloaded": 0, "loaded": 0, "saved": 0, "unchanged": 0}
+
+    @staticmethod
+    def _normalize(title: str) -> str:
+        return title.replace("_", " ").strip()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        """Hash of page content for comparing (leading and trailing whitespace is ignored)"""
+        return hashlib.sha1(content.strip().encode("utf-8")).hexdigest()
+
+    def _count(self, stat: str, number: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += number
+
+    def preload(self, titles: Iterable[str]) -> None:
+        """
+        Load the given pages (at most GROUP_SIZE with one request). Pages we know already are not loaded again.
+        If loading fails, the pages will be loaded one by one later when we need them.
+        """
+        new_pages: List[pywikibot.Page] = []
+        with self._lock:
+            for title in dict.fromkeys(self._normalize(title) for title in titles):
+                if title not in self._pages:
+                    page = pywikibot.Page(self._site, title)
+                    self._pages[title] = page
+                    new_pages.append(page)
+        if len(new_pages) == 0:
+            return
+        self.logger.debug(f"Preloading {len(new_pages)} pages")
+        try:
+            for _ in self._site.preloadpages(new_pages, groupsize=self.GROUP_SIZE):
+                pass
+            self._count("preloaded", len(new_pages))
+        except pywikibot.exceptions.Error as err:
+            self.logger.warning(f"Couldn't preload {len(new_pages)} pages: {err}")
+
+    def get_page(self, title: str) -> pywikibot.Page:
+        """@return the page object (preloaded if preload() was called for it before)"""
+        normalized: str = self._normalize(title)
+        with self._lock:
+            page: Optional[pywikibot.Page] = self._pages.get(normalized)
+            if page is None:
+                page = pywikibot.Page(self._site, title)
+                self._pages[normalized] = page
+                self.stats["loaded"] += 1
+            return page
+
+    def get_text(self, title: str) -> Optional[str]:
+        """@return content of the page; None if it doesn't exist"""
+        page = self.get_page(title)
+        return page.text if page.exists() else None
+
+    def has_changed(self, page: pywikibot.Page, content: str) -> bool:
+        """@return True if saving content would change the page (or create it)"""
+        return not page.exists() or self.content_hash(page.text) != self.content_hash(content)
+
+    def save(self, page: pywikibot.Page, content: str, summary: str) -> bool:
+        """
+        Save the page if the content really changed
+        @param page: from get_page() (or a redirect target of such a page)
+        @return True if we saved (or created) the page, False if there was no change
+        """
+        if not self.has_changed(page, content):
+            self._count("unchanged")
+            return False
+        page.text = content
+        page.save(summary)
+        self._count("saved")
+        return True
+
+    def write(self, title: str, content: str, summary: str) -> bool:
+        """
+        Write content to the given page (creating it if it doesn't exist) if it changed
+        @return True if we saved the page, False if there was no change
+        """
+        return self.save(self.get_page(title), content, summary)
@@ -0,0 +1,260 @@
+"""
+Download PDF files and analyze their metadata in the background while ResourcesBot continues to query worksheets
+
+This is a producer/consumer pipeline:
+- ResourcesBot._add_file_type() hands over a PDF with submit() (producer)
+- if we analyzed a file with the same content (SHA1 hash) already, we re-use that result (see metadata_cache.py)
+- a bounded thread pool downloads the PDFs into our temp folder (I/O bound)
+  If possible, we don't download whole files but read only the parts containing the metadata
+  with HTTP Range requests (see pdftools/rangefile.py). Then no temporary file and no analysis process is needed.
+- a process pool reads the metadata with pikepdf (CPU bound), the temporary file is deleted afterwards
+- finish() waits for everything, checks the metadata against our standards and attaches
+  the results to the FileInfo objects of the worksheets
+
+Back-pressure: At most max_files PDFs are in our temp folder at the same time.
+If that limit is reached, submit() blocks until an analysis is finished.
+
+Configuration (optional) in section [resourcesbot] of config.ini:
+pdf_downloads = 4           # How many PDFs are downloaded in parallel
+pdf_analyzers = 2           # Number of processes analyzing PDFs (0: analyze in the downloading threads)
+pdf_max_files = 8           # Maximum number of PDFs in the temp folder at the same time
+pdf_metadata_cache = /path/to/pdfmetadata.sqlite    # default: in the temp folder (empty: don't cache)
+pdf_range_requests = true   # Read only the necessary parts of PDF files (false: always download whole files)
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from configparser import ConfigParser
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from typing import Final, List, Optional, Tuple, Union
+
+import pywikibot
+import requests
+
+from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.pdftools.metadata import PdfMetadata, evaluate_metadata, read_metadata, read_metadata_timed
+from pywikitools.pdftools.metadata_cache import PdfMetadataCache
+from pywikitools.pdftools.rangefile import HttpRangeFile, RangeRequestsNotSupported
+from pywikitools.resourcesbot.data_structures import FileInfo, WorksheetInfo
+
+
+class PdfPipeline:
+    """
+    Analyze the metadata of many PDF files in parallel. Usage:
+        with PdfPipeline(fortraininglib, temp_dir) as pipeline:
+            pipeline.submit(worksheet, file_page, file_info)    # for all PDF files
+        # Now all FileInfo objects have their metadata (if the analysis was successful)
+
+    submit() is thread-safe; finish() must be called from one thread only
+    """
+    def __init__(self, fortraininglib: ForTrainingLib, temp_dir: str,
+                 downloads: int = 4, analyzers: int = 2, max_files: int = 8,
+                 cache: Optional[PdfMetadataCache] = None, range_requests: bool = False):
+        """
+        @param temp_dir: Folder where we store the downloaded PDF files until they're analyzed
+        @param downloads: maximum number of parallel downloads
+        @param analyzers: number of processes for analyzing the PDF files (0: analyze in the downloading threads)
+        @param max_files: maximum number of downloaded PDF files in temp_dir at the same time
+        @param cache: Optional cache for the metadata of PDF files we analyzed already (will be closed in finish())
+        @param range_requests: Try to read only the necessary parts of the PDF files with HTTP Range requests
+                               (falls back to downloading the whole file if that fails)
+        """
+        self.fortraininglib: Final[ForTrainingLib] = fortraininglib
+        self.logger: Final[logging.Logger] = logging.getLogger('pywikitools.resourcesbot.pdf_pipeline')
+        self._temp_dir: Final[str] = temp_dir
+        self._cache: Optional[PdfMetadataCache] = cache
+        self._download_pool: Final[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=max(1, downloads))
+        # spawn instead of fork: forking a process that runs several threads is not safe
+        self._analysis_pool: Optional[Executor] = \
+            ProcessPoolExecutor(max_workers=analyzers, mp_context=multiprocessing.get_context("spawn")) \
+            if analyzers > 0 else None
+        self._free_slots: Final[threading.BoundedSemaphore] = threading.BoundedSemaphore(max(1, max_files))
+        # All submitted PDFs in the order of submission:
+        # (worksheet, file info, file name, SHA1 hash of the file, result of download job)
+        self._jobs: List[Tuple[WorksheetInfo, FileInfo, str, Optional[str], Future]] = []
+        self._lock = threading.Lock()
+        self._range_requests: bool = range_requests
+        # requests.Session for range requests, one for each thread of our download pool
+        self._sessions = threading.local()
+        self._all_sessions: List[requests.Session] = []
+
+    @classmethod
+    def from_config(cls, fortraininglib: ForTrainingLib, config: ConfigParser) -> "PdfPipeline":
+        """Create the pipeline as configured in section [resourcesbot] of config.ini (defaults for missing options)"""
+        temp_dir: str = config.get("Paths", "temp")
+        cache_file: str = config.get("resourcesbot", "pdf_metadata_cache",
+                                     fallback=os.path.join(temp_dir, "pdfmetadata.sqlite"))
+        return cls(fortraininglib, temp_dir,
+                   downloads=config.getint("resourcesbot", "pdf_downloads", fallback=4),
+                   analyzers=config.getint("resourcesbot", "pdf_analyzers", fallback=2),
+                   max_files=config.getint("resourcesbot", "pdf_max_files", fallback=8),
+                   cache=PdfMetadataCache(cache_file) if cache_file else None,
+                   range_requests=config.getboolean("resourcesbot", "pdf_range_requests", fallback=True))
+
+    def __enter__(self) -> "PdfPipeline":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.finish()
+
+    def submit(self, worksheet: WorksheetInfo, file_page: pywikibot.FilePage, file_info: FileInfo) -> None:
+        """
+        Schedule download and analysis of a PDF file. Blocks if there are too many downloaded files already.
+        Files that we analyzed before (same SHA1 hash) aren't downloaded again.
+        @param file_page: the PDF file in the mediawiki system
+        @param file_info: already added to worksheet; will be replaced by a FileInfo with metadata in finish()
+        """
+        file_name: str = file_page.title(with_ns=False)
+        sha1: Optional[str] = getattr(file_page.latest_file_info, "sha1", None)
+        if self._cache is not None and sha1 is not None:
+            cached: Optional[PdfMetadata] = self._cache.get(sha1)
+            if cached is not None:
+                self.logger.debug(f"{file_name} didn't change, using cached metadata")
+                future: Future = Future()
+                future.set_result(cached)
+                with self._lock:
+                    self._jobs.append((worksheet, file_info, file_name, None, future))
+                return
+        self._free_slots.acquire()
+        try:
+            future = self._download_pool.submit(self._download, file_page, worksheet.language_code)
+        except RuntimeError:
+            self._free_slots.release()
+            raise
+        with self._lock:
+            self._jobs.append((worksheet, file_info, file_name, sha1, future))
+
+    def _download(self, file_page: pywikibot.FilePage,
+                  language_code: str) -> Union[None, PdfMetadata, "Future[Tuple[PdfMetadata, float]]"]:
+        """
+        Download the PDF and start its analysis (runs in our download pool)
+        @return None if the download failed; the analysis result or a Future of it if we have an analysis pool
+        """
+        if self._range_requests:
+            metadata: Optional[PdfMetadata] = self._read_partially(file_page)
+            if metadata is not None:
+                self._free_slots.release()      # we didn't need our slot in the temp folder
+                return metadata
+        try:
+            handle, temp_file = tempfile.mkstemp(prefix=f"{language_code}_", suffix=".pdf", dir=self._temp_dir)
+            os.close(handle)
+        except OSError:
+            self._free_slots.release()
+            raise
+        in_analysis: bool = False
+        try:
+            start: float = time.perf_counter()
+            downloaded: bool = False
+            try:
+                downloaded = file_page.download(temp_file)
+            finally:
+                self.fortraininglib.metrics.observe_request(
+                    "pdf", "download", time.perf_counter() - start,
+                    os.path.getsize(temp_file) if downloaded else 0, error=not downloaded)
+            if not downloaded:
+                return None
+            if self._analysis_pool is None:
+                metadata, duration = read_metadata_timed(temp_file)
+                self.fortraininglib.metrics.add_time("pdf", "analysis", duration)
+                return metadata
+            analysis: "Future[Tuple[PdfMetadata, float]]" = self._analysis_pool.submit(read_metadata_timed, temp_file)
+            analysis.add_done_callback(lambda future: self._analysis_done(future, temp_file))
+            in_analysis = True
+            return analysis
+        finally:
+            if not in_analysis:
+                self._release(temp_file)
+
+    def _read_partially(self, file_page: pywikibot.FilePage) -> Optional[PdfMetadata]:
+        """
+        Read the metadata with HTTP Range requests, transferring only the necessary parts of the file
+        @return None if that didn't work (then we need to download the whole file)
+        """
+        session: Optional[requests.Session] = getattr(self._sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._sessions.session = session
+            with self._lock:
+                self._all_sessions.append(session)
+        url: str = file_page.latest_file_info.url
+        start: float = time.perf_counter()
+        remote_file: Optional[HttpRangeFile] = None
+        try:
+            with HttpRangeFile(url, session) as remote_file:
+                metadata = read_metadata(remote_file)
+            self.logger.debug(f"Read metadata of {url} with {remote_file.requests} requests, "
+                              f"transferring {remote_file.bytes_received} of {remote_file.size} bytes")
+            self.fortraininglib.metrics.observe_request("pdf", "range", time.perf_counter() - start,
+                                                        remote_file.bytes_received)
+            return metadata
+        except RangeRequestsNotSupported as err:
+            # No need to try again for the other files
+            self.logger.info(f"Can't read PDF files partially, downloading them completely. {err}")
+            self._range_requests = False
+        except Exception as err:
+            # Maybe the file is broken or a request failed: Let's try again with the whole file
+            self.logger.info(f"Couldn't read metadata of {url} partially, downloading it completely. {err}")
+        self.fortraininglib.metrics.observe_request("pdf", "range", time.perf_counter() - start,
+                                                    remote_file.bytes_received if remote_file is not None else 0,
+                                                    error=True)
+        return None
+
+    def _analysis_done(self, analysis: "Future[Tuple[PdfMetadata, float]]", temp_file: str) -> None:
+        """Called when the analysis process is finished with a file"""
+        if not analysis.cancelled() and analysis.exception() is None:
+            self.fortraininglib.metrics.add_time("pdf", "analysis", analysis.result()[1])
+        self._release(temp_file)
+
+    def _release(self, temp_file: str) -> None:
+        """Delete a downloaded file after its analysis and free its slot"""
+        try:
+            os.remove(temp_file)
+        except OSError as err:
+            self.logger.warning(f"Couldn't delete {temp_file}: {err}")
+        self._free_slots.release()
+
+    def finish(self) -> None:
+        """
+        Wait until all submitted PDFs are analyzed, check their metadata and attach the results to the worksheets.
+        Afterwards the pipeline is shut down.
+        """
+        with self._lock:
+            jobs = self._jobs
+            self._jobs = []
+        for worksheet, file_info, file_name, sha1, future in jobs:
+            try:
+                result = future.result()
+                if isinstance(result, Future):
+                    result = result.result()[0]
+            except Exception as err:
+                # pikepdf raises different exceptions on broken files, pywikibot on download problems
+                self.logger.warning(f"Couldn't analyze PDF metadata of {file_name}: {err}")
+                continue
+            if result is None:
+                self.logger.warning(f"Downloading {file_name} failed. Couldn't analyze PDF metadata")
+                continue
+            if self._cache is not None and sha1 is not None:
+                self._cache.put(sha1, result)
+            metadata = evaluate_metadata(self.fortraininglib, result, worksheet)
+            if not metadata.correct:
+                self.logger.warning(f"{file_name} metadata is incorrect: {metadata.warnings}")
+            if not metadata.pdf1a:
+                self.logger.info(f"{file_name} is not PDF/1A")
+            if metadata.only_docinfo:
+                self.logger.info(f"{file_name} uses only outdated DocInfo in PDF metadata")
+            # FileInfo shouldn't be modified after creation: replace it (this keeps the order of the files)
+            worksheet.add_file_info(file_info=FileInfo(file_info.file_type, file_info.url, file_info.timestamp,
+                                                       translation_unit=file_info.translation_unit,
+                                                       metadata=metadata))
+        self._download_pool.shutdown()
+        if self._analysis_pool is not None:
+            self._analysis_pool.shutdown()
+        for session in self._all_sessions:
+            session.close()
+        self._all_sessions.clear()
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
@@ -5,18 +5,49 @@ If the functionality looks only at one language at a time, implement LanguagePos
 If the functionality needs to look at everything, implement GlobalPostProcessor.
 The resourcesbot will first call any LanguagePostProcessors for each language and
 afterwards call any GlobalPostProcessor
+
+Each post-processor declares
+- DEPENDS_ON: the names (class names) of the post-processors that need to run before it
+- RELEVANT_CHANGES: the types of changes it reacts to. If the ChangeLog doesn't contain any of them,
+  the post-processor is skipped. None means the post-processor always needs to run.
+The scheduler (see scheduler.py) builds the dependency graph from that.
+
+Post-processors writing pages in the mediawiki system list them in pages_to_preload(): then
+ResourcesBot loads all of them with a few requests before running the post-processors (see page_writer.py).
 """
 from abc import ABC, abstractmethod
-from typing import Dict
-from pywikitools.resourcesbot.changes import ChangeLog
+from typing import ClassVar, Dict, FrozenSet, List, Optional, Tuple
+from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
 from pywikitools.resourcesbot.data_structures import LanguageInfo
 
+# Use as RELEVANT_CHANGES if a post-processor reacts to any change
+ALL_CHANGES: FrozenSet[ChangeType] = frozenset(ChangeType)
+
 
 class LanguagePostProcessor(ABC):
     """Base class for all functionality doing useful stuff with the data on one language.
 
     We include information on English as well because several post-processors need it as reference
     """
+    DEPENDS_ON: ClassVar[Tuple[str, ...]] = ()
+    RELEVANT_CHANGES: ClassVar[Optional[FrozenSet[ChangeType]]] = None
+
+    @classmethod
+    def name(cls) -> str:
+        return cls.__name__
+
+    def is_relevant(self, change_log: ChangeLog) -> bool:
+        """
+        Is there anything to do for this post-processor? If not, the scheduler skips it.
+        Post-processors that can be forced to rewrite everything need to override this.
+        """
+        if self.RELEVANT_CHANGES is None:
+            return True
+        return any(change_item.change_type in self.RELEVANT_CHANGES for change_item in change_log)
+
+    def pages_to_preload(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[str]:
+        """Titles of the pages that run() is probably going to load and write for this language"""
+        return []
 
     @abstractmethod
     def run(self, language_info: LanguageInfo, english_info: LanguageInfo, change_log: ChangeLog):
@@ -26,6 +57,23 @@ class LanguagePostProcessor(ABC):
 
 class GlobalPostProcessor(ABC):
     """Base class for all functionality doing useful stuff with the data on all languages"""
+    DEPENDS_ON: ClassVar[Tuple[str, ...]] = ()
+    RELEVANT_CHANGES: ClassVar[Optional[FrozenSet[ChangeType]]] = None
+
+    @classmethod
+    def name(cls) -> str:
+        return cls.__name__
+
+    def is_relevant(self, changes: Dict[str, ChangeLog]) -> bool:
+        """Is there anything to do for this post-processor? If not, the scheduler skips it."""
+        if self.RELEVANT_CHANGES is None:
+            return True
+        return any(change_item.change_type in self.RELEVANT_CHANGES
+                   for change_log in changes.values() for change_item in change_log)
+
+    def pages_to_preload(self, language_data: Dict[str, LanguageInfo]) -> List[str]:
+        """Titles of the pages that run() is probably going to load and write"""
+        return []
 
     @abstractmethod
     def run(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog]):
@@ -0,0 +1,243 @@
+"""
+Run all post-processors: the LanguagePostProcessors for all languages, afterwards the GlobalPostProcessors
+
+The post-processors declare what they depend on and which changes they care about (see post_processing.py).
+From that we build a dependency graph:
+- A post-processor only runs after all post-processors it depends on (e.g. ExportRepository after ExportHTML)
+  finished successfully for the same language
+- A post-processor is skipped if the ChangeLog doesn't contain anything relevant for it
+- If a post-processor fails for one language, the other languages are not affected.
+  For that language, post-processors depending on the failed one are skipped.
+- We measure how much time each post-processor needs (summed up over all languages)
+
+Most of the post-processing is waiting for I/O (downloading HTML and images, saving pages with pywikibot,
+API requests), so a pool of threads processes several languages and independent post-processors
+of the same language at the same time. With only one worker, everything runs one after the other:
+language by language, the post-processors in the order they were added (as far as the dependencies allow).
+
+Configuration (optional) in section [resourcesbot] of config.ini:
+postprocessing_workers = 4      # Number of post-processors running in parallel (default: 1)
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Final, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from pywikitools.instrumentation import Metrics
+from pywikitools.resourcesbot.changes import ChangeLog
+from pywikitools.resourcesbot.data_structures import LanguageInfo
+from pywikitools.resourcesbot.post_processing import GlobalPostProcessor, LanguagePostProcessor
+
+PostProcessor = Union[LanguagePostProcessor, GlobalPostProcessor]
+
+
+class PostProcessingScheduler:
+    """
+    Usage:
+        scheduler = PostProcessingScheduler(workers=4)
+        scheduler.add(ExportRepository(...))    # The order doesn't matter: ExportRepository declares
+        scheduler.add(ExportHTML(...))          # that it depends on ExportHTML
+        scheduler.add(WriteSummary(...))
+        scheduler.run(language_data, changes)
+    """
+    def __init__(self, workers: int = 1, metrics: Optional[Metrics] = None):
+        """
+        @param workers: number of post-processors running in parallel (1: one after the other)
+        @param metrics: Optional: where to record the time needed per post-processor and per language
+        """
+        self.logger: Final[logging.Logger] = logging.getLogger('pywikitools.resourcesbot.scheduler')
+        self._workers: Final[int] = max(1, workers)
+        self._metrics: Final[Optional[Metrics]] = metrics
+        self._language_processors: Dict[str, LanguagePostProcessor] = {}
+        self._global_processors: Dict[str, GlobalPostProcessor] = {}
+        self._lock = threading.Lock()
+        # Time (in seconds) each post-processor needed for all languages together
+        self.timings: Dict[str, float] = {}
+        # Post-processors that failed or were skipped because a dependency failed:
+        # language code -> names of post-processors (GlobalPostProcessors are listed under "")
+        self.failures: Dict[str, List[str]] = {}
+        # How often each post-processor was skipped because there was nothing relevant in the ChangeLog
+        self.skipped: Dict[str, int] = {}
+
+    def add(self, processor: PostProcessor) -> None:
+        """
+        Register a post-processor (its name is its class name, see LanguagePostProcessor.name())
+        @raise ValueError if a post-processor with the same name was added already
+        """
+        name: str = processor.name()
+        if name in self._language_processors or name in self._global_processors:
+            raise ValueError(f"Post-processor {name} is already added")
+        if isinstance(processor, GlobalPostProcessor):
+            self._global_processors[name] = processor
+        else:
+            self._language_processors[name] = processor
+        self.timings[name] = 0.0
+        self.skipped[name] = 0
+
+    @staticmethod
+    def _sort(processors: Mapping[str, PostProcessor], satisfied: Set[str]) -> List[str]:
+        """
+        Order post-processors so that each one comes after its dependencies. Otherwise we keep the order they were
+        added in. Dependencies in satisfied are ignored (GlobalPostProcessors may depend on LanguagePostProcessors).
+        @raise ValueError if there is a dependency on an unknown post-processor or a circular dependency
+        """
+        for name, processor in processors.items():
+            for dependency in processor.DEPENDS_ON:
+                if dependency not in processors and dependency not in satisfied:
+                    raise ValueError(f"Post-processor {name} depends on {dependency} which wasn't added")
+        result: List[str] = []
+        remaining: List[str] = list(processors)
+        while len(remaining) > 0:
+            for name in remaining:
+                if all(dependency in result or dependency in satisfied
+                       for dependency in processors[name].DEPENDS_ON):
+                    result.append(name)
+                    remaining.remove(name)
+                    break
+            else:
+                raise ValueError(f"Circular dependency between post-processors {', '.join(remaining)}")
+        return result
+
+    def pages_to_preload(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog]) -> List[str]:
+        """
+        Titles of all pages that the post-processors are going to write in run()
+        (post-processors that will be skipped as irrelevant are left out, see PageWriter.preload())
+        """
+        titles: List[str] = []
+        for lang, language_info in language_data.items():
+            change_log: ChangeLog = changes.get(lang, ChangeLog())
+            for processor in self._language_processors.values():
+                if processor.is_relevant(change_log):
+                    titles.extend(processor.pages_to_preload(language_info, change_log))
+        for global_processor in self._global_processors.values():
+            if global_processor.is_relevant(changes):
+                titles.extend(global_processor.pages_to_preload(language_data))
+        return titles
+
+    def run(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog]) -> None:
+        """
+        Run all LanguagePostProcessors for all languages, afterwards all GlobalPostProcessors.
+        Returns when everything is finished.
+        @param language_data: language code -> all information on that language (must include "en")
+        @param changes: language code -> what changed since our last run
+        @raise ValueError if the dependencies of the post-processors are invalid
+        """
+        assert "en" in language_data
+        order: List[str] = self._sort(self._language_processors, set())
+        global_order: List[str] = self._sort(self._global_processors, set(self._language_processors))
+        # Which post-processors finished successfully (or were skipped as irrelevant) for each language
+        succeeded: Dict[str, Set[str]] = {lang: set() for lang in language_data}
+        if self._workers > 1:
+            self._run_parallel(language_data, changes, order, succeeded)
+        else:
+            for lang in language_data:
+                for name in order:
+                    self._run_language_processor(name, language_data[lang], language_data["en"], changes[lang],
+                                                 succeeded[lang])
+
+        global_succeeded: Set[str] = set()
+        for name in global_order:
+            processor = self._global_processors[name]
+            if not all(dependency in global_succeeded for dependency in processor.DEPENDS_ON
+                       if dependency in self._global_processors):
+                self.logger.warning(f"Skipping {name} because a post-processor it depends on failed")
+                self.failures.setdefault("", []).append(name)
+            elif not processor.is_relevant(changes):
+                self.skipped[name] += 1
+                global_succeeded.add(name)
+            elif self._measure(name, lambda: processor.run(language_data, changes), None):
+                global_succeeded.add(name)
+            else:
+                self.failures.setdefault("", []).append(name)
+
+        self.logger.info("Time needed by post-processors: " +
+                         ", ".join(f"{name}: {duration:.1f}s" for name, duration in self.timings.items()))
+        skipped: List[str] = [f"{name} ({count}x)" for name, count in self.skipped.items() if count > 0]
+        if len(skipped) > 0:
+            self.logger.info(f"Skipped because of no relevant changes: {', '.join(skipped)}")
+
+    def _run_parallel(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog],
+                      order: Sequence[str], succeeded: Dict[str, Set[str]]) -> None:
+        """
+        Run the LanguagePostProcessors in our thread pool: As soon as all dependencies of a post-processor
+        are finished for a language, it can start
+        """
+        dependents: Dict[str, List[str]] = {name: [] for name in order}
+        for name in order:
+            for dependency in self._language_processors[name].DEPENDS_ON:
+                dependents[dependency].append(name)
+        # (language code, post-processor) -> number of dependencies that still need to finish
+        waiting_for: Dict[Tuple[str, str], int] = {(lang, name): len(self._language_processors[name].DEPENDS_ON)
+                                                   for lang in language_data for name in order}
+        remaining: List[int] = [len(waiting_for)]
+        all_done = threading.Event()
+        if remaining[0] == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            def task(lang: str, name: str) -> None:
+                try:
+                    self._run_language_processor(name, language_data[lang], language_data["en"], changes[lang],
+                                                 succeeded[lang])
+                finally:
+                    ready: List[str] = []
+                    with self._lock:
+                        for dependent in dependents[name]:
+                            waiting_for[(lang, dependent)] -= 1
+                            if waiting_for[(lang, dependent)] == 0:
+                                ready.append(dependent)
+                        remaining[0] -= 1
+                        if remaining[0] == 0:
+                            all_done.set()
+                    for dependent in ready:
+                        executor.submit(task, lang, dependent)
+
+            for lang in language_data:
+                for name in order:
+                    if waiting_for[(lang, name)] == 0:
+                        executor.submit(task, lang, name)
+            all_done.wait()
+
+    def _run_language_processor(self, name: str, language_info: LanguageInfo, english_info: LanguageInfo,
+                                change_log: ChangeLog, succeeded: Set[str]) -> None:
+        """Run one LanguagePostProcessor for one language (if its dependencies succeeded and it has to do something)"""
+        lang: str = language_info.language_code
+        processor = self._language_processors[name]
+        missing: List[str] = [dependency for dependency in processor.DEPENDS_ON if dependency not in succeeded]
+        if len(missing) > 0:
+            self.logger.warning(f"Skipping {name} for language {lang} because {', '.join(missing)} failed")
+        elif not processor.is_relevant(change_log):
+            self.logger.debug(f"Skipping {name} for language {lang}: no relevant changes")
+            with self._lock:
+                self.skipped[name] += 1
+                succeeded.add(name)
+            return
+        elif self._measure(name, lambda: processor.run(language_info, english_info, change_log), lang):
+            with self._lock:
+                succeeded.add(name)
+            return
+        with self._lock:
+            self.failures.setdefault(lang, []).append(name)
+
+    def _measure(self, name: str, function, lang: Optional[str]) -> bool:
+        """
+        Run a post-processor and add the time it needed to our timings
+        @param lang: language code (None for GlobalPostProcessors)
+        @return False if it raised an exception
+        """
+        start: float = time.perf_counter()
+        try:
+            function()
+            return True
+        except Exception:
+            self.logger.exception(f"{name} failed for {'all languages' if lang is None else f'language {lang}'}")
+            return False
+        finally:
+            duration: float = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] += duration
+            if self._metrics is not None:
+                self._metrics.add_time("postprocessor", name, duration)
+                if lang is not None:
+                    self._metrics.add_time("language", lang, duration)
@@ -0,0 +1,97 @@
+"""
+Local snapshot of the data ResourcesBot gathered in its last run (all LanguageInfo objects)
+
+Every run stores its results here in addition to the JSON pages in the mediawiki system
+(e.g. https://www.4training.net/4training:de.json). With --read-from-snapshot the bot loads everything
+from this file without loading any page from the mediawiki system. That makes developing post-processors
+and re-running them cheap and works offline.
+
+The snapshot is a SQLite file with one row for each language, containing the compressed JSON
+(same format as in the mediawiki system, see language_info_to_json()).
+
+Configuration (optional) in section [resourcesbot] of config.ini:
+snapshot = /path/to/snapshot.sqlite     # default: in the temp folder (empty: don't store snapshots)
+"""
+from configparser import ConfigParser
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Final, Iterable, Optional
+
+from pywikitools.resourcesbot.data_structures import LanguageInfo, language_info_from_json, language_info_to_json
+
+
+class Snapshot:
+    """Stores the results of a ResourcesBot run in a SQLite file"""
+    COMPRESSION_LEVEL: Final[int] = 6
+
+    def __init__(self, path: str):
+        """
+        @param path: SQLite file to store the snapshot in (will be created if necessary)
+        """
+        self.logger = logging.getLogger('pywikitools.resourcesbot.snapshot')
+        self.path: Final[str] = path
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS languages (language_code TEXT PRIMARY KEY, "
+                                     "data BLOB, saved REAL)")
+
+    @classmethod
+    def from_config(cls, config: ConfigParser) -> Optional["Snapshot"]:
+        """Open the snapshot as configured in section [resourcesbot] of config.ini (None if disabled)"""
+        path: str = config.get("resourcesbot", "snapshot",
+                               fallback=os.path.join(config.get("Paths", "temp"), "snapshot.sqlite"))
+        if not path:
+            return None
+        return cls(path)
+
+    def save(self, result: Dict[str, LanguageInfo], complete: bool = True) -> None:
+        """
+        Store the results of a run
+        @param result: language code -> all information on that language
+        @param complete: Does result contain all our languages? Then languages that are not included anymore
+                         are removed from the snapshot. Use False if we only looked at some languages.
+        """
+        now = time.time()
+        rows = [(lang, zlib.compress(language_info_to_json(language_info).encode("utf-8"), self.COMPRESSION_LEVEL),
+                 now) for lang, language_info in result.items()]
+        with self._connection:
+            if complete:
+                self._connection.execute("DELETE FROM languages")
+            self._connection.executemany("INSERT OR REPLACE INTO languages VALUES (?, ?, ?)", rows)
+        self.logger.info(f"Saved snapshot of {len(rows)} languages to {self.path}")
+
+    def load(self, languages: Optional[Iterable[str]] = None) -> Dict[str, LanguageInfo]:
+        """
+        Load the results of our last run
+        @param languages: only load these languages (default: all)
+        @return language code -> all information on that language (sorted by language code)
+        @raise RuntimeError if the snapshot is empty, doesn't contain a requested language or is broken
+        """
+        if languages is None:
+            rows = self._connection.execute("SELECT language_code, data FROM languages "
+                                            "ORDER BY language_code").fetchall()
+            if len(rows) == 0:
+                raise RuntimeError(f"Snapshot {self.path} is empty")
+        else:
+            rows = []
+            for lang in languages:
+                row = self._connection.execute("SELECT language_code, data FROM languages WHERE language_code = ?",
+                                               (lang,)).fetchone()
+                if row is None:
+                    raise RuntimeError(f"Snapshot {self.path} doesn't contain language {lang}")
+                rows.append(row)
+        result: Dict[str, LanguageInfo] = {}
+        try:
+            for lang, data in rows:
+                language_info = language_info_from_json(zlib.decompress(data))
+                assert language_info.language_code == lang
+                result[lang] = language_info
+        except (AssertionError, ValueError, zlib.error):
+            raise RuntimeError(f"Unexpected error while parsing snapshot {self.path}.")
+        return result
+
+    def close(self) -> None:
+        self._connection.close()
@@ -1,9 +1,10 @@
 import re
 import logging
-from typing import Final, Optional, Tuple
+from typing import Final, List, Optional, Tuple
 
 import pywikibot
 from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+from pywikitools.resourcesbot.page_writer import PageWriter
 from pywikitools.resourcesbot.post_processing import LanguagePostProcessor
 from pywikitools.resourcesbot.data_structures import FileInfo, LanguageInfo
 from pywikitools.fortraininglib import ForTrainingLib
@@ -17,22 +18,36 @@ class WriteList(LanguagePostProcessor):
 
     This class can be re-used to call run() several times
     """
+    # New / deleted ODT files are only relevant if the worksheet has a PDF (see needs_rewrite())
+    RELEVANT_CHANGES = frozenset([ChangeType.UPDATED_PDF, ChangeType.NEW_PDF, ChangeType.DELETED_PDF,
+                                  ChangeType.NEW_WORKSHEET, ChangeType.DELETED_WORKSHEET,
+                                  ChangeType.NEW_ODT, ChangeType.DELETED_ODT])
+
     def __init__(self, fortraininglib: ForTrainingLib, site: pywikibot.site.APISite,
-                 user_name: str, password: str, force_rewrite: bool = False):
+                 user_name: str, password: str, force_rewrite: bool = False,
+                 page_writer: Optional[PageWriter] = None):
         """
         @param user_name and password necessary to mark page for translation in case of changes
                In case they're empty we won't try to mark pages for translation
         @param force_rewrite rewrite even if there were no (relevant) changes
+        @param page_writer: shared PageWriter with preloaded pages (default: each run() loads its page itself)
         """
         self.fortraininglib: Final[ForTrainingLib] = fortraininglib
         self._site: Final[pywikibot.site.APISite] = site
         self._user_name: Final[str] = user_name
         self._password: Final[str] = password
         self._force_rewrite: Final[bool] = force_rewrite
+        self._page_writer: Final[Optional[PageWriter]] = page_writer
         self.logger: logging.Logger = logging.getLogger('pywikitools.resourcesbot.write_lists')
         if user_name == "" or password == "":
             self.logger.warning("Missing user name and/or password in config. Won't mark pages for translation.")
 
+    def is_relevant(self, change_log: ChangeLog) -> bool:
+        return self._force_rewrite or super().is_relevant(change_log)
+
+    def pages_to_preload(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[str]:
+        return [language_info.english_name] if language_info.english_name != "" else []
+
     def needs_rewrite(self, language_info: LanguageInfo, change_log: ChangeLog) -> bool:
         """Determine whether the list of available training resources needs to be rewritten."""
         lang = language_info.language_code
@@ -131,7 +146,8 @@ class WriteList(LanguagePostProcessor):
             self.logger.warning(f"English language name of {language_info.language_code} missing! Skipping WriteList")
             return
         self.logger.debug(f"Writing list of available resources in {language}...")
-        page = pywikibot.Page(self._site, language)
+        page_writer: PageWriter = self._page_writer if self._page_writer is not None else PageWriter(self._site)
+        page = page_writer.get_page(language)
         if not page.exists():
             self.logger.warning(f"Language information page {language} doesn't exist!")
             return
@@ -152,11 +168,10 @@ class WriteList(LanguagePostProcessor):
         new_page_content += page.text[list_end+1:]
         self.logger.debug(new_page_content)
 
-        # Save page and mark it for translation if necessary
-        if page.text.strip() == new_page_content.strip():
+        # Save page (if there are real changes) and mark it for translation if necessary
+        # TODO write list of changes here in the save message
+        if not page_writer.save(page, new_page_content, "Updated list of available training resources"):
             return
-        page.text = new_page_content
-        page.save("Updated list of available training resources")  # TODO write list of changes here in the save message
         if self._user_name != '' and self._password != '':
             self.fortraininglib.mark_for_translation(page.title(), self._user_name, self._password)
             self.logger.info(f"Updated language information page {language} and marked it for translation.")
@@ -1,11 +1,12 @@
 from enum import Enum
 import logging
-from typing import Optional
+from typing import List, Optional
 import pywikibot
 from pywikitools.fortraininglib import ForTrainingLib
 from pywikitools.resourcesbot.changes import ChangeLog
 from pywikitools.resourcesbot.data_structures import LanguageInfo, WorksheetInfo
-from pywikitools.resourcesbot.post_processing import LanguagePostProcessor
+from pywikitools.resourcesbot.page_writer import PageWriter
+from pywikitools.resourcesbot.post_processing import ALL_CHANGES, LanguagePostProcessor
 
 
 class Color(Enum):
@@ -27,16 +28,29 @@ class WriteReport(LanguagePostProcessor):
     Do we have ODT and PDF files for download?
     To help interpreting the results, we use colors (green / orange / red) for each cell.
     """
-    def __init__(self, fortraininglib: ForTrainingLib, site: pywikibot.site.APISite, force_rewrite: bool = False):
+    RELEVANT_CHANGES = ALL_CHANGES
+
+    def __init__(self, fortraininglib: ForTrainingLib, site: pywikibot.site.APISite, force_rewrite: bool = False,
+                 page_writer: Optional[PageWriter] = None):
         """
         @param site: our pywikibot object to be able to write to the mediawiki system
         @param force_rewrite: rewrite even if there were no (relevant) changes
+        @param page_writer: shared PageWriter with preloaded pages (default: load each report page separately)
         """
         self.fortraininglib: ForTrainingLib = fortraininglib
         self._site: pywikibot.site.APISite = site
         self._force_rewrite: bool = force_rewrite
+        self._page_writer: Optional[PageWriter] = page_writer
         self.logger = logging.getLogger('pywikitools.resourcesbot.write_report')
 
+    def is_relevant(self, change_log: ChangeLog) -> bool:
+        return self._force_rewrite or super().is_relevant(change_log)
+
+    def pages_to_preload(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[str]:
+        if language_info.english_name == "" or language_info.language_code == "en":
+            return []
+        return [f"4training:{language_info.english_name}"]
+
     def run(self, language_info: LanguageInfo, english_info: LanguageInfo, change_log: ChangeLog):
         """Entry function"""
         if self._force_rewrite or not change_log.is_empty():
@@ -59,17 +73,15 @@ class WriteReport(LanguagePostProcessor):
             self.logger.warning(f"English name of language {language_info.language_code} empty! Skipping WriteReport")
             return
         page_url = f"4training:{language_info.english_name}"
-        page = pywikibot.Page(self._site, page_url)
+        page_writer: PageWriter = self._page_writer if self._page_writer is not None else PageWriter(self._site)
+        page = page_writer.get_page(page_url)
         report = self.create_mediawiki(language_info, english_info)
         if not page.exists():
             self.logger.warning(f"Language report page {page_url} doesn't exist, creating...")
-            page.text = report
-            page.save("Created language report")
-        else:
-            if page.text != report:
-                page.text = report
-                page.save("Updated language report")    # TODO write human-readable changes here in the save message
-                self.logger.info(f"Updated language report for {language_info.english_name}")
+            page_writer.save(page, report, "Created language report")
+        # TODO write human-readable changes here in the save message
+        elif page_writer.save(page, report, "Updated language report"):
+            self.logger.info(f"Updated language report for {language_info.english_name}")
 
     def create_mediawiki(self, language_info: LanguageInfo, english_info: LanguageInfo) -> str:
         """Build mediawiki code for the complete report page"""
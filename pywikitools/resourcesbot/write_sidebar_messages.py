@@ -1,8 +1,10 @@
 import logging
-from typing import Final
+import threading
+from typing import Dict, Final, List, Optional, Tuple
 
 import pywikibot
 from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+from pywikitools.resourcesbot.page_writer import PageWriter
 from pywikitools.resourcesbot.post_processing import LanguagePostProcessor
 from pywikitools.resourcesbot.data_structures import LanguageInfo, WorksheetInfo
 from pywikitools.fortraininglib import ForTrainingLib
@@ -16,35 +18,61 @@ class WriteSidebarMessages(LanguagePostProcessor):
     E.g. write German headline of "Hearing from God"
     to https://www.4training.net/MediaWiki:Sidebar-hearingfromgod/de
 
+    All system messages of a language that need to be checked are loaded with one request
+    (or ResourcesBot preloads them for all languages, see pages_to_preload()). We compare them locally
+    and only save the messages that really changed.
+    With dry_run we don't save anything but collect what would change (see dry_run_report).
+
     More information on system messages: https://www.mediawiki.org/wiki/Help:System_message
 
     This class can be re-used to call run() several times
     """
+    RELEVANT_CHANGES = frozenset([ChangeType.NEW_WORKSHEET, ChangeType.UPDATED_WORKSHEET])
+
     def __init__(self, fortraininglib: ForTrainingLib, site: pywikibot.site.APISite,
-                 force_rewrite: bool = False):
+                 force_rewrite: bool = False, page_writer: Optional[PageWriter] = None, dry_run: bool = False):
         """
         @param force_rewrite rewrite even if there were no (relevant) changes
+        @param page_writer: shared PageWriter with preloaded pages (default: each run() loads its messages itself)
+        @param dry_run: don't write anything, only collect what would change in dry_run_report
         """
         self.fortraininglib: Final[ForTrainingLib] = fortraininglib
         self._site: Final[pywikibot.site.APISite] = site
         self._force_rewrite: Final[bool] = force_rewrite
+        self._page_writer: Final[Optional[PageWriter]] = page_writer
+        self._dry_run: Final[bool] = dry_run
+        self._lock = threading.Lock()
+        # Dry run: system messages that would be written: title -> (current content or None, new content)
+        self.dry_run_report: Dict[str, Tuple[Optional[str], str]] = {}
         self.logger: logging.Logger = logging.getLogger('pywikitools.resourcesbot.write_sidebar_messages')
 
-    def save_worksheet_title(self, worksheet: WorksheetInfo):
-        """Save system message with the title of the given worksheet."""
+    def get_message_title(self, worksheet: WorksheetInfo) -> str:
+        """@return title of the system message with the title of the given worksheet"""
         title = f"MediaWiki:{self.fortraininglib.title_to_message(worksheet.page).capitalize()}"
         if worksheet.language_code != "en":
             title += f"/{worksheet.language_code}"
+        return title
+
+    def save_worksheet_title(self, worksheet: WorksheetInfo, page_writer: Optional[PageWriter] = None):
+        """
+        Save system message with the title of the given worksheet (only if it changed)
+        @param page_writer: where the system message was preloaded (default: load it now)
+        """
+        title = self.get_message_title(worksheet)
         self.logger.debug(f"save_worksheet_title(): title = {title}")
-        page = pywikibot.Page(self._site, title)
-        previous_content = ""
-        if page.exists():
-            previous_content = page.text
+        if page_writer is None:
+            page_writer = self._page_writer if self._page_writer is not None else PageWriter(self._site)
+        if self._dry_run:
+            page = page_writer.get_page(title)
+            if page_writer.has_changed(page, worksheet.title):
+                with self._lock:
+                    self.dry_run_report[title] = (page.text if page.exists() else None, worksheet.title)
+            return
+        if page_writer.write(title, worksheet.title, "Updated translated worksheet title"):
+            self.logger.info(f"Updated system message {title}")
 
-        if previous_content != worksheet.title:
-            self.logger.info(f"Updating system message {title}")
-            page.text = worksheet.title
-            page.save("Updated translated worksheet title")
+    def is_relevant(self, change_log: ChangeLog) -> bool:
+        return self._force_rewrite or super().is_relevant(change_log)
 
     @staticmethod
     def has_relevant_change(worksheet: str, change_log: ChangeLog) -> bool:
@@ -59,10 +87,31 @@ class WriteSidebarMessages(LanguagePostProcessor):
                     return True
         return False
 
+    def _worksheets_to_write(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[WorksheetInfo]:
+        """@return all worksheets whose system message we need to check"""
+        return [worksheet for worksheet in language_info.worksheets.values() if worksheet.title != "" and
+                (self._force_rewrite or self.has_relevant_change(worksheet.page, change_log))]
+
+    def pages_to_preload(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[str]:
+        return [self.get_message_title(worksheet) for worksheet in self._worksheets_to_write(language_info, change_log)]
+
+    def format_dry_run_report(self) -> str:
+        """@return human-readable list of all system messages that would be written"""
+        if len(self.dry_run_report) == 0:
+            return "Dry run: no system messages would change."
+        lines: List[str] = [f"Dry run: {len(self.dry_run_report)} system messages would change:"]
+        for title in sorted(self.dry_run_report):
+            old_content, new_content = self.dry_run_report[title]
+            lines.append(f"{title}: {'(new)' if old_content is None else repr(old_content)} -> {new_content!r}")
+        return "\n".join(lines)
+
     def run(self, language_info: LanguageInfo, english_info: LanguageInfo, change_log: ChangeLog) -> None:
         """Our entry function"""
-        for worksheet in language_info.worksheets.values():
-            if worksheet.title == "":
-                continue
-            if self._force_rewrite or self.has_relevant_change(worksheet.page, change_log):
-                self.save_worksheet_title(worksheet)
+        worksheets: List[WorksheetInfo] = self._worksheets_to_write(language_info, change_log)
+        if len(worksheets) == 0:
+            return
+        page_writer: PageWriter = self._page_writer if self._page_writer is not None else PageWriter(self._site)
+        # Load all system messages of this language with one request (if they weren't preloaded already)
+        page_writer.preload([self.get_message_title(worksheet) for worksheet in worksheets])
+        for worksheet in worksheets:
+            self.save_worksheet_title(worksheet, page_writer)
@@ -1,10 +1,11 @@
 from collections import Counter
 import logging
-from typing import Dict
+from typing import Dict, List, Optional
 import pywikibot
 from pywikitools.resourcesbot.changes import ChangeLog
 from pywikitools.resourcesbot.data_structures import LanguageInfo
-from pywikitools.resourcesbot.post_processing import GlobalPostProcessor
+from pywikitools.resourcesbot.page_writer import PageWriter
+from pywikitools.resourcesbot.post_processing import ALL_CHANGES, GlobalPostProcessor
 
 
 class WriteSummary(GlobalPostProcessor):
@@ -18,17 +19,30 @@ class WriteSummary(GlobalPostProcessor):
     This is a summary of all the language reports written by WriteReport.
     It will be written to https://www.4training.net/4training:Summary - see also there for more explanations
     """
-    def __init__(self, site: pywikibot.site.APISite, force_rewrite: bool = False):
+    RELEVANT_CHANGES = ALL_CHANGES
+
+    PAGE_URL = "4training:Summary"
+
+    def __init__(self, site: pywikibot.site.APISite, force_rewrite: bool = False,
+                 page_writer: Optional[PageWriter] = None):
         """
         Args:
             site: our pywikibot object to be able to write to the mediawiki system
             force_rewrite: rewrite report even if there were no (relevant) changes
+            page_writer: shared PageWriter with preloaded pages (default: load the summary page separately)
         """
         self._site = site
         self._force_rewrite = force_rewrite
+        self._page_writer: Optional[PageWriter] = page_writer
         self.logger = logging.getLogger('pywikitools.resourcesbot.write_summary')
         self.total_stats: Counter = Counter()   # Summing up statistics for all languages
 
+    def is_relevant(self, changes: Dict[str, ChangeLog]) -> bool:
+        return bool(self._force_rewrite) or super().is_relevant(changes)
+
+    def pages_to_preload(self, language_data: Dict[str, LanguageInfo]) -> List[str]:
+        return [self.PAGE_URL]
+
     def run(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog]):
         """Entry function"""
         has_changes = False
@@ -49,18 +63,15 @@ class WriteSummary(GlobalPostProcessor):
             self.logger.warning("No English language info found. Can't write summary report.")
             return
 
-        page_url = "4training:Summary"
-        page = pywikibot.Page(self._site, page_url)
+        page_writer: PageWriter = self._page_writer if self._page_writer is not None else PageWriter(self._site)
+        page = page_writer.get_page(self.PAGE_URL)
         report = self.create_mediawiki(language_data)
         if not page.exists():
-            self.logger.warning(f"Summary report page {page_url} doesn't exist, creating...")
-            page.text = report
-            page.save("Created summary report")
-        else:
-            if page.text != report:
-                page.text = report
-                page.save("Updated summary report")    # TODO write human-readable changes here in the save message
-                self.logger.info("Updated summary report")
+            self.logger.warning(f"Summary report page {self.PAGE_URL} doesn't exist, creating...")
+            page_writer.save(page, report, "Created summary report")
+        # TODO write human-readable changes here in the save message
+        elif page_writer.save(page, report, "Updated summary report"):
+            self.logger.info("Updated summary report")
 
     def create_mediawiki(self, language_data: Dict[str, LanguageInfo]) -> str:
         """Build mediawiki code for the complete summary page"""
@@ -0,0 +1,159 @@
+"""
+How ForTrainingLib (and AsyncForTrainingLib) retry failed API requests and how fast they may send requests
+
+- Timeouts, connection errors, HTTP 429 / 503 and mediawiki maxlag errors are retried
+- Between attempts we wait with exponential backoff plus some random jitter,
+  but at least as long as the server asks for with a Retry-After header
+- An optional token bucket limits how many requests per second are sent to one host
+  (shared by all ForTrainingLib instances in this process, e.g. several threads)
+- Counters show what happened, so that throughput can be tuned without overloading the wiki
+
+Configuration (optional) in section [mediawiki] of config.ini:
+max_attempts = 3            # How often a request is tried before giving up
+backoff = 1                 # Seconds to wait before the first retry (doubling for every further retry)
+maxlag = 5                  # see https://www.mediawiki.org/wiki/Manual:Maxlag_parameter (0 to disable)
+requests_per_second = 10    # Limit for requests to our mediawiki server (0: no limit)
+"""
+from configparser import ConfigParser
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import threading
+import time
+from typing import Any, Dict, Final, Optional
+
+
+class RequestCounters:
+    """Thread-safe counters about sent requests"""
+    NAMES: Final = ["requests", "retries", "timeouts", "connection_errors", "throttled", "maxlag", "failed",
+                    "waited"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {name: 0 for name in self.NAMES}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def as_dict(self) -> Dict[str, float]:
+        """
+        @return requests: number of sent requests (including retries); retries: how many of them were retries;
+        timeouts / connection_errors / throttled (HTTP 429 or 503) / maxlag: how often these problems occurred;
+        failed: how many requests we gave up on; waited: total number of seconds we slept because of backoff
+        and rate limiting
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name}: {round(value, 1)}" for name, value in self.as_dict().items())
+
+
+class RateLimiter:
+    """
+    Token bucket: allows up to requests_per_second requests on average, with bursts of up to burst requests
+
+    Thread-safe. There is only one RateLimiter per host (use for_host())
+    """
+    _registry: Dict[str, "RateLimiter"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, requests_per_second: float, burst: Optional[int] = None):
+        self.requests_per_second: Final[float] = requests_per_second
+        self.burst: Final[float] = burst if burst is not None else max(1.0, requests_per_second)
+        self._tokens: float = self.burst
+        self._last: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host: str, requests_per_second: float) -> Optional["RateLimiter"]:
+        """Get the RateLimiter for this host (None if requests_per_second is 0: no limit)"""
+        if requests_per_second <= 0:
+            return None
+        with cls._registry_lock:
+            limiter = cls._registry.get(host)
+            if limiter is None or limiter.requests_per_second != requests_per_second:
+                limiter = cls(requests_per_second)
+                cls._registry[host] = limiter
+            return limiter
+
+    def reserve(self) -> float:
+        """
+        Take one token out of the bucket
+        @return how many seconds the caller needs to wait before sending the request (0 if no need to wait)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.requests_per_second)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.requests_per_second
+
+
+class RetryPolicy:
+    """Decides whether and when failed requests are retried"""
+    MAX_RETRY_AFTER: Final[float] = 300     # Never wait longer than 5 minutes, even if the server asks for it
+
+    def __init__(self, max_attempts: int = 3, backoff: float = 1, max_backoff: float = 60, maxlag: int = 5,
+                 requests_per_second: float = 0):
+        """
+        @param max_attempts: How often a request is tried before giving up
+        @param backoff: Seconds to wait before the first retry (doubling for every further retry)
+        @param max_backoff: Upper limit for the waiting time between two attempts (unless the server asks for more)
+        @param maxlag: Value for the maxlag parameter of all API requests (0: don't send it)
+        @param requests_per_second: Rate limit for requests to the same host (0: no limit)
+        """
+        self.max_attempts: Final[int] = max(1, max_attempts)
+        self.backoff: Final[float] = backoff
+        self.max_backoff: Final[float] = max_backoff
+        self.maxlag: Final[int] = maxlag
+        self.requests_per_second: Final[float] = requests_per_second
+
+    @classmethod
+    def from_config(cls, config: ConfigParser) -> "RetryPolicy":
+        """Create the retry policy as configured in section [mediawiki] of config.ini (defaults for missing options)"""
+        return cls(max_attempts=config.getint("mediawiki", "max_attempts", fallback=3),
+                   backoff=config.getfloat("mediawiki", "backoff", fallback=1),
+                   maxlag=config.getint("mediawiki", "maxlag", fallback=5),
+                   requests_per_second=config.getfloat("mediawiki", "requests_per_second", fallback=0))
+
+    def get_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        How long should we wait before the next attempt?
+        @param attempt: number of the attempt that just failed (starting with 1)
+        @param retry_after: value of the Retry-After header of the response (if there was one)
+        @return number of seconds
+        """
+        delay: float = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)    # jitter: don't let all clients retry at the same time
+        server_delay = self.parse_retry_after(retry_after)
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.MAX_RETRY_AFTER))
+        return delay
+
+    @staticmethod
+    def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+        """Retry-After header may be a number of seconds or a HTTP date. Returns seconds (None if invalid)"""
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def is_retryable_status(status_code: int) -> bool:
+        """HTTP 429 (Too Many Requests) and 503 (Service Unavailable) mean: try again later"""
+        return status_code in [429, 503]
+
+    @staticmethod
+    def is_maxlag_error(json: Any) -> bool:
+        """Did the mediawiki API refuse our request because the database replication lag is too high?"""
+        return isinstance(json, dict) and isinstance(json.get("error"), dict) and json["error"].get("code") == "maxlag"
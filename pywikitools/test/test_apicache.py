@@ -0,0 +1,114 @@
+"""
+Test the persistent cache for mediawiki API responses (and how ForTrainingLib uses it)
+
+Run tests:
+    python3 -m unittest test_apicache.py
+"""
+from os.path import join
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pywikitools.apicache import ApiCache
+from pywikitools.fortraininglib import ForTrainingLib
+
+SOURCE_PARAMS = {"action": "query", "prop": "revisions", "rvprop": "content", "rvslots": "main", "format": "json",
+                 "titles": "Prayer"}
+
+
+class TestApiCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ApiCache(join(self.temp_dir.name, "apicache.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_get_kind(self):
+        self.assertEqual(ApiCache.get_kind(SOURCE_PARAMS), "revisions")
+        self.assertEqual(ApiCache.get_kind({"action": "parse", "page": "Prayer"}), "parse")
+        self.assertEqual(ApiCache.get_kind({"action": "query", "meta": "siteinfo"}), "siteinfo")
+        self.assertTrue(self.cache.is_cacheable(SOURCE_PARAMS))
+        self.assertFalse(self.cache.is_cacheable({"action": "query", "meta": "siteinfo"}))
+
+    def test_get_titles(self):
+        self.assertListEqual(ApiCache.get_titles({"titles": "Prayer|Church"}), ["Prayer", "Church"])
+        self.assertListEqual(ApiCache.get_titles({"page": "Prayer"}), ["Prayer"])
+        self.assertListEqual(ApiCache.get_titles({"titles": "Prayer", "rvstartid": "42"}), [])
+        self.assertListEqual(ApiCache.get_titles({"action": "expandtemplates"}), [])
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get(SOURCE_PARAMS))
+        self.cache.put(SOURCE_PARAMS, {"query": "test"}, {"Prayer": "42@2022"})
+        # The order of parameters must not matter
+        self.assertEqual(self.cache.get(dict(reversed(list(SOURCE_PARAMS.items())))),
+                         ({"query": "test"}, {"Prayer": "42@2022"}))
+        # Responses to requests that we don't cache shouldn't get stored
+        self.cache.put({"action": "query", "meta": "siteinfo"}, {"query": "test"}, {})
+        self.assertIsNone(self.cache.get({"action": "query", "meta": "siteinfo"}))
+
+    @patch("pywikitools.apicache.time.time")
+    def test_ttl(self, mock_time):
+        mock_time.return_value = 1000
+        cache = ApiCache(join(self.temp_dir.name, "ttl.sqlite"), ttl={"revisions": 100})
+        cache.put(SOURCE_PARAMS, {"query": "test"}, {})
+        mock_time.return_value = 1100
+        self.assertIsNotNone(cache.get(SOURCE_PARAMS))
+        mock_time.return_value = 1101
+        self.assertIsNone(cache.get(SOURCE_PARAMS))
+        cache.close()
+
+    @patch("pywikitools.apicache.time.time")
+    def test_eviction(self, mock_time):
+        cache = ApiCache(join(self.temp_dir.name, "small.sqlite"), max_size=250)
+        for counter in range(3):
+            mock_time.return_value = 1000 + counter
+            cache.put({"action": "parse", "page": f"Page{counter}"}, {"parse": "x" * 100}, {})
+        # The least recently used entry should have been evicted
+        self.assertIsNone(cache.get({"action": "parse", "page": "Page0"}))
+        mock_time.return_value = 1003
+        self.assertIsNotNone(cache.get({"action": "parse", "page": "Page1"}))
+        mock_time.return_value = 1004
+        cache.put({"action": "parse", "page": "Page3"}, {"parse": "x" * 100}, {})
+        self.assertIsNotNone(cache.get({"action": "parse", "page": "Page1"}))
+        self.assertIsNone(cache.get({"action": "parse", "page": "Page2"}))
+        cache.close()
+
+    def test_with_fortraininglib(self):
+        lastrevid = {"Prayer": 42}
+
+        def request(params):
+            """Emulate the mediawiki API"""
+            if params.get("meta") == "siteinfo":
+                return {"query": {"statistics": {"jobs": 0}}}
+            if params["prop"] == "info":
+                return {"query": {"pages": {"1": {"title": "Prayer", "lastrevid": lastrevid["Prayer"],
+                                                  "touched": "2022-05-01T12:00:00Z"}}}}
+            return {"query": {"pages": {"1": {"title": "Prayer", "revisions": [
+                {"slots": {"main": {"*": f"Revision {lastrevid['Prayer']}"}}}]}}}}
+
+        lib = ForTrainingLib("https://www.4training.net", cache=self.cache)
+        with patch.object(ForTrainingLib, "_request", side_effect=request) as mock_request:
+            self.assertEqual(lib.get_page_sources(["Prayer"])["Prayer"], "Revision 42")
+            self.assertEqual(mock_request.call_count, 2)    # page state probe and actual request
+
+            # Second request: page didn't change -> cached response is used
+            self.cache._page_states.clear()     # Make sure that we're probing again
+            self.assertEqual(lib.get_page_sources(["Prayer"])["Prayer"], "Revision 42")
+            self.assertEqual(mock_request.call_count, 3)    # only the probe
+
+            # The page was edited -> we need to request it again
+            lastrevid["Prayer"] = 43
+            self.cache._page_states.clear()
+            self.assertEqual(lib.get_page_sources(["Prayer"])["Prayer"], "Revision 43")
+            self.assertEqual(mock_request.call_count, 5)
+
+            # Requests that aren't cached are passed on directly
+            lib.count_jobs()
+            self.assertEqual(mock_request.call_count, 6)
+        lib.session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Test the asynchronous twin of ForTrainingLib (with a local test server instead of the real mediawiki API)
+
+Run tests:
+    python3 -m unittest test_asyncfortraininglib.py
+"""
+import asyncio
+from os.path import join
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import AsyncMock, patch
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+except ImportError:     # aiohttp is optional
+    web = None          # type: ignore
+
+from pywikitools.apicache import ApiCache
+from pywikitools.asyncfortraininglib import AsyncForTrainingLib
+from pywikitools.test.test_fortraininglib import messagecollection
+from pywikitools.test.test_resourcesbot import HEARING_FROM_GOD
+
+
+@unittest.skipIf(web is None, "aiohttp isn't installed")
+class TestAsyncForTrainingLib(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pages = {"Hearing from God": HEARING_FROM_GOD,
+                      "Translations:Hearing from God/52/de": "Gottes_Reden_wahrnehmen.pdf"}
+        for counter in range(120):
+            self.pages[f"Translations:Prayer/{counter}/de"] = f"Unit {counter}"
+        self.requests = 0
+        self.running = 0            # How many requests are processed at the moment
+        self.max_running = 0
+        self.throttle = 0           # How many requests should get a HTTP 429 response
+        app = web.Application()
+        app.router.add_get("/mediawiki/api.php", self.api)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.lib = AsyncForTrainingLib(str(self.server.make_url("")).rstrip("/"), max_concurrency=2)
+
+    async def asyncTearDown(self):
+        await self.lib.close()
+        await self.server.close()
+
+    async def api(self, request: "web.Request") -> "web.Response":
+        """Emulate prop=revisions queries of the mediawiki API"""
+        self.requests += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        if self.throttle > 0:
+            self.throttle -= 1
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if request.query.get("titles") == "Invalid":
+            return web.Response(text="<html>No JSON</html>")
+        if request.query.get("meta") == "languageinfo":
+            return web.json_response({"query": {"languageinfo": {"de": {"autonym": "Deutsch", "name": "German"}}}})
+        if request.query.get("list") == "messagecollection":
+            return web.json_response(messagecollection(dict(request.query)))
+        pages = {}
+        for counter, title in enumerate(request.query["titles"].split("|")):
+            title = title.replace("_", " ")
+            if title in self.pages:
+                pages[str(counter)] = {"title": title, "revisions": [{"slots": {"main": {"*": self.pages[title]}}}]}
+            else:
+                pages[str(-counter - 1)] = {"title": title, "missing": ""}
+        return web.json_response({"query": {"pages": pages}})
+
+    async def test_get_page_source(self):
+        self.assertEqual(await self.lib.get_page_source("Hearing from God"), HEARING_FROM_GOD)
+        self.assertIsNone(await self.lib.get_page_source("NotExisting"))
+        # Methods doing several requests one after the other
+        self.assertEqual(await self.lib.get_pdf_name("Hearing_from_God", "en"), "Hearing_from_God.pdf")
+        self.assertEqual(await self.lib.get_pdf_name("Hearing_from_God", "de"), "Gottes_Reden_wahrnehmen.pdf")
+        self.assertEqual(self.requests, 4)     # The English worksheet is requested only once
+
+    async def test_cache(self):
+        with TemporaryDirectory() as temp_dir:
+            cache = ApiCache(join(temp_dir, "apicache.sqlite"))
+            for _ in range(2):
+                async with AsyncForTrainingLib(str(self.server.make_url("")).rstrip("/"), cache=cache) as lib:
+                    loop = asyncio.get_running_loop()
+                    with patch.object(loop, "run_in_executor", wraps=loop.run_in_executor) as mock:
+                        self.assertEqual(await lib.get_language_names(), {"de": "Deutsch"})
+                    self.assertTrue(mock.called)    # sqlite isn't accessed in the event loop
+            self.assertEqual(self.requests, 1)      # The second time the response came from the cache
+            cache.close()
+
+    async def test_concurrency(self):
+        titles = [f"Translations:Prayer/{counter}/de" for counter in range(120)]
+        results = await asyncio.gather(self.lib.get_page_sources(titles), self.lib.get_page_source("NotExisting"),
+                                       self.lib.get_version("Hearing_from_God", "en"))
+        self.assertEqual(len(results[0]), 120)
+        self.assertEqual(results[0]["Translations:Prayer/7/de"], "Unit 7")
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2], "1.2")
+        self.assertEqual(self.requests, 5)      # 120 titles need three requests
+        self.assertEqual(self.max_running, 2)   # Our semaphore must limit concurrent requests
+
+    async def test_translation_units(self):
+        units = [unit async for unit in self.lib.iter_translation_units("Prayer", "de", limit=3)]
+        self.assertListEqual([unit.get_definition() for unit in units], [f"Unit {number}" for number in range(1, 8)])
+        self.assertEqual(self.requests, 3)
+        result = await self.lib.get_translation_units_for_languages("Prayer", ["de", "ru", "tr"])
+        self.assertEqual(len(list(result["tr"])), 7)
+        self.assertEqual(self.requests, 6)
+        self.assertEqual(self.max_running, 2)
+
+    async def test_invalid_json(self):
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertIsNone(await self.lib.get_page_source("Invalid"))
+        self.assertEqual(self.requests, 1)
+
+    @patch("pywikitools.asyncfortraininglib.asyncio.sleep", new_callable=AsyncMock)
+    async def test_timeouts(self, mock_sleep):
+        # Timeouts are retried just as in ForTrainingLib
+        with patch("aiohttp.ClientSession.get", side_effect=asyncio.TimeoutError):
+            with self.assertLogs("pywikitools.lib", level="WARNING") as logs:
+                self.assertEqual(await self.lib.count_jobs(), 0)
+        max_attempts = self.lib.retry_policy.max_attempts
+        self.assertEqual(len(logs.output), max_attempts + 2)   # the last warning comes from count_jobs()
+        self.assertEqual(mock_sleep.call_count, max_attempts - 1)
+        self.assertEqual(self.lib.counters.as_dict()["timeouts"], max_attempts)
+        self.assertEqual(self.lib.counters.as_dict()["failed"], 1)
+
+    async def test_throttling(self):
+        self.throttle = 1
+        with patch("pywikitools.asyncfortraininglib.asyncio.sleep", new_callable=AsyncMock):
+            with self.assertLogs("pywikitools.lib", level="WARNING"):
+                self.assertEqual(await self.lib.get_page_source("Hearing from God"), HEARING_FROM_GOD)
+        self.assertGreater(self.lib.counters.as_dict()["waited"], 0)    # backoff before retrying
+        self.assertEqual(self.lib.counters.as_dict()["throttled"], 1)
+        self.assertEqual(self.lib.counters.as_dict()["retries"], 1)
+        self.assertEqual(self.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Test the record / replay harness and the resourcesbot benchmark
+
+Run tests:
+    python3 -m unittest test_benchmark.py
+"""
+import os
+import tempfile
+import unittest
+
+import pywikibot
+import requests
+
+from pywikitools.benchmark.replay import Fixtures, ReplayServer, patch_pywikibot
+from pywikitools.benchmark.resourcesbot_benchmark import compare, run_benchmarks
+from pywikitools.benchmark.synthetic import SyntheticWiki
+from pywikitools.fortraininglib import ForTrainingLib
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.wiki = SyntheticWiki(["Prayer", "Church"], languages=3)
+        self.fixtures = Fixtures(self.temp_dir.name, self.wiki.base_url)
+        self.wiki.populate(self.fixtures)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_replay_recorded_response(self):
+        self.fixtures.put_response({"action": "query", "prop": "revisions", "rvlimit": "1", "rvprop": "content",
+                                    "rvslots": "main", "format": "json", "titles": "Prayer"},
+                                   {"query": {"pages": {"1": {"revisions": [{"slots": {"main": {"*": "Test"}}}]}}}})
+        with ReplayServer(self.fixtures) as server:
+            fortraininglib = ForTrainingLib(server.url)
+            self.assertEqual(fortraininglib.get_page_source("Prayer"), "Test")    # maxlag parameter is ignored
+            with self.assertLogs("pywikitools.benchmark.replay", level="WARNING"):
+                self.assertIsNone(fortraininglib.get_page_source("Church"))
+            fortraininglib.session.close()
+            self.assertDictEqual(server.stats, {"replayed": 1, "recorded": 0, "misses": 1})
+
+            url = f"{server.url}/mediawiki/images/Prayer_qaa.pdf"
+            with open(self.fixtures.file_path("sample.pdf"), "rb") as f:
+                content = f.read()
+            response = requests.get(url, headers={"Range": "bytes=0-99"})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.content, content[:100])
+            response = requests.get(url, headers={"Range": "bytes=-100"})
+            self.assertEqual(response.headers["Content-Range"], f"bytes {len(content) - 100}-{len(content) - 1}/"
+                                                                f"{len(content)}")
+            self.assertEqual(response.content, content[-100:])
+            self.assertEqual(requests.get(url).content, content)
+
+    def test_record_and_replay(self):
+        with ReplayServer(self.fixtures, self.wiki) as server:
+            fortraininglib = ForTrainingLib(server.url)
+            recorded = fortraininglib.get_translation_progress(["Prayer"])
+            self.assertIn("en", recorded["Prayer"])
+            self.assertEqual(fortraininglib.get_language_name("qab", "en"), "Synthetic qab")
+            fortraininglib.session.close()
+            self.assertDictEqual(server.stats, {"replayed": 0, "recorded": 2, "misses": 0})
+
+        with ReplayServer(Fixtures(self.temp_dir.name)) as server:     # without upstream
+            fortraininglib = ForTrainingLib(server.url)
+            replayed = fortraininglib.get_translation_progress(["Prayer"])
+            self.assertListEqual(list(replayed["Prayer"]), list(recorded["Prayer"]))
+            fortraininglib.session.close()
+            self.assertDictEqual(server.stats, {"replayed": 1, "recorded": 0, "misses": 0})
+
+    def test_patch_pywikibot(self):
+        with patch_pywikibot(self.fixtures, "http://localhost:1234") as site:
+            self.assertIs(pywikibot.Site(), site)
+            page = pywikibot.Page(pywikibot.Site(), "Synthetic_qaa")
+            self.assertTrue(page.exists())
+            self.assertIn("Available training resources in Synthetic qaa", page.text)
+            self.assertFalse(pywikibot.Page(site, "4training:qaa.json").exists())
+            page = pywikibot.Page(site, "4training:qaa.json")
+            page.text = "{}"
+            page.save("Created")
+            self.assertEqual(pywikibot.Page(site, "4training:qaa.json").text, "{}")
+            self.assertDictEqual(site.saved, {"4training:qaa.json": 1})
+
+            file_page = pywikibot.FilePage(site, "Prayer.pdf")
+            self.assertTrue(file_page.exists())
+            self.assertEqual(file_page.title(with_ns=False), "Prayer.pdf")
+            self.assertEqual(file_page.latest_file_info.url, "http://localhost:1234/mediawiki/images/Prayer.pdf")
+            target = os.path.join(self.temp_dir.name, "download.pdf")
+            self.assertTrue(file_page.download(target))
+            self.assertEqual(os.path.getsize(target), os.path.getsize(self.fixtures.file_path("sample.pdf")))
+            self.assertFalse(pywikibot.FilePage(site, "Missing.pdf").exists())
+
+
+class TestResourcesBotBenchmark(unittest.TestCase):
+    def test_run_benchmarks(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            wiki = SyntheticWiki(ForTrainingLib(SyntheticWiki.BASE_URL).get_worksheet_list(), languages=2)
+            fixtures = Fixtures(temp_dir, wiki.base_url)
+            wiki.populate(fixtures)
+            results = run_benchmarks(fixtures, wiki, latency=0, repeat=2)
+        self.assertEqual(results["benchmark"]["languages"], 3)
+        self.assertEqual(results["replay"]["misses"], 0)
+        self.assertGreater(results["replay"]["replayed"], 0)    # second run is replayed from the fixtures
+        for name in ["crawl", "sync_and_compare", "postprocessor:WriteList", "postprocessor:ExportHTML"]:
+            self.assertEqual(len(results["results"][name]["runs"]), 2)
+        self.assertGreater(results["requests"]["api"]["revisions"]["count"], 0)
+
+        lines = compare(results, results)
+        self.assertEqual(len(lines), len(results["results"]) + 1)
+        self.assertIn("+0.0%", lines[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,8 @@ import json
 from os.path import abspath, dirname, join
 from pywikitools.resourcesbot.changes import ChangeItem, ChangeType
 from pywikitools.resourcesbot.data_structures import FileInfo, PdfMetadataSummary, TranslationProgress, WorksheetInfo, \
-                                                     LanguageInfo, DataStructureEncoder, json_decode
+                                                     LanguageInfo, DataStructureEncoder, json_decode, \
+                                                     language_info_from_json, language_info_to_json
 
 # Currently in our json files it is stored as "2018-12-20T12:58:57Z"
 # but datetime.fromisoformat() can't handle the "Z" in the end
@@ -290,6 +291,29 @@ class TestLanguageInfo(unittest.TestCase):
         self.assertEqual(next(iter(comparison)).change_type, ChangeType.NEW_WORKSHEET)
 
 
+class TestLanguageInfoSerialization(unittest.TestCase):
+    def test_fast_path(self):
+        """language_info_to_json() / language_info_from_json() must give the same results as the generic way"""
+        for lang in ["ar", "en", "es", "ru"]:
+            with open(join(dirname(abspath(__file__)), "data", f"{lang}.json"), 'r') as f:
+                json_text = f.read()
+            language_info = json.loads(json_text, object_hook=json_decode)
+            expected_json = DataStructureEncoder().encode(language_info)
+            decoded_language_info = language_info_from_json(json_text)
+            self.assertIsInstance(decoded_language_info, LanguageInfo)
+            self.assertEqual(language_info_to_json(decoded_language_info), expected_json)
+            self.assertEqual(language_info_to_json(language_info), expected_json)
+            self.assertListEqual(list(decoded_language_info.worksheets), list(language_info.worksheets))
+
+    def test_malformatted(self):
+        with self.assertRaises(AssertionError):
+            language_info_from_json('{"language_code": "de", "english_name": "German"}')
+        with self.assertRaises(AssertionError):
+            language_info_from_json('{"language_code": "de", "english_name": "German", "worksheets": [{"page": 1}]}')
+        with self.assertRaises(ValueError):
+            language_info_from_json('{"language_code": "de", ')
+
+
 class TestLanguageInfoComparison(unittest.TestCase):
     """Testing all the different possible outcomes of comparing two LanguageInfo objects"""
     def setUp(self):
@@ -0,0 +1,93 @@
+"""
+Test the structural comparison of LanguageInfo data
+
+Run tests:
+    python3 -m unittest test_diff.py
+"""
+import json
+from os.path import abspath, dirname, join
+import unittest
+
+from pywikitools.resourcesbot.changes import ChangeType
+from pywikitools.resourcesbot.data_structures import LanguageInfo, json_decode
+from pywikitools.resourcesbot.diff import LanguageInfoDiff
+
+
+def load_language_info(file_name: str) -> LanguageInfo:
+    with open(join(dirname(abspath(__file__)), "data", file_name), 'r') as f:
+        return json.load(f, object_hook=json_decode)
+
+
+class TestLanguageInfoDiff(unittest.TestCase):
+    def setUp(self):
+        self.data = load_language_info("ru.json").to_dict()
+
+    def test_no_changes(self):
+        diff = LanguageInfoDiff(self.data, load_language_info("ru.json").to_dict())
+        self.assertTrue(diff.is_empty())
+        self.assertFalse(diff.needs_save())
+        self.assertTrue(diff.to_changelog().is_empty())
+
+        # Order of keys and worksheets doesn't matter
+        reordered = json.loads(json.dumps(self.data, sort_keys=True))
+        reordered["worksheets"].reverse()
+        self.assertTrue(LanguageInfoDiff(self.data, reordered).is_empty())
+
+    def test_fields(self):
+        new_data = load_language_info("ru_updated_files.json").to_dict()
+        diff = LanguageInfoDiff(new_data, self.data)
+        self.assertTrue(diff.needs_save())
+        paths = [change.path for change in diff.changes]
+        self.assertIn(("worksheets", "Church", "files", "odt", "timestamp"), paths)
+        self.assertIn(("worksheets", "Healing", "files", "pdf", "timestamp"), paths)
+        changes = {(item.worksheet, item.change_type) for item in diff.to_changelog()}
+        self.assertSetEqual(changes, {("Church", ChangeType.UPDATED_ODT), ("Healing", ChangeType.UPDATED_PDF)})
+
+        # Files that got older don't count as updated
+        diff = LanguageInfoDiff(self.data, new_data)
+        self.assertTrue(diff.needs_save())
+        self.assertTrue(diff.to_changelog().is_empty())
+
+    def test_volatile_fields(self):
+        new_data = load_language_info("ru.json").to_dict()
+        new_data["english_name"] = ""
+        for worksheet in new_data["worksheets"]:
+            for file_info in worksheet.get("files", []):
+                if "metadata" in file_info:
+                    file_info["metadata"]["warnings"] = "Something different"
+        diff = LanguageInfoDiff(new_data, self.data)
+        self.assertFalse(diff.is_empty())
+        self.assertFalse(diff.needs_save())
+        self.assertTrue(diff.to_changelog().is_empty())
+
+        # A renamed language needs to be saved (other than a language name we couldn't query)
+        new_data["english_name"] = "Russian (Russia)"
+        diff = LanguageInfoDiff(new_data, self.data)
+        self.assertTrue(diff.needs_save())
+        self.assertTrue(diff.to_changelog().is_empty())
+
+        # A change in translation progress needs to be saved but doesn't show up in the ChangeLog
+        new_data["english_name"] = ""
+        new_data["worksheets"][0]["progress"]["translated"] -= 1
+        diff = LanguageInfoDiff(new_data, self.data)
+        self.assertTrue(diff.needs_save())
+        self.assertTrue(diff.to_changelog().is_empty())
+
+    def test_same_as_compare(self):
+        """The ChangeLog must be exactly what LanguageInfo.compare() always returned"""
+        old = load_language_info("ru.json")
+        for file_name, expected in [
+                ("ru_added_files.json", [("Church", ChangeType.NEW_PDF), ("Healing", ChangeType.NEW_ODT),
+                                         ("Hearing_from_God", ChangeType.NEW_PDF),
+                                         ("Hearing_from_God", ChangeType.NEW_ODT)]),
+                ("ru_deleted_worksheet.json", [("Prayer", ChangeType.DELETED_WORKSHEET),
+                                               ("My_Story_with_God", ChangeType.DELETED_WORKSHEET)]),
+                ("ru_new_worksheet.json", [("Confessing_Sins_and_Repenting", ChangeType.NEW_WORKSHEET),
+                                           ("Forgiving_Step_by_Step", ChangeType.NEW_WORKSHEET)])]:
+            new = load_language_info(file_name)
+            changes = [(item.worksheet, item.change_type) for item in new.compare(old)]
+            self.assertCountEqual(changes, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
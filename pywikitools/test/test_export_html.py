@@ -0,0 +1,94 @@
+"""
+Test exporting worksheets as HTML: downloading images only if they changed
+
+Run tests:
+    python3 -m unittest test_export_html.py
+"""
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from pywikitools.benchmark.replay import Fixtures, ReplayServer
+from pywikitools.benchmark.synthetic import SyntheticWiki
+from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.resourcesbot.export_html import ExportHTML
+
+
+class TestExportHTML(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.wiki = SyntheticWiki(["Prayer", "Church"], languages=1)
+        self.fixtures = Fixtures(os.path.join(self.temp_dir.name, "fixtures"), self.wiki.base_url)
+        self.files_folder = os.path.join(self.temp_dir.name, "files")
+        os.makedirs(self.files_folder)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_download_file(self):
+        with ReplayServer(self.fixtures, self.wiki) as server:
+            fortraininglib = ForTrainingLib(server.url)
+            export_html = ExportHTML(fortraininglib, os.path.join(self.temp_dir.name, "html"), workers=2)
+            self.assertTrue(export_html.download_file(self.files_folder, "Prayer.png"))
+            file_path = os.path.join(self.files_folder, "Prayer.png")
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), self.fixtures.get_file("Prayer.png"))
+            self.assertEqual(int(os.path.getmtime(file_path)), int(self.fixtures.get_modification_time("Prayer.png")))
+
+            # We have the current version already (same SHA1): don't download again
+            self.assertFalse(export_html.download_file(self.files_folder, "Prayer.png"))
+
+            # The file changed in the mediawiki system: download it again
+            self.fixtures.put_file("Prayer.png", b"changed")
+            file_info = dict(fortraininglib.get_file_infos(["Prayer.png"])["Prayer.png"],
+                             sha1=hashlib.sha1(b"changed").hexdigest())
+            self.assertTrue(export_html.download_file(self.files_folder, "Prayer.png", file_info))
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), b"changed")
+            self.assertFalse(os.path.exists(f"{file_path}.part"))
+
+            # Without SHA1 we ask the server whether the file was modified
+            del file_info["sha1"]
+            self.assertFalse(export_html.download_file(self.files_folder, "Prayer.png", file_info))
+            modified = time.time() + 10
+            os.utime(self.fixtures.file_path("Prayer.png"), (modified, modified))
+            self.assertTrue(export_html.download_file(self.files_folder, "Prayer.png", file_info))
+
+            # Several images in parallel (with details requested in advance)
+            file_infos = fortraininglib.get_file_infos(["Church.png", "Missing.jpg"])
+            self.assertEqual(file_infos["Church.png"]["mime"], "image/png")
+            self.assertIsNone(file_infos["Missing.jpg"])
+            file_infos["Prayer.png"] = dict(file_info, sha1=hashlib.sha1(b"changed").hexdigest())
+            with self.assertLogs("pywikitools.resourcesbot.export_html", level="ERROR"):
+                results = export_html._map(lambda file: export_html.download_file(self.files_folder, file,
+                                                                                  file_infos[file] or {}),
+                                           ["Prayer.png", "Church.png", "Missing.jpg"])
+            self.assertListEqual(results, [False, True, False])
+            fortraininglib.session.close()
+        # Prayer.png: three downloads and one "not modified" response; Church.png: one download
+        self.assertEqual(fortraininglib.metrics.as_dict()["requests"]["file"]["download"]["count"], 5)
+
+    def test_download_interrupted(self):
+        def interrupted(*args, **kwargs):
+            yield b"half of the image"
+            raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+        with ReplayServer(self.fixtures, self.wiki) as server:
+            fortraininglib = ForTrainingLib(server.url)
+            export_html = ExportHTML(fortraininglib, os.path.join(self.temp_dir.name, "html"))
+            file_info = fortraininglib.get_file_infos(["Prayer.png"])["Prayer.png"]
+            with patch("requests.models.Response.iter_content", side_effect=interrupted):
+                with self.assertLogs("pywikitools.resourcesbot.export_html", level="WARNING"):
+                    self.assertFalse(export_html.download_file(self.files_folder, "Prayer.png", file_info))
+            fortraininglib.session.close()
+        # No half-written file must be left in the export folder
+        self.assertListEqual(os.listdir(self.files_folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,21 @@ from unittest.mock import Mock, patch
 import requests
 
 from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.retrypolicy import RetryPolicy
+
+
+def messagecollection(params):
+    """Emulate list=messagecollection for a page with 7 translation units (returning mclimit units at once)"""
+    if params["mcgroup"] == "page-Invalid":
+        return {"error": {"code": "badparameter", "info": "Invalid group"}}
+    start = int(params.get("mcoffset", 0))
+    end = min(start + int(params["mclimit"]), 7)
+    response = {"query": {"messagecollection": [
+        {"key": f"Prayer/{number}", "targetLanguage": params["mclanguage"], "definition": f"Unit {number}",
+         "translation": f"{params['mclanguage']} {number}"} for number in range(start + 1, end + 1)]}}
+    if end < 7:
+        response["continue"] = {"mcoffset": str(end), "continue": "-||"}
+    return response
 
 
 class TestFortrainingLib(unittest.TestCase):
@@ -33,17 +48,22 @@ class TestFortrainingLib(unittest.TestCase):
         self.lib._get({})
         mock_get.assert_called_once()
 
+    @patch("pywikitools.fortraininglib.time.sleep")
     @patch("pywikitools.fortraininglib.requests.Session.get")
-    def test_get_with_timeouts(self, mock_get):
+    def test_get_with_timeouts(self, mock_get, mock_sleep):
         # Let's emulate repeated Timeouts and assert that requests.get() got called CONNECT_RETRIES times
         mock_get.side_effect = requests.exceptions.Timeout
         with self.assertLogs('pywikitools.lib', level='WARNING') as logs:
             self.lib._get({})
             self.assertEqual(len(logs.output), self.lib.CONNECT_RETRIES + 1)
         self.assertEqual(mock_get.call_count, self.lib.CONNECT_RETRIES)
+        self.assertEqual(mock_sleep.call_count, self.lib.CONNECT_RETRIES - 1)
+        self.assertEqual(self.lib.counters.as_dict()["timeouts"], self.lib.CONNECT_RETRIES)
+        self.assertEqual(self.lib.counters.as_dict()["failed"], 1)
 
+    @patch("pywikitools.fortraininglib.time.sleep")
     @patch("pywikitools.fortraininglib.requests.Session.get")
-    def test_get_with_single_timeout(self, mock_get):
+    def test_get_with_single_timeout(self, mock_get, mock_sleep):
         # One request times out and afterwards all works fine again
         response = requests.Response()
         response.status_code = 200
@@ -55,6 +75,34 @@ class TestFortrainingLib(unittest.TestCase):
             self.assertEqual(len(logs.output), 1)   # there should be only one warning
         self.assertEqual(mock_get.call_count, 2)
 
+    @patch("pywikitools.fortraininglib.time.sleep")
+    @patch("pywikitools.fortraininglib.requests.Session.get")
+    def test_get_with_throttling(self, mock_get, mock_sleep):
+        # HTTP 429 with Retry-After header, then a maxlag error, then a connection error and finally success
+        throttled = requests.Response()
+        throttled.status_code = 429
+        throttled.headers["Retry-After"] = "7"
+        lagged = requests.Response()
+        lagged.status_code = 200
+        lagged.json = Mock(return_value={"error": {"code": "maxlag", "info": "Waiting for db: 6 seconds lagged"}})
+        response = requests.Response()
+        response.status_code = 200
+        response.json = Mock(return_value={"query": {}})
+        mock_get.side_effect = [throttled, lagged, requests.exceptions.ConnectionError, response]
+        self.lib = ForTrainingLib("https://www.4training.net", retry_policy=RetryPolicy(max_attempts=4, maxlag=5))
+        with self.assertLogs('pywikitools.lib', level='WARNING') as logs:
+            self.assertEqual(self.lib._get({"action": "query"}), {"query": {}})
+            self.assertEqual(len(logs.output), 3)
+        self.assertEqual(mock_get.call_args[1]["params"]["maxlag"], "5")
+        self.assertGreaterEqual(mock_sleep.call_args_list[0][0][0], 7)    # Retry-After must be respected
+        counters = self.lib.counters.as_dict()
+        self.assertEqual(counters["requests"], 4)
+        self.assertEqual(counters["retries"], 3)
+        self.assertEqual(counters["throttled"], 1)
+        self.assertEqual(counters["maxlag"], 1)
+        self.assertEqual(counters["connection_errors"], 1)
+        self.assertEqual(counters["failed"], 0)
+
     @patch("pywikitools.fortraininglib.requests.Session.get")
     def test_get_with_json_decode_error(self, mock_get):
         response = requests.Response()
@@ -73,6 +121,35 @@ class TestFortrainingLib(unittest.TestCase):
         self.assertEqual(self.lib.get_language_name('de', 'en'), 'German')
         self.assertEqual(self.lib.get_language_name('tr', 'de'), 'Türkisch')
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_language_names(self, mock_get):
+        mock_get.side_effect = [
+            {"query": {"languageinfo": {"de": {"code": "de", "autonym": "Deutsch", "name": "German"}}},
+             "continue": {"licontinue": "tr", "continue": "||"}},
+            {"query": {"languageinfo": {"tr": {"code": "tr", "autonym": "Türkçe", "name": "Turkish"},
+                                        "qaa": {"code": "qaa", "autonym": "", "name": ""}}}},
+            {"parse": {"title": "API", "text": {"*": '<div class="mw-parser-output"><p>qaa\n</p></div>'}}}]
+        self.assertEqual(self.lib.get_language_name('de'), 'Deutsch')
+        self.assertEqual(self.lib.get_language_name('tr', 'en'), 'Turkish')
+        self.assertEqual(mock_get.call_args_list[1][0][0]["licontinue"], "tr")
+        self.assertEqual(self.lib.get_language_name('de', 'en'), 'German')
+        self.assertEqual(mock_get.call_count, 2)     # autonyms and English names come with the same requests
+        self.assertEqual(self.lib.get_language_name('qaa'), 'qaa')     # unknown: ask {{#language:}}
+        self.assertEqual(self.lib.get_language_name('qaa'), 'qaa')
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_language_names_error(self, mock_get):
+        mock_get.side_effect = [
+            {},     # Request failed
+            {"query": {"languageinfo": {"de": {"code": "de", "autonym": "Deutsch", "name": "German"}}}}]
+        with self.assertLogs('pywikitools.lib', level='WARNING'):
+            self.assertDictEqual(self.lib.get_language_names(), {})
+        # The failure isn't remembered: we try again with the next call
+        self.assertDictEqual(self.lib.get_language_names(), {"de": "Deutsch"})
+        self.assertEqual(self.lib.get_language_name('de'), 'Deutsch')
+        self.assertEqual(mock_get.call_count, 2)
+
     def test_list_page_translations(self):
         with self.assertLogs('pywikitools.lib', level='INFO'):
             result = self.lib.list_page_translations('Prayer')
@@ -89,6 +166,45 @@ class TestFortrainingLib(unittest.TestCase):
         # Check correct error handling for non-existing page
         self.assertEqual(len(self.lib.list_page_translations("NotExisting", "de")), 0)
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_translation_progress(self, mock_get):
+        def stats(language_code: str, group: str, translated: int):
+            return {"group": group, "language": language_code, "total": 20, "translated": translated, "fuzzy": 0}
+
+        # Incomplete results: the continue token must be followed (and not the same request repeated)
+        mock_get.side_effect = [
+            {"continue": {"mgsoffset": "de", "continue": "-||"},
+             "query": {"messagegroupstats": [stats("en", "page-Prayer", 20), stats("ar", "page-Prayer", 0)]}},
+            {"query": {"messagegroupstats": [stats("de", "page-Prayer", 18), stats("ru", "page-Prayer", 5)]}}]
+        result = self.lib.get_translation_progress(["Prayer"])
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args[0][0]["mgsoffset"], "de")
+        self.assertListEqual(list(result["Prayer"]), ["en", "de", "ru"])     # ar has nothing translated
+        self.assertEqual(result["Prayer"]["de"].translated, 18)
+        mock_get.side_effect = [
+            {"query": {"messagegroupstats": [stats("en", "page-Prayer", 20), stats("ru", "page-Prayer", 5)]}}]
+        self.assertListEqual(list(self.lib.list_page_translations("Prayer")), ["en"])   # ru is unfinished
+
+        # For only one language, we need only two requests (for English and this language) for all pages
+        mock_get.reset_mock()
+        mock_get.side_effect = [
+            {"query": {"languagestats": [stats("en", "page-Prayer", 20), stats("en", "page-Hearing from God", 20),
+                                         stats("en", "page-Other", 20)]}},
+            {"query": {"languagestats": [stats("de", "page-Prayer", 20), stats("de", "page-Hearing from God", 0)]}}]
+        result = self.lib.get_translation_progress(["Prayer", "Hearing_from_God"], "de")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertListEqual(list(result["Prayer"]), ["en", "de"])
+        self.assertListEqual(list(result["Hearing_from_God"]), ["en"])
+        self.assertNotIn("Other", result)
+
+        # Errors
+        mock_get.side_effect = None
+        mock_get.return_value = {}
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertDictEqual(self.lib.get_translation_progress(["Prayer"]), {})
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertDictEqual(self.lib.list_page_translations("Prayer"), {})
+
     def test_list_page_templates(self):
         result = self.lib.list_page_templates('Polish')
         result_de = self.lib.list_page_templates('Polish/de')
@@ -98,6 +214,31 @@ class TestFortrainingLib(unittest.TestCase):
         self.assertIn("Template:Translatable template", result)
         self.assertEqual(len(self.lib.list_page_templates('NotExisting')), 0)
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_list_templates(self, mock_get):
+        mock_get.side_effect = [
+            {"continue": {"tlcontinue": "2|10|Version", "continue": "||"}, "query": {
+                "normalized": [{"from": "Bible_Reading_Hints", "to": "Bible Reading Hints"}],
+                "pages": {"1": {"title": "Prayer", "templates": [{"ns": 10, "title": "Template:Italic/en"}]},
+                          "2": {"title": "Bible Reading Hints",
+                                "templates": [{"ns": 10, "title": "Template:BibleReadingHints"}]},
+                          "-1": {"title": "NotExisting", "missing": ""}}}},
+            {"query": {"pages": {"1": {"title": "Prayer"},
+                                 "2": {"title": "Bible Reading Hints",
+                                       "templates": [{"ns": 10, "title": "Template:Version"},
+                                                     {"ns": 10, "title": "Template:BibleReadingHints/de"}]}}}}]
+        result = self.lib.list_templates(["Prayer", "Bible_Reading_Hints", "NotExisting"])
+        self.assertDictEqual(result, {"Prayer": ["Template:Italic"], "NotExisting": [],
+                                      "Bible_Reading_Hints": ["Template:BibleReadingHints", "Template:Version"]})
+        self.assertEqual(mock_get.call_args[0][0]["tlcontinue"], "2|10|Version")
+
+        mock_get.side_effect = None
+        mock_get.return_value = {"query": {"pages": {
+            "1": {"title": "Template:BibleReadingHints", "lastrevid": 42},
+            "-1": {"title": "Template:NotExisting", "missing": ""}}}}
+        self.assertDictEqual(self.lib.get_latest_revisions(["Template:BibleReadingHints", "Template:NotExisting"]),
+                             {"Template:BibleReadingHints": 42, "Template:NotExisting": None})
+
     def test_get_pdf_name(self):
         self.assertEqual(self.lib.get_pdf_name('Forgiving_Step_by_Step', 'en'), 'Forgiving_Step_by_Step.pdf')
         self.assertEqual(self.lib.get_pdf_name('Forgiving_Step_by_Step', 'de'), 'Schritte_der_Vergebung.pdf')
@@ -108,6 +249,58 @@ class TestFortrainingLib(unittest.TestCase):
         self.assertEqual(self.lib.get_version('Forgiving_Step_by_Step', 'de'), '1.3')
         self.assertIsNone(self.lib.get_version('NotExisting', 'en'))
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_page_sources(self, mock_get):
+        def revisions(content: str):
+            return [{"slots": {"main": {"contentmodel": "wikitext", "*": content}}}]
+        mock_get.return_value = {"query": {
+            "normalized": [{"from": "Translations:Hearing_from_God/1/de", "to": "Translations:Hearing from God/1/de"}],
+            "pages": {
+                "-1": {"ns": 1198, "title": "Translations:Prayer/1/de", "missing": ""},
+                "1234": {"pageid": 1234, "ns": 1198, "title": "Translations:Hearing from God/1/de",
+                         "revisions": revisions("Gottes Reden wahrnehmen")},
+                "1235": {"pageid": 1235, "ns": 0, "title": "Prayer", "revisions": revisions("Prayer source")}}}}
+        result = self.lib.get_page_sources(["Translations:Hearing_from_God/1/de", "Translations:Prayer/1/de",
+                                            "Prayer"])
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args[0][0]["titles"],
+                         "Translations:Hearing_from_God/1/de|Translations:Prayer/1/de|Prayer")
+        self.assertDictEqual(result, {"Translations:Hearing_from_God/1/de": "Gottes Reden wahrnehmen",
+                                      "Translations:Prayer/1/de": None, "Prayer": "Prayer source"})
+
+        # Many titles should be split up into several requests
+        mock_get.reset_mock()
+        mock_get.return_value = {"query": {"pages": {}}}
+        titles = [f"Translations:Prayer/{counter}/de" for counter in range(self.lib.MAX_TITLES * 2 + 1)]
+        result = self.lib.get_page_sources(titles)
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(result), len(titles))
+
+        # Errors are logged and result in None values
+        mock_get.reset_mock()
+        mock_get.return_value = {}
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertDictEqual(self.lib.get_page_sources(["Prayer"]), {"Prayer": None})
+
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_recent_changes(self, mock_get):
+        mock_get.side_effect = [
+            {"continue": {"rccontinue": "20220501120000|43", "continue": "-||"}, "query": {"recentchanges": [
+                {"type": "edit", "title": "Translations:Prayer/5/de", "rcid": 42,
+                 "timestamp": "2022-05-01T11:00:00Z"}]}},
+            {"query": {"recentchanges": [
+                {"type": "log", "logtype": "upload", "title": "File:Gebet.pdf", "rcid": 43,
+                 "timestamp": "2022-05-01T12:00:00Z"}]}}]
+        result = self.lib.get_recent_changes("2022-05-01T10:00:00Z")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args[0][0]["rccontinue"], "20220501120000|43")
+        self.assertListEqual([change["title"] for change in result], ["Translations:Prayer/5/de", "File:Gebet.pdf"])
+
+        mock_get.side_effect = None
+        mock_get.return_value = {}
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertIsNone(self.lib.get_recent_changes("2022-05-01T10:00:00Z"))
+
     def test_title_to_message(self):
         self.assertEqual(self.lib.title_to_message('Time_with_God'), 'sidebar-timewithgod')
         self.assertEqual(self.lib.title_to_message('Dealing with Money'), 'sidebar-dealingwithmoney')
@@ -125,6 +318,31 @@ class TestFortrainingLib(unittest.TestCase):
         self.assertTrue(self.lib.get_file_url(test_file).startswith('https://www.4training.net'))
         self.assertTrue(self.lib.get_file_url(test_file).endswith(test_file))
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_file_infos(self, mock_get):
+        def image_info(name: str):
+            return {"url": f"https://www.4training.net/mediawiki/images/{name}", "size": 100, "sha1": "abc",
+                    "mime": "application/pdf", "timestamp": "2023-01-01T00:00:00Z"}
+        mock_get.return_value = {"query": {
+            "normalized": [{"from": "File:Prayer_de.pdf", "to": "File:Prayer de.pdf"}],
+            "pages": {"1": {"title": "File:Prayer.pdf", "imageinfo": [image_info("Prayer.pdf")]},
+                      "2": {"title": "File:Prayer de.pdf", "imageinfo": [image_info("Prayer_de.pdf")]},
+                      "-1": {"title": "File:Missing.pdf", "missing": ""}}}}
+        result = self.lib.get_file_infos(["Prayer.pdf", "Prayer_de.pdf", "Missing.pdf", "Prayer.pdf"])
+        self.assertEqual(len(result), 3)
+        self.assertDictEqual(result["Prayer.pdf"], image_info("Prayer.pdf"))
+        self.assertEqual(result["Prayer_de.pdf"]["url"], "https://www.4training.net/mediawiki/images/Prayer_de.pdf")
+        self.assertIsNone(result["Missing.pdf"])
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args[0][0]["titles"], "File:Prayer.pdf|File:Prayer_de.pdf|File:Missing.pdf")
+
+        # Up to MAX_TITLES files per request
+        mock_get.reset_mock()
+        mock_get.return_value = {"query": {"pages": {}}}
+        result = self.lib.get_file_infos([f"File{counter}.pdf" for counter in range(120)])
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(result), 120)
+
     def test_get_translation_units(self):
         # Not existing page should return an empty list
         with self.assertLogs("pywikitools.lib", level="WARNING"):
@@ -137,6 +355,29 @@ class TestFortrainingLib(unittest.TestCase):
             self.assertGreater(len([snippet for snippet in translation_unit]), 0)
         self.assertGreater(counter, 10)
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_get_translation_units_with_continue(self, mock_get):
+        mock_get.side_effect = messagecollection
+        translated_page = self.lib.get_translation_units("Prayer", "de", limit=3)
+        self.assertEqual(len(list(translated_page)), 7)
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_get.call_args[0][0]["mcoffset"], "6")
+
+        mock_get.reset_mock()
+        units = self.lib.iter_translation_units("Prayer", "de", limit=3)
+        self.assertEqual(next(units).get_name(), "Translations:Prayer/1/de")
+        self.assertEqual(mock_get.call_count, 1)    # The first units are there before we request the rest
+        self.assertEqual(len(list(units)), 6)
+        self.assertEqual(mock_get.call_count, 3)
+
+        with self.assertLogs("pywikitools.lib", level="WARNING"):
+            self.assertListEqual(list(self.lib.iter_translation_units("Invalid", "de")), [])
+
+        result = self.lib.get_translation_units_for_languages("Prayer", ["de", "ru", "de"])
+        self.assertListEqual(list(result), ["de", "ru"])
+        self.assertEqual(result["ru"].language_code, "ru")
+        self.assertEqual(len(list(result["ru"])), 7)
+
     @patch("pywikitools.fortraininglib.ForTrainingLib._get")
     def test_count_jobs(self, mock_get):
         mock_get.return_value = {"query": {"statistics": {"jobs": 42}}}
@@ -0,0 +1,84 @@
+"""
+Test measuring requests and wall time (Metrics) and writing the results
+
+Run tests:
+    python3 -m unittest test_instrumentation.py
+"""
+import json
+from os.path import join
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from pywikibot.data import api
+
+from pywikitools.instrumentation import Histogram, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for seconds in [0.01, 0.07, 0.3, 100]:
+            histogram.observe(seconds)
+        cumulative = dict(histogram.cumulative())
+        self.assertEqual(cumulative["0.05"], 1)
+        self.assertEqual(cumulative["0.1"], 2)
+        self.assertEqual(cumulative["0.5"], 3)
+        self.assertEqual(cumulative["30.0"], 3)
+        self.assertEqual(cumulative["+Inf"], 4)
+        self.assertAlmostEqual(histogram.total, 100.38)
+
+    def test_metrics(self):
+        metrics = Metrics()
+        metrics.observe_request("api", "revisions", 0.2, 1000)
+        metrics.observe_request("api", "revisions", 0.4, 500, error=True)
+        metrics.observe_request("pdf", "download", 2.0, 123456)
+        with metrics.timer("postprocessor", "WriteList"):
+            pass
+        metrics.add_time("language", "de", 1.5)
+        metrics.add_time("language", "de", 1.0)
+        result = metrics.as_dict()
+        revisions = result["requests"]["api"]["revisions"]
+        self.assertEqual(revisions["count"], 2)
+        self.assertEqual(revisions["errors"], 1)
+        self.assertEqual(revisions["bytes"], 1500)
+        self.assertEqual(revisions["latency"]["0.25"], 1)
+        self.assertEqual(revisions["latency"]["+Inf"], 2)
+        self.assertEqual(result["requests"]["pdf"]["download"]["bytes"], 123456)
+        self.assertIn("WriteList", result["timings"]["postprocessor"])
+        self.assertEqual(result["timings"]["language"]["de"], 2.5)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics.write_json(join(temp_dir, "report.json"), {"completed": True})
+            with open(join(temp_dir, "report.json"), "r") as f:
+                report = json.load(f)
+            self.assertTrue(report["completed"])
+            self.assertEqual(report["requests"], result["requests"])
+
+            metrics.write_prometheus(join(temp_dir, "test.prom"), "test")
+            with open(join(temp_dir, "test.prom"), "r") as f:
+                lines = f.read().splitlines()
+        self.assertIn('test_requests_total{source="api",kind="revisions"} 2', lines)
+        self.assertIn('test_request_errors_total{source="api",kind="revisions"} 1', lines)
+        self.assertIn('test_request_duration_seconds_bucket{source="api",kind="revisions",le="+Inf"} 2', lines)
+        self.assertIn('test_duration_seconds{category="language",name="de"} 2.5', lines)
+
+    @patch("pywikibot.data.api.Request.submit")
+    def test_instrument_pywikibot(self, mock_submit):
+        metrics = Metrics()
+        request = Mock()
+        request.action = "edit"
+        with metrics.instrument_pywikibot():
+            api.Request.submit(request)
+            mock_submit.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                api.Request.submit(request)
+        mock_submit.assert_called_with(request)
+        self.assertIs(api.Request.submit, mock_submit)    # restored
+        stats = metrics.as_dict()["requests"]["pywikibot"]["edit"]
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Test loading pages in batches and saving only real changes
+
+Run tests:
+    python3 -m unittest test_page_writer.py
+"""
+import unittest
+from unittest.mock import Mock, patch
+
+import pywikibot
+
+from pywikitools.resourcesbot.page_writer import PageWriter
+
+
+class TestPageWriter(unittest.TestCase):
+    def setUp(self):
+        self.site = Mock()
+        self.preloaded = []
+
+        def preloadpages(pages, groupsize=50):
+            for page in pages:
+                self.preloaded.append(page.title)
+                yield page
+        self.site.preloadpages.side_effect = preloadpages
+
+        self.pages = {"Summary": "Old content", "German": "Liste"}
+
+        def page_loader(site, title: str):
+            page = Mock()
+            page.title = title
+            page.exists.return_value = title in self.pages
+            page.text = self.pages.get(title, "")
+            return page
+        self.page_patcher = patch("pywikibot.Page", side_effect=page_loader)
+        self.mock_page = self.page_patcher.start()
+        self.page_writer = PageWriter(self.site)
+
+    def tearDown(self):
+        self.page_patcher.stop()
+
+    def test_preload(self):
+        self.page_writer.preload(["Summary", "German", "Summary", "New_page"])
+        self.site.preloadpages.assert_called_once()
+        self.assertListEqual(self.preloaded, ["Summary", "German", "New page"])
+        # Pages we know already are not loaded again
+        self.page_writer.preload(["German", "New page"])
+        self.site.preloadpages.assert_called_once()
+        self.assertIs(self.page_writer.get_page("New_page"), self.page_writer.get_page("New page"))
+        self.assertEqual(self.mock_page.call_count, 3)
+        self.assertEqual(self.page_writer.get_text("German"), "Liste")
+        self.assertIsNone(self.page_writer.get_text("New page"))
+        self.assertEqual(self.page_writer.stats["preloaded"], 3)
+        self.assertEqual(self.page_writer.stats["loaded"], 0)
+
+        # If preloading fails, pages are loaded later when we need them
+        self.site.preloadpages.side_effect = pywikibot.exceptions.Error("Test")
+        with self.assertLogs("pywikitools.resourcesbot.page_writer", level="WARNING"):
+            self.page_writer.preload(["Russian"])
+        self.assertEqual(self.page_writer.get_text("Russian"), None)
+
+    def test_write(self):
+        # No change (apart from whitespace): don't save
+        self.assertFalse(self.page_writer.write("Summary", "Old content\n", "Updated summary"))
+        self.page_writer.get_page("Summary").save.assert_not_called()
+        self.assertEqual(self.page_writer.stats["unchanged"], 1)
+
+        self.assertTrue(self.page_writer.write("Summary", "New content", "Updated summary"))
+        page = self.page_writer.get_page("Summary")
+        page.save.assert_called_once_with("Updated summary")
+        self.assertEqual(page.text, "New content")
+
+        # Pages that don't exist are created
+        self.assertTrue(self.page_writer.write("New page", "", "Created"))
+        self.page_writer.get_page("New page").save.assert_called_once_with("Created")
+        self.assertEqual(self.page_writer.stats["saved"], 2)
+        self.assertEqual(self.page_writer.stats["loaded"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
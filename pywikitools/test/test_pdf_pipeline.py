@@ -0,0 +1,160 @@
+"""
+Test the background download and analysis of PDF files for ResourcesBot
+
+Run tests:
+    python3 -m unittest test_pdf_pipeline.py
+"""
+from datetime import datetime
+import os
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+import threading
+import unittest
+from typing import Optional
+from unittest.mock import Mock, patch
+
+from pywikitools.pdftools.metadata_cache import PdfMetadataCache
+from pywikitools.resourcesbot.data_structures import FileInfo, TranslationProgress, WorksheetInfo
+from pywikitools.resourcesbot.pdf_pipeline import PdfPipeline
+from pywikitools.test.test_data_structures import TEST_PROGRESS
+from pywikitools.test.test_pdftools_metadata import TestPdfMetadata
+from pywikitools.test.test_rangefile import FakeSession
+
+PDF_FILE = join(dirname(abspath(__file__)), "data", "Gottes_Reden_wahrnehmen.pdf")
+
+
+class TestPdfPipeline(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fortraininglib = Mock()
+        self.fortraininglib.get_language_name.side_effect = TestPdfMetadata.mock_get_language_name
+        self.max_files = 0      # maximum number of files in our temp folder that we observed
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def download(self, filename: str) -> bool:
+        """Emulate pywikibot.FilePage.download()"""
+        with self.lock:
+            self.max_files = max(self.max_files, len(os.listdir(self.temp_dir.name)))
+        shutil.copyfile(PDF_FILE, filename)
+        return True
+
+    def submit_worksheets(self, pipeline: PdfPipeline, count: int, sha1: Optional[str] = None):
+        """Submit the same PDF for count worksheets"""
+        progress = TranslationProgress(**TEST_PROGRESS)
+        worksheets = []
+        for counter in range(count):
+            worksheet = WorksheetInfo("Hearing_from_God", "de", "Gottes Reden wahrnehmen", progress, "1.2")
+            worksheet.add_file_info(FileInfo("odt", "https://www.4training.net/test.odt", datetime(1970, 1, 1)))
+            worksheet.add_file_info(FileInfo("pdf", "https://www.4training.net/test.pdf", datetime(1970, 1, 1),
+                                             translation_unit=counter))
+            file_page = Mock()
+            file_page.title.return_value = "Gottes_Reden_wahrnehmen.pdf"
+            file_page.download.side_effect = self.download
+            file_page.latest_file_info.sha1 = sha1
+            file_info = worksheet.get_file_type_info("pdf")
+            assert file_info is not None
+            pipeline.submit(worksheet, file_page, file_info)
+            worksheets.append(worksheet)
+        return worksheets
+
+    def test_analyze_in_threads(self):
+        with PdfPipeline(self.fortraininglib, self.temp_dir.name, downloads=3, analyzers=0, max_files=2) as pipeline:
+            worksheets = self.submit_worksheets(pipeline, 10)
+        for counter, worksheet in enumerate(worksheets):
+            pdf_info = worksheet.get_file_type_info("pdf")
+            self.assertIsNotNone(pdf_info.metadata)
+            self.assertTrue(pdf_info.metadata.correct)
+            self.assertEqual(pdf_info.metadata.version, "1.2")
+            self.assertEqual(pdf_info.translation_unit, counter)
+            self.assertListEqual(list(worksheet.get_file_infos()), ["odt", "pdf"])     # order must be kept
+        self.assertLessEqual(self.max_files, 2)                     # back-pressure
+        self.assertListEqual(os.listdir(self.temp_dir.name), [])    # all temporary files are deleted
+
+    def test_analyze_in_processes(self):
+        with PdfPipeline(self.fortraininglib, self.temp_dir.name, downloads=2, analyzers=1, max_files=1) as pipeline:
+            worksheets = self.submit_worksheets(pipeline, 3)
+        for worksheet in worksheets:
+            self.assertTrue(worksheet.get_file_type_info("pdf").metadata.only_docinfo)
+        self.assertEqual(self.max_files, 1)
+        self.assertListEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_cache(self):
+        cache_file = join(self.temp_dir.name, "pdfmetadata.sqlite")
+        with PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=0,
+                         cache=PdfMetadataCache(cache_file)) as pipeline:
+            worksheets = self.submit_worksheets(pipeline, 1, sha1="abc")
+        self.assertEqual(self.max_files, 2)     # our cache file and the downloaded PDF
+
+        # Second run: the file didn't change (same SHA1) -> no need to download it again
+        self.max_files = 0
+        with PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=0,
+                         cache=PdfMetadataCache(cache_file)) as pipeline:
+            worksheets.extend(self.submit_worksheets(pipeline, 2, sha1="abc"))
+        self.assertEqual(self.max_files, 0)
+        for worksheet in worksheets:
+            self.assertTrue(worksheet.get_file_type_info("pdf").metadata.correct)
+            self.assertEqual(worksheet.get_file_type_info("pdf").metadata.version, "1.2")
+
+        # Entries are independent of each other
+        cache = PdfMetadataCache(cache_file)
+        self.assertIsNone(cache.get("def"))
+        self.assertTrue(cache.get("abc").only_docinfo)
+        cache.close()
+
+    def test_range_requests(self):
+        with open(PDF_FILE, "rb") as f:
+            session = FakeSession(f.read())
+        with patch("pywikitools.resourcesbot.pdf_pipeline.requests.Session", return_value=session):
+            with PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=1, range_requests=True) as pipeline:
+                worksheets = self.submit_worksheets(pipeline, 2)
+        for worksheet in worksheets:
+            self.assertTrue(worksheet.get_file_type_info("pdf").metadata.correct)
+        self.assertGreater(len(session.requested_ranges), 0)
+        self.assertEqual(self.max_files, 0)     # no need to download
+
+        # Server doesn't support range requests: we download the whole file
+        session.support_ranges = False
+        with patch("pywikitools.resourcesbot.pdf_pipeline.requests.Session", return_value=session):
+            with PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=0, max_files=1,
+                             range_requests=True) as pipeline:
+                worksheets = self.submit_worksheets(pipeline, 2)
+        for worksheet in worksheets:
+            self.assertTrue(worksheet.get_file_type_info("pdf").metadata.correct)
+        self.assertEqual(self.max_files, 1)
+
+    def test_failures(self):
+        progress = TranslationProgress(**TEST_PROGRESS)
+        worksheet = WorksheetInfo("Hearing_from_God", "de", "Gottes Reden wahrnehmen", progress, "1.2")
+        worksheet.add_file_info(FileInfo("pdf", "https://www.4training.net/test.pdf", datetime(1970, 1, 1)))
+        file_page = Mock()
+        file_page.title.return_value = "Broken.pdf"
+        pipeline = PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=0)
+        # Download fails
+        file_page.download.return_value = False
+        pipeline.submit(worksheet, file_page, worksheet.get_file_type_info("pdf"))
+        # Downloaded file is no valid PDF
+        file_page.download.side_effect = lambda filename: open(filename, "w").write("No PDF") > 0
+        pipeline.submit(worksheet, file_page, worksheet.get_file_type_info("pdf"))
+        with self.assertLogs("pywikitools.resourcesbot.pdf_pipeline", level="WARNING") as logs:
+            pipeline.finish()
+        self.assertEqual(len(logs.output), 2)
+        self.assertIsNone(worksheet.get_file_type_info("pdf").metadata)
+        self.assertListEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_temp_file_failure(self):
+        # If we can't create the temporary file, its slot must be freed (otherwise submit() would block forever)
+        with patch("pywikitools.resourcesbot.pdf_pipeline.tempfile.mkstemp", side_effect=OSError("Disk full")):
+            with PdfPipeline(self.fortraininglib, self.temp_dir.name, analyzers=0, max_files=1) as pipeline:
+                with self.assertLogs("pywikitools.resourcesbot.pdf_pipeline", level="WARNING") as logs:
+                    worksheets = self.submit_worksheets(pipeline, 3)
+                    pipeline.finish()
+        self.assertEqual(len(logs.output), 3)
+        self.assertIsNone(worksheets[2].get_file_type_info("pdf").metadata)
+
+
+if __name__ == '__main__':
+    unittest.main()
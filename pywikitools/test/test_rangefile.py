@@ -0,0 +1,82 @@
+"""
+Test reading parts of remote files with HTTP Range requests (with a fake server)
+
+Run tests:
+    python3 -m unittest test_rangefile.py
+"""
+from os.path import abspath, dirname, join
+import re
+from typing import List, Tuple
+import unittest
+from unittest.mock import Mock
+
+from pywikitools.pdftools.metadata import read_metadata
+from pywikitools.pdftools.rangefile import HttpRangeFile, RangeRequestsNotSupported
+
+
+class FakeSession:
+    """Emulates requests.Session.get() of a web server that supports range requests"""
+    def __init__(self, content: bytes, support_ranges: bool = True):
+        self.content = content
+        self.support_ranges = support_ranges
+        self.requested_ranges: List[Tuple[int, int]] = []
+
+    def get(self, url, headers, timeout, stream):
+        response = Mock()
+        if not self.support_ranges:
+            response.status_code = 200
+            response.content = self.content
+            return response
+        handler = re.fullmatch(r"bytes=(\d*)-(\d*)", headers["Range"])
+        if handler.group(1) == "":     # suffix range: last n bytes
+            start = max(0, len(self.content) - int(handler.group(2)))
+            end = len(self.content) - 1
+        else:
+            start = int(handler.group(1))
+            end = min(int(handler.group(2)), len(self.content) - 1)
+        self.requested_ranges.append((start, end))
+        response.status_code = 206
+        response.content = self.content[start:end + 1]
+        response.headers = {"Content-Range": f"bytes {start}-{end}/{len(self.content)}"}
+        return response
+
+    def close(self):
+        pass
+
+
+class TestHttpRangeFile(unittest.TestCase):
+    def test_read(self):
+        session = FakeSession(bytes(range(256)) * 40)     # 10240 bytes
+        with HttpRangeFile("https://www.example.com/test.pdf", session, block_size=1000) as remote_file:
+            self.assertEqual(remote_file.size, 10240)
+            self.assertListEqual(session.requested_ranges, [(9240, 10239)])
+            self.assertEqual(remote_file.seek(-10, 2), 10230)
+            self.assertEqual(remote_file.read(), session.content[-10:])
+            self.assertEqual(remote_file.requests, 1)   # We got this with our first request already
+
+            remote_file.seek(1500)
+            self.assertEqual(remote_file.read(2000), session.content[1500:3500])
+            self.assertEqual(session.requested_ranges[1], (1000, 3999))     # only one request for three blocks
+            remote_file.seek(2500)
+            self.assertEqual(remote_file.read(100), session.content[2500:2600])
+            self.assertEqual(remote_file.requests, 2)
+            self.assertEqual(remote_file.bytes_received, 1000 + 3000)
+
+    def test_not_supported(self):
+        with self.assertRaises(RangeRequestsNotSupported):
+            HttpRangeFile("https://www.example.com/test.pdf", FakeSession(b"abc", support_ranges=False))
+
+    def test_read_metadata(self):
+        for file_name, pdf1a in [("Umgang_mit_Geld.pdf", True), ("Gottes_Reden_wahrnehmen.pdf", False)]:
+            with open(join(dirname(abspath(__file__)), "data", file_name), "rb") as f:
+                session = FakeSession(f.read())
+            with HttpRangeFile(f"https://www.example.com/{file_name}", session, block_size=4096) as remote_file:
+                metadata = read_metadata(remote_file)
+                self.assertEqual(metadata.pdfa_status == "1A", pdf1a)
+                self.assertIn("Version 1.", metadata.keywords)
+                # We don't need to read the whole file (these are small files, big images would never be read)
+                self.assertLess(remote_file.bytes_received, remote_file.size * 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,15 +6,22 @@ TODO: Find ways to run meaningful tests that don't take too long...
 """
 from configparser import ConfigParser
 from datetime import datetime
+import json
 from os.path import abspath, dirname, join
+import tempfile
+import time
 import unittest
 from unittest.mock import patch, Mock
 
 import pywikibot
 
 from pywikitools.resourcesbot.bot import ResourcesBot
-from pywikitools.resourcesbot.data_structures import TranslationProgress, WorksheetInfo
+from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+from pywikitools.resourcesbot.data_structures import DataStructureEncoder, FileInfo, LanguageInfo, \
+                                                     TranslationProgress, WorksheetInfo, language_info_from_json, \
+                                                     language_info_to_json
 from pywikitools.test.test_data_structures import TEST_PROGRESS, TEST_TIME, TEST_URL
+from pywikitools.worksheet_source import WorksheetSource
 
 HEARING_FROM_GOD = """[...]
 <translate>This is the end of the mediawiki source of the Hearing from God worksheet...</translate>
@@ -32,7 +39,8 @@ class TestResourcesBot(unittest.TestCase):
     def setUp(self):
         self.config = ConfigParser()
         self.config.read_dict({"mediawiki": {"baseurl": "https://www.4training.net", "scriptpath": "/mediawiki"},
-                               "Paths": {"logs": "~/", "temp": "~/temp/"}})    # Fill this to prevent warnings
+                               "Paths": {"logs": "~/", "temp": "~/temp/"},     # Fill this to prevent warnings
+                               "resourcesbot": {"pdf_metadata_cache": "", "snapshot": "", "run_report": ""}})
         self.bot = ResourcesBot(self.config)
 
     def tearDown(self):
@@ -49,13 +57,13 @@ class TestResourcesBot(unittest.TestCase):
         progress = TranslationProgress(**TEST_PROGRESS)
         worksheet_info = WorksheetInfo("Hearing_from_God", "en", "Hearing from God", progress, "1.2")
         with self.assertLogs("pywikitools.resourcesbot", level="WARNING"):  # warning for not checking PDF metadata
-            self.bot._add_english_file_infos(HEARING_FROM_GOD, worksheet_info)
+            self.bot._add_english_file_infos(WorksheetSource("Hearing_from_God", HEARING_FROM_GOD), worksheet_info)
         self.assertTrue(worksheet_info.has_file_type("pdf"))
         self.assertTrue(worksheet_info.has_file_type("odt"))
 
         # Test correct handling for an existing page that doesn't have downloadable files
         worksheet_info = WorksheetInfo("Languages", "en", "Languages", progress, "1.2")
-        self.bot._add_english_file_infos("Some mediawiki content...", worksheet_info)
+        self.bot._add_english_file_infos(WorksheetSource("Languages", "Some mediawiki content..."), worksheet_info)
         self.assertEqual(len(worksheet_info.get_file_infos()), 0)
 
     @patch("pywikitools.resourcesbot.bot.os")
@@ -94,14 +102,187 @@ class TestResourcesBot(unittest.TestCase):
         self.assertFalse(worksheet_info.has_file_type("pdf"))
 
     def test_get_english_version(self):
-        version, version_unit = self.bot.get_english_version(HEARING_FROM_GOD)
+        version, version_unit = self.bot.get_english_version(WorksheetSource("Hearing_from_God", HEARING_FROM_GOD))
         self.assertEqual(version, "1.2")
         self.assertEqual(version_unit, 55)
         with self.assertLogs("pywikitools.resourcesbot", level="WARNING"):
-            version, version_unit = self.bot.get_english_version("Some mediawiki content...")
+            version, version_unit = self.bot.get_english_version(WorksheetSource("Languages", "Some content..."))
         self.assertEqual(version, "")
         self.assertEqual(version_unit, 0)
 
+    @patch("pywikitools.fortraininglib.ForTrainingLib.get_page_sources")
+    @patch("pywikitools.fortraininglib.ForTrainingLib.get_translation_progress")
+    @patch("pywikibot.FilePage")
+    def test_query_translations(self, mock_filepage, mock_get_translation_progress, mock_get_page_sources):
+        mock_filepage.return_value.exists.return_value = True
+        mock_filepage.return_value.latest_file_info.url = "https://www.4training.net/test/Hearing_from_God.pdf"
+        mock_filepage.return_value.latest_file_info.timestamp = datetime.fromisoformat(TEST_TIME)
+        mock_filepage.return_value.download.return_value = False
+        mock_get_translation_progress.return_value = {"Hearing_from_God": {
+            "en": TranslationProgress(**TEST_PROGRESS), "de": TranslationProgress(**TEST_PROGRESS)}}
+        sources = {
+            "Translations:Hearing_from_God/Page display title/en": "Hearing from God",
+            "Hearing_from_God": HEARING_FROM_GOD,
+            "Translations:Hearing_from_God/Page display title/de": "Gottes Reden wahrnehmen",
+            "Translations:Hearing_from_God/55/de": "1.2",
+            "Translations:Hearing_from_God/52/de": "Gottes_Reden_wahrnehmen.pdf"
+        }
+        mock_get_page_sources.side_effect = lambda titles: {title: sources.get(title) for title in titles}
+        with self.assertLogs("pywikitools.resourcesbot", level="WARNING"):
+            result = self.bot._query_translations("Hearing_from_God")
+
+        # All translation units of all languages must be requested together
+        self.assertEqual(mock_get_page_sources.call_count, 2)
+        self.assertEqual(len(mock_get_page_sources.call_args[0][0]), 4)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0].language_code, "en")
+        self.assertEqual(result[0].version_unit, 55)
+        self.assertEqual(result[1].title, "Gottes Reden wahrnehmen")
+        self.assertEqual(result[1].version, "1.2")
+        self.assertTrue(result[1].has_file_type("pdf"))
+        self.assertFalse(result[1].has_file_type("odt"))    # Translation unit 53 doesn't exist
+
+    def test_query_all_worksheets_parallel(self):
+        def query_translations(page: str):
+            """Return English and German WorksheetInfo, finishing in reverse order of the worksheet list"""
+            time.sleep(0.05 * (3 - worksheets.index(page)))
+            progress = TranslationProgress(**TEST_PROGRESS)
+            return [WorksheetInfo(page, "en", page, progress, "1.2"), WorksheetInfo(page, "de", page, progress, "1.2")]
+
+        worksheets = ["Prayer", "Church", "Healing"]
+        results = []
+        for workers in ["1", "3"]:
+            self.config.read_dict({"resourcesbot": {"workers": workers}})
+            bot = ResourcesBot(self.config)
+            bot._result["en"] = LanguageInfo("en", "English")
+            with patch("pywikitools.fortraininglib.ForTrainingLib.get_worksheet_list", return_value=worksheets), \
+                 patch("pywikitools.fortraininglib.ForTrainingLib.get_language_name", return_value="German"), \
+                 patch.object(bot, "_query_translations", side_effect=query_translations):
+                bot._query_all_worksheets()
+            bot.fortraininglib.session.close()
+            results.append(bot._result)
+
+        # Parallel querying must give exactly the same result as querying one worksheet after the other
+        self.assertListEqual(list(results[0]), ["en", "de"])
+        self.assertListEqual(list(results[1]), ["en", "de"])
+        for lang in ["en", "de"]:
+            self.assertListEqual(list(results[1][lang].worksheets), worksheets)
+            self.assertEqual(DataStructureEncoder().encode(results[0][lang]),
+                             DataStructureEncoder().encode(results[1][lang]))
+
+    def test_find_affected_worksheets(self):
+        progress = TranslationProgress(**TEST_PROGRESS)
+        worksheet_info = WorksheetInfo("Hearing_from_God", "de", "Gottes Reden wahrnehmen", progress, "1.2")
+        worksheet_info.add_file_info(FileInfo("pdf", "https://www.4training.net/test/Gottes_Reden_wahrnehmen.pdf",
+                                              TEST_TIME))
+        self.bot._result["de"] = LanguageInfo("de", "German")
+        self.bot._result["de"].add_worksheet_info("Hearing_from_God", worksheet_info)
+        self.bot._missing_files["Gebet.pdf"] = ("Prayer", "de")
+        worksheets = ["Prayer", "Hearing_from_God", "Church", "Healing"]
+
+        affected = self.bot._find_affected_worksheets(
+            ["Translations:Hearing from God/5/de", "Translations:Hearing from God/7/ru", "Church/tr", "Healing",
+             "Translations:Healing/3/de", "File:Gebet.pdf", "4training:de.json", "File:Unknown.pdf", "NotExisting/de"],
+            worksheets)
+        self.assertDictEqual(affected, {"Hearing_from_God": {"de", "ru"}, "Church": {"tr"}, "Healing": None,
+                                        "Prayer": {"de"}})
+        affected = self.bot._find_affected_worksheets(["File:Gottes Reden wahrnehmen.pdf"], worksheets)
+        self.assertDictEqual(affected, {"Hearing_from_God": {"de"}})
+
+    @patch("pywikibot.Site", autospec=True)
+    @patch("pywikibot.Page", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteSummary", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteReport", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteList", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteSidebarMessages", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ExportRepository", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ExportHTML", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ConsistencyCheck", autospec=True)
+    def test_run_incremental(self, mock_consistency_check, mock_export_html, mock_export_repository,
+                             mock_write_sidebar_messages, mock_write_list, mock_write_report, mock_write_summary,
+                             mock_pywikibot_page, mock_pywikibot_site):
+        pages = {}
+        with open(join(dirname(abspath(__file__)), "data", "en.json"), 'r') as f:
+            pages["4training:en.json"] = f.read()
+        with open(join(dirname(abspath(__file__)), "data", "ru.json"), 'r') as f:
+            pages["4training:ru.json"] = f.read()
+        pages["4training:languages.json"] = '["en", "ru"]'
+        pages["4training:resourcesbot.json"] = '{"timestamp": "2022-05-01T10:00:00Z", "rcid": 42}'
+
+        def page_loader(site, title: str):
+            result = Mock()
+            result.exists.return_value = title in pages
+            result.text = pages.get(title, "")
+            return result
+        mock_pywikibot_page.side_effect = page_loader
+        mock_pywikibot_site.return_value.logged_in.return_value = True
+        english_worksheets = [worksheet["page"] for worksheet in json.loads(pages["4training:en.json"])["worksheets"]]
+        bot = ResourcesBot(self.config, incremental=True)
+
+        # No changes since our last run: nothing needs to be queried or compared
+        with patch("pywikitools.fortraininglib.ForTrainingLib.get_recent_changes", return_value=[
+                       {"type": "edit", "title": "Prayer", "rcid": 42, "timestamp": "2022-05-01T10:00:00Z"}]), \
+             patch("pywikitools.fortraininglib.ForTrainingLib.get_worksheet_list", return_value=english_worksheets), \
+             patch.object(bot, "_query_translations") as mock_query_translations, \
+             patch.object(bot, "_sync_and_compare") as mock_sync_and_compare:
+            bot.run()
+        mock_query_translations.assert_not_called()
+        mock_sync_and_compare.assert_not_called()
+        self.assertTrue(bot._changelog["en"].is_empty())
+        self.assertTrue(bot._changelog["ru"].is_empty())
+        self.assertEqual(mock_write_list.return_value.run.call_count, 2)
+
+        # A Russian translation unit got edited: only that worksheet in Russian (and English) gets queried again
+        bot = ResourcesBot(self.config, incremental=True)
+        new_info = WorksheetInfo("Baptism", "ru", "New title", TranslationProgress(**TEST_PROGRESS), "2.1")
+        with patch("pywikitools.fortraininglib.ForTrainingLib.get_recent_changes", return_value=[
+                       {"type": "edit", "title": "Translations:Baptism/1/ru", "rcid": 43,
+                        "timestamp": "2022-05-01T11:00:00Z"}]), \
+             patch("pywikitools.fortraininglib.ForTrainingLib.get_worksheet_list", return_value=english_worksheets), \
+             patch.object(bot, "_query_translations") as mock_query_translations, \
+             patch.object(bot, "_sync_and_compare", return_value=ChangeLog()) as mock_sync_and_compare, \
+             patch.object(bot, "_save_state") as mock_save_state:
+            mock_query_translations.side_effect = lambda page, languages: [bot._result["en"].worksheets[page],
+                                                                           new_info]
+            bot.run()
+        mock_query_translations.assert_called_once_with("Baptism", {"ru"})
+        self.assertEqual(mock_sync_and_compare.call_count, 2)
+        self.assertEqual(bot._result["ru"].worksheets["Baptism"].title, "New title")
+        self.assertEqual(list(bot._result["ru"].worksheets).index("Baptism"), 1)    # order must be kept
+        mock_save_state.assert_called_once_with({"timestamp": "2022-05-01T11:00:00Z", "rcid": 43})
+
+    @patch("pywikibot.Page", autospec=True)
+    def test_sync_and_compare(self, mock_pywikibot_page):
+        with open(join(dirname(abspath(__file__)), "data", "ru.json"), 'r') as f:
+            stored_json = f.read()
+        mock_pywikibot_page.return_value.exists.return_value = True
+        mock_pywikibot_page.return_value.text = stored_json
+        language_info = language_info_from_json(stored_json)
+
+        # Nothing changed: don't save
+        self.assertTrue(self.bot._sync_and_compare(language_info).is_empty())
+        mock_pywikibot_page.return_value.save.assert_not_called()
+
+        # Only volatile fields changed: don't save either
+        changed_info = LanguageInfo("ru", "")
+        for page, worksheet_info in language_info.worksheets.items():
+            changed_info.add_worksheet_info(page, worksheet_info)
+        self.assertTrue(self.bot._sync_and_compare(changed_info).is_empty())
+        mock_pywikibot_page.return_value.save.assert_not_called()
+
+        # Relevant change: save and report it
+        language_info.remove_worksheet_info("Prayer")
+        changes = self.bot._sync_and_compare(language_info)
+        self.assertListEqual([item.change_type for item in changes], [ChangeType.DELETED_WORKSHEET])
+        mock_pywikibot_page.return_value.save.assert_called_once()
+        self.assertEqual(mock_pywikibot_page.return_value.text, language_info_to_json(language_info))
+
+        # If we read the JSON already in the beginning, we don't load it again
+        mock_pywikibot_page.reset_mock()
+        self.bot._stored_json["ru"] = language_info_to_json(language_info)
+        self.assertTrue(self.bot._sync_and_compare(language_info).is_empty())
+        mock_pywikibot_page.return_value.exists.assert_not_called()
+
     @patch("pywikibot.Site", autospec=True)
     @patch("pywikibot.Page", autospec=True)
     @patch("pywikitools.resourcesbot.bot.WriteSummary", autospec=True)
@@ -147,6 +328,66 @@ class TestResourcesBot(unittest.TestCase):
         self.assertTrue(bot._changelog["ru"].is_empty())
         self.assertEqual(len(bot._changelog), 2)
 
+    @patch("pywikibot.Site", autospec=True)
+    @patch("pywikibot.Page", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteSummary", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteReport", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteList", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.WriteSidebarMessages", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ExportRepository", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ExportHTML", autospec=True)
+    @patch("pywikitools.resourcesbot.bot.ConsistencyCheck", autospec=True)
+    def test_run_with_snapshot(self, mock_consistency_check, mock_export_html, mock_export_repository,
+                               mock_write_sidebar_messages, mock_write_list, mock_write_report, mock_write_summary,
+                               mock_pywikibot_page, mock_pywikibot_site):
+        def json_test_loader(site, page: str):
+            result = Mock()
+            result.text = '["en", "ru"]' if page == "4training:languages.json" else \
+                open(join(dirname(abspath(__file__)), "data", page[10:]), 'r').read()
+            return result
+        mock_pywikibot_page.side_effect = json_test_loader
+        mock_pywikibot_site.return_value.logged_in.return_value = True
+        for name, mock_processor in [("ConsistencyCheck", mock_consistency_check), ("ExportHTML", mock_export_html),
+                                     ("ExportRepository", mock_export_repository), ("WriteList", mock_write_list),
+                                     ("WriteSidebarMessages", mock_write_sidebar_messages),
+                                     ("WriteReport", mock_write_report), ("WriteSummary", mock_write_summary)]:
+            mock_processor.return_value.name.return_value = name
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.config.set("resourcesbot", "snapshot", join(temp_dir, "snapshot.sqlite"))
+            self.config.set("resourcesbot", "run_report", join(temp_dir, "report.json"))
+            self.config.set("resourcesbot", "prometheus_textfile", join(temp_dir, "resourcesbot.prom"))
+            # Every run stores a snapshot...
+            bot = ResourcesBot(self.config, read_from_cache=True)
+            bot.run()
+            expected = {lang: language_info_to_json(language_info) for lang, language_info in bot._result.items()}
+
+            # ... and writes a report
+            with open(join(temp_dir, "report.json"), "r") as f:
+                report = json.load(f)
+            self.assertTrue(report["completed"])
+            self.assertEqual(report["mode"], "cache")
+            self.assertEqual(report["languages"], 2)
+            self.assertListEqual(sorted(report["timings"]["phase"]), ["gather", "postprocessing", "sync"])
+            self.assertIn("WriteList", report["timings"]["postprocessor"])
+            with open(join(temp_dir, "resourcesbot.prom"), "r") as f:
+                self.assertIn('resourcesbot_duration_seconds{category="phase",name="sync"}', f.read())
+
+            # ... so that we can read from it without loading anything from the mediawiki system
+            mock_pywikibot_page.reset_mock()
+            mock_pywikibot_site.return_value.logged_in.reset_mock()
+            bot = ResourcesBot(self.config, read_from_snapshot=True)
+            bot.run()
+            mock_pywikibot_page.assert_not_called()
+            mock_pywikibot_site.return_value.logged_in.assert_not_called()
+            self.assertDictEqual({lang: language_info_to_json(language_info)
+                                  for lang, language_info in bot._result.items()}, expected)
+            self.assertTrue(bot._changelog["ru"].is_empty())
+            self.assertEqual(mock_write_list.return_value.run.call_count, 4)
+
+            bot = ResourcesBot(self.config, limit_to_lang="ru", read_from_snapshot=True)
+            bot.run()
+            self.assertListEqual(list(bot._result), ["ru", "en"])
+
     # TODO: test_run_with_limit_lang
 
 
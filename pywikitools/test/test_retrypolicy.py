@@ -0,0 +1,65 @@
+"""
+Test the retry policy and rate limiting for API requests
+
+Run tests:
+    python3 -m unittest test_retrypolicy.py
+"""
+from configparser import ConfigParser
+import unittest
+from unittest.mock import patch
+
+from pywikitools.retrypolicy import RateLimiter, RetryPolicy
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_get_delay(self):
+        policy = RetryPolicy(backoff=2, max_backoff=10)
+        for _ in range(20):
+            # Exponential backoff with jitter: between half and full of 2, 4, 8, 10, 10...
+            self.assertTrue(1 <= policy.get_delay(1) <= 2)
+            self.assertTrue(2 <= policy.get_delay(2) <= 4)
+            self.assertTrue(4 <= policy.get_delay(3) <= 8)
+            self.assertTrue(5 <= policy.get_delay(6) <= 10)
+        # The server may ask us to wait longer
+        self.assertGreaterEqual(policy.get_delay(1, "30"), 30)
+        self.assertEqual(policy.get_delay(1, "100000"), RetryPolicy.MAX_RETRY_AFTER)
+        self.assertTrue(1 <= policy.get_delay(1, "invalid") <= 2)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(RetryPolicy.parse_retry_after("5"), 5)
+        self.assertEqual(RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)   # in the past
+        self.assertIsNone(RetryPolicy.parse_retry_after("soon"))
+        self.assertIsNone(RetryPolicy.parse_retry_after(None))
+
+    def test_is_maxlag_error(self):
+        self.assertTrue(RetryPolicy.is_maxlag_error({"error": {"code": "maxlag", "info": "Waiting..."}}))
+        self.assertFalse(RetryPolicy.is_maxlag_error({"error": {"code": "badparameter"}}))
+        self.assertFalse(RetryPolicy.is_maxlag_error({}))
+
+    def test_from_config(self):
+        config = ConfigParser()
+        config.read_dict({"mediawiki": {"max_attempts": "5", "maxlag": "0", "requests_per_second": "2.5"}})
+        policy = RetryPolicy.from_config(config)
+        self.assertEqual(policy.max_attempts, 5)
+        self.assertEqual(policy.maxlag, 0)
+        self.assertEqual(policy.requests_per_second, 2.5)
+        self.assertEqual(policy.backoff, 1)
+
+    @patch("pywikitools.retrypolicy.time.monotonic")
+    def test_rate_limiter(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        limiter = RateLimiter(2, burst=2)
+        self.assertEqual(limiter.reserve(), 0)
+        self.assertEqual(limiter.reserve(), 0)
+        self.assertEqual(limiter.reserve(), 0.5)    # bucket is empty: wait for the next token
+        self.assertEqual(limiter.reserve(), 1)
+        mock_monotonic.return_value = 102           # refilled again after two seconds
+        self.assertEqual(limiter.reserve(), 0)
+
+        self.assertIsNone(RateLimiter.for_host("https://www.example.net", 0))
+        limiter = RateLimiter.for_host("https://www.example.net", 5)
+        self.assertIs(limiter, RateLimiter.for_host("https://www.example.net", 5))    # one limiter per host
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Test running post-processors according to their dependencies, for several languages in parallel
+
+Run tests:
+    python3 -m unittest test_scheduler.py
+"""
+import threading
+import time
+import unittest
+from typing import Dict, List, Tuple
+
+from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+from pywikitools.resourcesbot.data_structures import LanguageInfo
+from pywikitools.resourcesbot.post_processing import GlobalPostProcessor, LanguagePostProcessor
+from pywikitools.resourcesbot.scheduler import PostProcessingScheduler
+
+
+class RecordingProcessor(LanguagePostProcessor):
+    """Remembers for which languages it ran, takes some time and fails for the given languages"""
+    def __init__(self, record: list, fail_for=(), duration: float = 0.0):
+        self.record = record
+        self.fail_for = fail_for
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def run(self, language_info: LanguageInfo, english_info: LanguageInfo, change_log: ChangeLog):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.duration)
+        with self.lock:
+            self.running -= 1
+            self.record.append((self.name(), language_info.language_code))
+        if language_info.language_code in self.fail_for:
+            raise RuntimeError("Test failure")
+
+    def pages_to_preload(self, language_info: LanguageInfo, change_log: ChangeLog) -> List[str]:
+        return [f"{self.name()}/{language_info.language_code}"]
+
+
+class RecordingGlobalProcessor(GlobalPostProcessor):
+    RELEVANT_CHANGES = frozenset([ChangeType.NEW_WORKSHEET])
+
+    def __init__(self, record: list):
+        self.record = record
+
+    def run(self, language_data: Dict[str, LanguageInfo], changes: Dict[str, ChangeLog]):
+        self.record.append((self.name(), ""))
+
+
+def processor_class(name: str, depends_on: Tuple[str, ...] = (), relevant_changes=None):
+    """Create a new post-processor class (the scheduler identifies post-processors by their class name)"""
+    return type(name, (RecordingProcessor,), {"DEPENDS_ON": depends_on, "RELEVANT_CHANGES": relevant_changes})
+
+
+ExportHTML = processor_class("ExportHTML")
+ExportRepository = processor_class("ExportRepository", ("ExportHTML",))
+WriteList = processor_class("WriteList", relevant_changes=frozenset([ChangeType.NEW_PDF]))
+
+
+class TestPostProcessingScheduler(unittest.TestCase):
+    def setUp(self):
+        self.language_data = {lang: LanguageInfo(lang, lang) for lang in ["en", "de", "ru", "fr"]}
+        self.changes = {lang: ChangeLog() for lang in self.language_data}
+        self.record = []
+
+    def test_serial(self):
+        scheduler = PostProcessingScheduler()
+        scheduler.add(ExportRepository(self.record))    # must run after ExportHTML nevertheless
+        scheduler.add(ExportHTML(self.record))
+        scheduler.run(self.language_data, self.changes)
+        self.assertListEqual(self.record, [(name, lang) for lang in self.language_data
+                                           for name in ["ExportHTML", "ExportRepository"]])
+        self.assertDictEqual(scheduler.failures, {})
+        self.assertListEqual(sorted(scheduler.timings), ["ExportHTML", "ExportRepository"])
+
+    def test_parallel(self):
+        scheduler = PostProcessingScheduler(workers=4)
+        export_html = ExportHTML(self.record, duration=0.05)
+        scheduler.add(export_html)
+        scheduler.add(ExportRepository(self.record))
+        scheduler.add(processor_class("ConsistencyCheck")(self.record))
+        scheduler.run(self.language_data, self.changes)
+        self.assertGreater(export_html.max_running, 1)
+        self.assertEqual(len(self.record), 12)
+        for lang in self.language_data:     # Dependency must be respected for each language
+            self.assertLess(self.record.index(("ExportHTML", lang)), self.record.index(("ExportRepository", lang)))
+        self.assertGreaterEqual(scheduler.timings["ExportHTML"], 0.2)
+
+    def test_relevant_changes(self):
+        self.changes["de"].add_change("Prayer", ChangeType.NEW_PDF)
+        scheduler = PostProcessingScheduler()
+        scheduler.add(WriteList(self.record))
+        scheduler.add(RecordingGlobalProcessor(self.record))
+        # Only pages of post-processors that are going to run need to be preloaded
+        self.assertListEqual(scheduler.pages_to_preload(self.language_data, self.changes), ["WriteList/de"])
+        scheduler.run(self.language_data, self.changes)
+        self.assertListEqual(self.record, [("WriteList", "de")])
+        self.assertDictEqual(scheduler.skipped, {"WriteList": 3, "RecordingGlobalProcessor": 1})
+
+        self.record.clear()
+        self.changes["ru"].add_change("Prayer", ChangeType.NEW_WORKSHEET)
+        scheduler = PostProcessingScheduler(workers=2)
+        scheduler.add(RecordingGlobalProcessor(self.record))
+        scheduler.add(WriteList(self.record))
+        scheduler.run(self.language_data, self.changes)
+        self.assertListEqual(self.record, [("WriteList", "de"), ("RecordingGlobalProcessor", "")])
+
+    def test_failures(self):
+        for workers in [1, 2]:
+            self.record.clear()
+            scheduler = PostProcessingScheduler(workers=workers)
+            scheduler.add(ExportHTML(self.record, fail_for=["de"]))
+            scheduler.add(ExportRepository(self.record))
+            scheduler.add(processor_class("WriteReport")(self.record))
+            with self.assertLogs("pywikitools.resourcesbot.scheduler", level="WARNING"):
+                scheduler.run(self.language_data, self.changes)
+            self.assertDictEqual(scheduler.failures, {"de": ["ExportHTML", "ExportRepository"]})
+            self.assertNotIn(("ExportRepository", "de"), self.record)
+            self.assertIn(("WriteReport", "de"), self.record)
+            self.assertIn(("ExportRepository", "ru"), self.record)
+
+    def test_invalid_dependencies(self):
+        scheduler = PostProcessingScheduler()
+        scheduler.add(ExportHTML(self.record))
+        with self.assertRaises(ValueError):
+            scheduler.add(ExportHTML(self.record))
+        scheduler.add(processor_class("Unknown", ("Something",))(self.record))
+        with self.assertRaises(ValueError):
+            scheduler.run(self.language_data, self.changes)
+
+        scheduler = PostProcessingScheduler()
+        scheduler.add(processor_class("First", ("Second",))(self.record))
+        scheduler.add(processor_class("Second", ("First",))(self.record))
+        with self.assertRaises(ValueError):
+            scheduler.run(self.language_data, self.changes)
+
+
+if __name__ == '__main__':
+    unittest.main()
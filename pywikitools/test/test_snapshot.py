@@ -0,0 +1,62 @@
+"""
+Test the local snapshot of ResourcesBot results
+
+Run tests:
+    python3 -m unittest test_snapshot.py
+"""
+from configparser import ConfigParser
+from os.path import abspath, dirname, join
+import tempfile
+import unittest
+
+from pywikitools.resourcesbot.data_structures import language_info_from_json, language_info_to_json
+from pywikitools.resourcesbot.snapshot import Snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = join(self.temp_dir.name, "snapshot.sqlite")
+        self.result = {}
+        for lang in ["en", "ru"]:
+            with open(join(dirname(abspath(__file__)), "data", f"{lang}.json"), 'r') as f:
+                self.result[lang] = language_info_from_json(f.read())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_save_and_load(self):
+        snapshot = Snapshot(self.path)
+        with self.assertRaises(RuntimeError):
+            snapshot.load()     # empty
+        snapshot.save(self.result)
+        snapshot.close()
+
+        snapshot = Snapshot(self.path)
+        loaded = snapshot.load()
+        self.assertListEqual(list(loaded), ["en", "ru"])
+        for lang, language_info in self.result.items():
+            self.assertEqual(language_info_to_json(loaded[lang]), language_info_to_json(language_info))
+        self.assertListEqual(list(snapshot.load(["ru", "en"])), ["ru", "en"])
+        with self.assertRaises(RuntimeError):
+            snapshot.load(["de"])
+
+        # Saving only some languages keeps the others; saving everything removes what's not included anymore
+        snapshot.save({"ru": self.result["ru"]}, complete=False)
+        self.assertListEqual(list(snapshot.load()), ["en", "ru"])
+        snapshot.save({"en": self.result["en"]})
+        self.assertListEqual(list(snapshot.load()), ["en"])
+        snapshot.close()
+
+    def test_from_config(self):
+        config = ConfigParser()
+        config.read_dict({"Paths": {"temp": self.temp_dir.name}})
+        snapshot = Snapshot.from_config(config)
+        self.assertEqual(snapshot.path, self.path)
+        snapshot.close()
+        config.read_dict({"resourcesbot": {"snapshot": ""}})
+        self.assertIsNone(Snapshot.from_config(config))
+
+
+if __name__ == '__main__':
+    unittest.main()
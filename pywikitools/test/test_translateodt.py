@@ -146,6 +146,25 @@ class TestTranslateODT(unittest.TestCase):
                                                        ["same<br/>same", "same<br/>same"])
         self.assertIn("reciprocal", cm.output[0])
 
+    def test_template_units(self):
+        self.translate_odt.fortraininglib = Mock()
+        self.translate_odt.fortraininglib.list_templates.return_value = {
+            "Bible_Reading_Hints": ["Template:BibleReadingHints", "Template:Version"],
+            "Bible_Reading_Hints_(Seven_Stories_full_of_Hope)": ["Template:BibleReadingHints"]}
+        self.translate_odt.fortraininglib.get_latest_revisions.return_value = {"Template:BibleReadingHints": 42}
+        self.translate_odt.fortraininglib.get_translation_units.return_value = TranslatedPage(
+            "Template:BibleReadingHints", "de", [TranslationUnit("Template:BibleReadingHints/1", "de",
+                                                                 "[[Prayer]]", "[[Prayer/de|Gebet]]")])
+        self.translate_odt.prefetch_templates(["Bible_Reading_Hints",
+                                               "Bible_Reading_Hints_(Seven_Stories_full_of_Hope)"])
+        self.translate_odt.fortraininglib.get_latest_revisions.assert_called_once_with(["Template:BibleReadingHints"])
+
+        template_page = self.translate_odt._get_template_units("Template:BibleReadingHints", "de")
+        template_page.units[0].remove_links()     # Modifying our copy must not change the cached units
+        template_page = self.translate_odt._get_template_units("Template:BibleReadingHints", "de")
+        self.assertEqual(template_page.units[0].get_definition(), "[[Prayer]]")
+        self.translate_odt.fortraininglib.get_translation_units.assert_called_once()
+
     def test_read_worksheet_config(self):
         # TranslateOdtConfig should be empty if there is no config in the mediawiki system
         self.translate_odt.fortraininglib = Mock()
@@ -0,0 +1,83 @@
+"""
+Test parsing the source of English worksheets and sharing it within ForTrainingLib
+
+Run tests:
+    python3 -m unittest test_worksheet_source.py
+"""
+import unittest
+from unittest.mock import patch
+
+from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.test.test_resourcesbot import HEARING_FROM_GOD
+from pywikitools.worksheet_source import WorksheetSource
+
+PRAYER = """{{PdfDownload|<translate><!--T:4--> Prayer.pdf</translate>}}
+{{PrintPdfDownload|<translate><!--T:5--> Prayer_print.pdf</translate>}}
+<translate>
+== Introduction == <!--T:7-->
+Prayer is talking with God.
+
+<!--T:8-->
+God answers.
+</translate>
+{{Version|<translate><!--T:6--> 1.3</translate>}}
+{{OdtDownload|Prayer.odt}}
+"""
+
+
+class TestWorksheetSource(unittest.TestCase):
+    def test_parse(self):
+        source = WorksheetSource("Prayer", PRAYER, 42)
+        self.assertEqual(source.version, "1.3")
+        self.assertEqual(source.version_unit, 6)
+        self.assertEqual(source.get_download("pdf"), ("Prayer.pdf", 4))
+        self.assertEqual(source.get_download("printPdf"), ("Prayer_print.pdf", 5))
+        self.assertEqual(source.get_download("odt"), ("Prayer.odt", None))
+        self.assertIsNone(source.get_download("odg"))
+        self.assertEqual(source.get_unit(7), "== Introduction ==")
+        self.assertEqual(source.get_unit(8), "God answers.")
+        self.assertIsNone(source.get_unit(9))
+        self.assertEqual(source.revision_id, 42)
+
+        source = WorksheetSource("Hearing_from_God", HEARING_FROM_GOD)
+        self.assertEqual(source.get_download("odt"), ("Hearing_from_God.odt", 53))
+        self.assertEqual((source.version, source.version_unit), ("1.2", 55))
+
+        source = WorksheetSource("Languages", "Some mediawiki content...")
+        self.assertIsNone(source.version)
+        self.assertDictEqual(source.downloads, {})
+
+    @patch("pywikitools.fortraininglib.ForTrainingLib._get")
+    def test_fortraininglib(self, mock_get):
+        def api(params):
+            if params["titles"] == "Prayer":
+                return {"query": {"pages": {"1": {"revisions": [
+                    {"revid": 42, "slots": {"main": {"contentmodel": "wikitext", "*": PRAYER}}}]}}}}
+            if params["titles"] == "Translations:Prayer/4/de":
+                return {"query": {"pages": {"2": {"revisions": [
+                    {"slots": {"main": {"contentmodel": "wikitext", "*": "Gebet.pdf"}}}]}}}}
+            return {"query": {"pages": {"-1": {"missing": ""}}}}
+        mock_get.side_effect = api
+        lib = ForTrainingLib("https://www.4training.net")
+        self.assertEqual(lib.get_version("Prayer", "en"), "1.3")
+        self.assertEqual(lib.get_pdf_name("Prayer", "en"), "Prayer.pdf")
+        self.assertEqual(lib.get_pdf_name("Prayer", "de"), "Gebet.pdf")
+        self.assertIs(lib.get_worksheet_source("Prayer"), lib.get_worksheet_source("Prayer", 42))
+        self.assertEqual(mock_get.call_count, 2)    # The English worksheet was requested and parsed only once
+        self.assertIsNone(lib.get_version("NotExisting", "en"))
+
+        # Sources retrieved elsewhere are used as well
+        lib.add_worksheet_source("Hearing_from_God", HEARING_FROM_GOD)
+        self.assertEqual(lib.get_version("Hearing from God", "en"), "1.2")
+        self.assertEqual(mock_get.call_count, 3)
+
+        # Only the version number is returned, even if the translation unit contains more
+        lib.add_worksheet_source("Draft", "{{Version|<translate><!--T:2--> Version 1.1b (draft)</translate>}}")
+        self.assertEqual(lib.get_version("Draft", "en"), "1.1b")
+        lib.add_worksheet_source("NoVersion", "{{Version|<translate><!--T:2--> draft</translate>}}")
+        self.assertIsNone(lib.get_version("NoVersion", "en"))
+        lib.session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
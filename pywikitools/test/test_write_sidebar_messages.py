@@ -1,7 +1,8 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, Mock, patch
 from pywikitools.fortraininglib import ForTrainingLib
 from pywikitools.resourcesbot.changes import ChangeLog, ChangeType
+from pywikitools.resourcesbot.page_writer import PageWriter
 
 from pywikitools.resourcesbot.data_structures import LanguageInfo, TranslationProgress, WorksheetInfo
 from pywikitools.resourcesbot.write_sidebar_messages import WriteSidebarMessages
@@ -45,8 +46,10 @@ class TestWriteSidebarMessages(unittest.TestCase):
         # Note: It's not MediaWiki:Sidebar-hearingfromgod/en as English is our source language
         mock_page.assert_called_with(None, "MediaWiki:Sidebar-hearingfromgod")
 
+    @patch("pywikibot.Page")
     @patch("pywikitools.resourcesbot.write_sidebar_messages.WriteSidebarMessages.save_worksheet_title")
-    def test_run(self, mock_save):
+    def test_run(self, mock_save, mock_page):
+        self.write_sidebar_messages = WriteSidebarMessages(ForTrainingLib("https://www.4training.net"), MagicMock())
         # save_worksheet_title() shouldn't get called when there are no changes
         self.write_sidebar_messages.run(self.language_info, None, ChangeLog())
         mock_save.assert_not_called()
@@ -64,10 +67,48 @@ class TestWriteSidebarMessages(unittest.TestCase):
         mock_save.assert_called_once()
 
         # save_worksheet_title() should be called when we have force_rewrite (even if there are no changes)
-        write_sidebar_messages = WriteSidebarMessages(None, None, force_rewrite=True)
+        write_sidebar_messages = WriteSidebarMessages(ForTrainingLib("https://www.4training.net"), MagicMock(),
+                                                      force_rewrite=True)
         write_sidebar_messages.run(self.language_info, None, ChangeLog())
         self.assertEqual(mock_save.call_count, 2)
 
+    @patch("pywikibot.Page")
+    def test_run_preloaded(self, mock_page):
+        messages = {"MediaWiki:Sidebar-hearingfromgod/de": "Gottes Reden wahrnehmen",
+                    "MediaWiki:Sidebar-prayer/de": "Gebet (alt)"}
+
+        def page_loader(site, title: str):
+            page = Mock()
+            page.exists.return_value = title in messages
+            page.text = messages.get(title, "")
+            return page
+        mock_page.side_effect = page_loader
+        site = Mock()
+        site.preloadpages.side_effect = lambda pages, groupsize: iter(pages)
+        for page, title in [("Prayer", "Gebet"), ("Church", "Gemeinde")]:
+            self.language_info.add_worksheet_info(page, WorksheetInfo(page, "de", title,
+                                                                      TranslationProgress(**TEST_PROGRESS), "1.0"))
+        page_writer = PageWriter(site)
+        write_sidebar_messages = WriteSidebarMessages(ForTrainingLib("https://www.4training.net"), site,
+                                                      force_rewrite=True, page_writer=page_writer, dry_run=True)
+        self.assertEqual(len(write_sidebar_messages.pages_to_preload(self.language_info, ChangeLog())), 3)
+
+        # Dry run: all messages are loaded with one request, nothing is saved
+        write_sidebar_messages.run(self.language_info, None, ChangeLog())
+        site.preloadpages.assert_called_once()
+        self.assertDictEqual(write_sidebar_messages.dry_run_report, {
+            "MediaWiki:Sidebar-prayer/de": ("Gebet (alt)", "Gebet"),
+            "MediaWiki:Sidebar-church/de": (None, "Gemeinde")})
+        self.assertIn("2 system messages would change", write_sidebar_messages.format_dry_run_report())
+        self.assertEqual(page_writer.stats["saved"], 0)
+
+        # Only the changed messages are saved
+        write_sidebar_messages = WriteSidebarMessages(ForTrainingLib("https://www.4training.net"), site,
+                                                      force_rewrite=True, page_writer=page_writer)
+        write_sidebar_messages.run(self.language_info, None, ChangeLog())
+        site.preloadpages.assert_called_once()      # already preloaded
+        self.assertDictEqual(page_writer.stats, {"preloaded": 3, "loaded": 0, "saved": 2, "unchanged": 1})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -91,5 +91,7 @@ if __name__ == "__main__":
     fortraininglib = ForTrainingLib("https://www.4training.net")
     translate_odt = DummyTranslateODT()
 #    translate_odt = TranslateODT(keep_english_file=False)    # uncomment this to invoke LibreOffice for each worksheet
-    for worksheet in fortraininglib.get_worksheet_list():
+    worksheets = fortraininglib.get_worksheet_list()
+    translate_odt.prefetch_templates(worksheets)    # Each template gets requested only once
+    for worksheet in worksheets:
         translate_odt.translate_worksheet(worksheet, args.language_code)
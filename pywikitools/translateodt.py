@@ -21,14 +21,17 @@ Command line options:
     --keep-english-file: don't delete the downloaded English ODT file after we're finished
 """
 import argparse
+import copy
 import sys
 import logging
 import os.path
 import re
 from configparser import ConfigParser
-from typing import Dict, Final, List, Optional, Set
+from typing import Dict, Final, List, Optional, Set, Tuple
 import requests
+from pywikitools.apicache import ApiCache
 from pywikitools.fortraininglib import ForTrainingLib
+from pywikitools.retrypolicy import RetryPolicy
 from pywikitools.correctbot.correctors.universal import UniversalCorrector
 from pywikitools.lang.native_numerals import native_to_standard_numeral
 from pywikitools.lang.translated_page import TranslatedPage, TranslationUnit
@@ -89,11 +92,18 @@ class TranslateODT:
         if not self.config.has_option('mediawiki', 'baseurl') or not self.config.has_option('mediawiki', 'scriptpath'):
             raise RuntimeError("Missing settings for mediawiki connection in config.ini")
         self.fortraininglib: ForTrainingLib = ForTrainingLib(self.config.get('mediawiki', 'baseurl'),
-                                                             self.config.get('mediawiki', 'scriptpath'))
+                                                             self.config.get('mediawiki', 'scriptpath'),
+                                                             ApiCache.from_config(self.config),
+                                                             RetryPolicy.from_config(self.config))
 
         self._loffice = LibreOffice(self.config.getboolean('translateodt', 'headless'))
         self._original_page_count: int = 0          # How many pages did the currently opened file have originally?
         self._did_page_count_change: bool = False   # Did the page count of the currently opened file change?
+        # Templates transcluded by worksheets and latest revisions of templates (see prefetch_templates())
+        self._page_templates: Dict[str, List[str]] = {}
+        self._template_revisions: Dict[str, Optional[int]] = {}
+        # Translation units of templates: (template, language code, revision) -> TranslatedPage (None on error)
+        self._template_units: Dict[Tuple[str, str, Optional[int]], Optional[TranslatedPage]] = {}
 
     def _is_search_and_replace_necessary(self, orig: str, trans: str) -> bool:
         """
@@ -181,12 +191,12 @@ class TranslateODT:
         if os.path.isfile(odt_path):
             self.logger.warning(f"File {odt_path} already exists locally, not downloading.")
         else:
-            url = self.fortraininglib.get_file_url(odt_file)
-            if url is None:
+            file_info = self.fortraininglib.get_file_infos([odt_file])[odt_file]
+            if file_info is None:
                 self.logger.error(f"Could not get URL of file {odt_file}")
                 return ""
 
-            odt_doc = requests.get(url, allow_redirects=True)
+            odt_doc = requests.get(file_info["url"], allow_redirects=True)
             with open(odt_path, 'wb') as fh:
                 fh.write(odt_doc.content)
             self.logger.info(f"Successfully downloaded and saved {odt_path}")
@@ -335,6 +345,33 @@ class TranslateODT:
         self._original_page_count = self._loffice.get_page_count()
         self._search_and_replace(self._cleanup_units(translated_page, config))
 
+    def prefetch_templates(self, worksheets: List[str]) -> None:
+        """
+        For batch runs over many worksheets: Find out with a few requests which templates the worksheets
+        transclude and what the latest revisions of these templates are.
+        translate_worksheet() then doesn't need to request the list of templates for each worksheet,
+        and the translation units of each template are requested only once per language and revision.
+        """
+        self._page_templates.update(self.fortraininglib.list_templates(worksheets))
+        templates: Set[str] = {template for page_templates in self._page_templates.values()
+                               for template in page_templates} - set(IGNORE_TEMPLATES)
+        self._template_revisions.update(self.fortraininglib.get_latest_revisions(sorted(templates)))
+
+    def _get_template_units(self, template: str, language_code: str) -> Optional[TranslatedPage]:
+        """
+        Get the translation units of a template (only requested once per language and revision of the template)
+        @return a copy that can be modified (None in case of an error)
+        """
+        key: Tuple[str, str, Optional[int]] = (template, language_code, self._template_revisions.get(template))
+        if key not in self._template_units:
+            self._template_units[key] = self.fortraininglib.get_translation_units(template, language_code)
+        template_page: Optional[TranslatedPage] = self._template_units[key]
+        if template_page is None:
+            return None
+        # _cleanup_units() modifies the translation units, so never hand out the cached ones
+        return TranslatedPage(template_page.page, template_page.language_code,
+                              [copy.copy(unit) for unit in template_page.units])
+
     def translate_worksheet(self, worksheet: str, language_code: str) -> Optional[str]:
         """Create translated worksheet: Fetch information, download original ODT, process it, save translated ODT
         @param worksheet name of the worksheet (e.g. "Forgiving_Step_by_Step")
@@ -351,9 +388,12 @@ class TranslateODT:
             return None
 
         # Check for templates we need to read as well
-        templates = set(self.fortraininglib.list_page_templates(worksheet)) - set(IGNORE_TEMPLATES)
+        page_templates: Optional[List[str]] = self._page_templates.get(worksheet)
+        if page_templates is None:
+            page_templates = self.fortraininglib.list_page_templates(worksheet)
+        templates = set(page_templates) - set(IGNORE_TEMPLATES)
         for template in templates:
-            template_page: Optional[TranslatedPage] = self.fortraininglib.get_translation_units(template, language_code)
+            template_page: Optional[TranslatedPage] = self._get_template_units(template, language_code)
             if template_page is None:
                 self.logger.warning(f"Couldn't get translations of {template}, ignoring this template.")
             else:
@@ -0,0 +1,91 @@
+"""
+Parsed source (wikitext) of an English worksheet
+
+Several places need details from the source of an English worksheet: its version, the names of the
+downloadable files and the numbers of the translation units they're stored in.
+Instead of running a regular expression over the whole source for each of these details,
+WorksheetSource scans the source once and indexes
+- the version template: {{Version|<translate><!--T:6--> 1.1</translate>}}
+- all download templates: {{PdfDownload|<translate><!--T:4--> Prayer.pdf</translate>}}
+- the content of all translation units (everything after a <!--T:n--> marker up to the next marker;
+  for headings the heading in front of the marker)
+
+ForTrainingLib.get_worksheet_source() fetches and parses each source only once (see there).
+"""
+import re
+from typing import Dict, Final, Optional, Tuple
+
+
+class WorksheetSource:
+    """
+    Usage:
+        source = WorksheetSource("Prayer", content)
+        source.version              # "1.3"
+        source.get_download("pdf")  # ("Prayer.pdf", 4): file name and number of its translation unit
+    """
+    __slots__ = ["page", "content", "revision_id", "version", "version_unit", "downloads", "units"]
+
+    # {{Version|...}}, {{PdfDownload|...}}, {{PrintPdfDownload|...}} etc.
+    TEMPLATE_PATTERN: Final[re.Pattern] = re.compile(r"\{\{(Version|[A-Z]\w*Download)\|([^}]*)\}\}")
+    UNIT_PATTERN: Final[re.Pattern] = re.compile(r"<!--T:(\d+)-->")
+    # Headings get their own translation unit with the marker behind them: "== Introduction == <!--T:7-->"
+    HEADING_PATTERN: Final[re.Pattern] = re.compile(r"(=+[^=].*=+)\s*")
+    # Everything after a unit marker belongs to the unit until the next marker or the end of the <translate> section
+    UNIT_END_PATTERN: Final[re.Pattern] = re.compile(r"<!--T:\d+-->|</translate>")
+
+    def __init__(self, page: str, content: str, revision_id: Optional[int] = None):
+        """
+        @param page: name of the worksheet
+        @param content: source (wikitext) of the English worksheet
+        @param revision_id: revision of the source (None if unknown)
+        """
+        self.page: Final[str] = page
+        self.content: Final[str] = content
+        self.revision_id: Final[Optional[int]] = revision_id
+        self.version: Optional[str] = None
+        self.version_unit: Optional[int] = None
+        # file type (e.g. "pdf", "odt", "printPdf") -> (file name, number of translation unit or None)
+        self.downloads: Dict[str, Tuple[str, Optional[int]]] = {}
+        # number of translation unit -> its content
+        self.units: Dict[int, str] = {}
+
+        for match in self.UNIT_PATTERN.finditer(content):
+            heading = self.HEADING_PATTERN.fullmatch(content[content.rfind("\n", 0, match.start()) + 1:match.start()])
+            if heading:
+                self.units[int(match.group(1))] = heading.group(1)
+                continue
+            end = self.UNIT_END_PATTERN.search(content, match.end())
+            self.units[int(match.group(1))] = content[match.end():end.start() if end else len(content)].strip()
+
+        for match in self.TEMPLATE_PATTERN.finditer(content):
+            value, unit = self._parse_parameter(match.group(2))
+            if value == "":
+                continue
+            if match.group(1) == "Version":
+                if self.version is None:
+                    self.version, self.version_unit = value, unit
+            else:
+                file_type: str = match.group(1)[0].lower() + match.group(1)[1:-len("Download")]
+                self.downloads.setdefault(file_type, (value, unit))
+
+    def _parse_parameter(self, parameter: str) -> Tuple[str, Optional[int]]:
+        """
+        Extract value and translation unit of a template parameter
+        Example: "<translate><!--T:4--> Prayer.pdf</translate>" -> ("Prayer.pdf", 4)
+        """
+        unit_marker = self.UNIT_PATTERN.search(parameter)
+        if unit_marker is None:
+            return (re.sub(r"</?translate>", "", parameter).strip(), None)
+        unit = int(unit_marker.group(1))
+        return (self.units.get(unit, ""), unit)
+
+    def get_download(self, file_type: str) -> Optional[Tuple[str, Optional[int]]]:
+        """
+        @param file_type: e.g. "pdf" or "odt" (see ForTrainingLib.get_file_types())
+        @return Tuple of file name and number of the translation unit where it is stored; None if not found
+        """
+        return self.downloads.get(file_type)
+
+    def get_unit(self, identifier: int) -> Optional[str]:
+        """@return content of the translation unit with the given number; None if the source doesn't have it"""
+        return self.units.get(identifier)
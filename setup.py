@@ -38,6 +38,10 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        # AsyncForTrainingLib (asyncfortraininglib.py)
+        'async': ['aiohttp>=3.8.1'],
+    },
     license="GNU General Public License v3",
     long_description=readme + '\n\n' + history,
     include_package_data=True,